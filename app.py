@@ -1,21 +1,32 @@
 # -*- coding: utf-8 -*-
+import time
+
+_SCRIPT_STARTED = time.perf_counter()
+
 import os
 import gc
-import asyncio
-import tempfile
+import json
+import logging
 from pathlib import Path
-import time
 import hashlib
+import uuid
 
 import streamlit as st
 from PIL import Image
 import base64
-
-import edge_tts
-from edge_tts import VoicesManager
-
-from text_processor import TextProcessor
-from textproc.chunking import split_into_sentences
+import psutil
+
+from textproc.delivery import DOWNLOAD_BASE_URL, DOWNLOAD_PORT, file_url, serve_files
+from textproc.jobs import ACTIVE, JobQueue
+from textproc.m4b import ffmpeg_available
+from textproc.mp3 import remove_output
+from textproc.storage import data_dir
+from textproc.voices import DEFAULT_VOICE, load_voices
+from textproc.worker import ensure_workers, save_upload
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s"
+)
 
 # --- App identity & theme -----------------------------------------------------
 APP_NAME = "BilBot Baggins"
@@ -225,231 +236,156 @@ def _inject_css():
 _inject_css()
 
 # --- Voices --------------------------------------------------------------------
-DEFAULT_VOICE = "en-US-AndrewNeural"
+# Read from the local voice catalogue (a built-in list until the first download
+# lands); a stale or missing catalogue is refreshed in the background, so a
+# cold start never waits on the network.
+_voices_started = time.perf_counter()
+VOICES, VOICES_SOURCE = load_voices()
+_voices_ms = (time.perf_counter() - _voices_started) * 1000
 
+# --- Cold start ------------------------------------------------------------------
+# Warn when the first page of a fresh server process takes longer than this
+COLD_START_BUDGET_S = float(os.environ.get("BILBOT_COLD_START_BUDGET", 3.0))
 
-@st.cache_resource(show_spinner="Loading voices...")
-def load_english_neural_voices():
-    try:
-        voices_mgr = asyncio.run(VoicesManager.create())
-        en_voices = voices_mgr.find(Language="en")
-        names = sorted(
-            {v["ShortName"] for v in en_voices if "Neural" in v["ShortName"]}
-        )
-        if DEFAULT_VOICE in names:
-            names.remove(DEFAULT_VOICE)
-            names.insert(0, DEFAULT_VOICE)
-        return names
-    except Exception:
-        # Fallback to static list for reliability
-        return [
-            "en-US-AndrewNeural",
-            "en-US-JennyNeural",
-            "en-US-GuyNeural",
-            "en-US-AriaNeural",
-            "en-US-DavisNeural",
-            "en-US-EmmaNeural",
-            "en-US-JacobNeural",
-            "en-US-JasonNeural",
-            "en-US-MichelleNeural",
-            "en-US-NancyNeural",
-            "en-US-TonyNeural",
-        ]
-
-
-VOICES = load_english_neural_voices()
 
-# --- Helper Functions --------------------------------------------------------
-SAFE_MAX = 1800  # conservative per-call limit for edge-tts
+@st.cache_resource
+def _cold_start() -> dict:
+    """Filled in once per server process, by its first script run."""
+    return {}
 
 
-def pick_chunk_size(text: str) -> int:
+def record_cold_start() -> None:
     """
-    Determine optimal chunk size based on text characteristics.
+    Log how long the first page of this process took, and append it to
+    startup.jsonl in the telemetry data directory to track the budget.
     """
-    try:
-        sents = split_into_sentences(text)
-        if not sents:
-            return 2800
-
-        avg_sent_len = sum(len(s) for s in sents) / len(sents)
-        max_sent_len = max(len(s) for s in sents)
-
-        # Adjust based on sentence characteristics
-        if max_sent_len > 3200:
-            return 2400  # Very long sentences, use smaller chunks
-        elif avg_sent_len > 300:
-            return 2600  # Long average sentences
-        elif avg_sent_len < 120:
-            return 3200  # Short sentences, can use larger chunks
-        else:
-            return 2800  # Default
-
-    except Exception:
-        return 2800
-
-
-def coalesce_chunks(chunks, target=3300, hard_cap=3800):
-    """
-    Greedily merge adjacent chunks up to target size without exceeding hard_cap.
-    """
-    if not chunks:
-        return []
-
-    merged = []
-    current = []
-    current_size = 0
-
-    for chunk in chunks:
-        chunk_len = len(chunk)
-
-        if not current:
-            current = [chunk]
-            current_size = chunk_len
-        elif current_size + chunk_len + 2 <= hard_cap:  # +2 for "\n\n"
-            # Can add this chunk
-            current.append(chunk)
-            current_size += chunk_len + 2
-        else:
-            # Start new merged chunk
-            merged.append("\n\n".join(current))
-            current = [chunk]
-            current_size = chunk_len
-
-    if current:
-        merged.append("\n\n".join(current))
-
-    return merged
-
-
-def signed(val: int) -> str:
-    return f"+{val}" if val >= 0 else str(val)
-
-
-def sanitize_for_tts(text: str) -> str:
-    """Light sanitization for TTS."""
-    return text.replace("&", " and ").replace("<", "").replace(">", "")
-
-
-# ============================================================================
-# OPTIMIZED AUDIO GENERATION
-# ============================================================================
-
-
-async def synthesize_mp3_async(
-    text: str, voice: str, out_path: str, rate_pct: int, pitch_hz: int
-):
-    """Async synthesis."""
-    communicate = edge_tts.Communicate(
-        text=text,
-        voice=voice,
-        rate=f"{signed(rate_pct)}%",
-        pitch=f"{signed(pitch_hz)}Hz",
+    record = _cold_start()
+    if record:
+        return
+    record.update(
+        {
+            "at": time.time(),
+            # Interpreter and Streamlit startup plus this script's first run
+            "process_s": round(time.time() - psutil.Process().create_time(), 3),
+            "script_s": round(time.perf_counter() - _SCRIPT_STARTED, 3),
+            "voices_ms": round(_voices_ms, 1),
+            "voices_source": VOICES_SOURCE,
+        }
     )
-    await communicate.save(out_path)
-
-
-def synthesize_with_retry(
-    text: str,
-    voice: str,
-    out_path: str,
-    rate_pct: int,
-    pitch_hz: int,
-    tries: int = 3,
-    delay: float = 0.8,
-) -> bool:
-    """Enhanced retry."""
-    for attempt in range(1, tries + 1):
-        try:
-            asyncio.run(synthesize_mp3_async(text, voice, out_path, rate_pct, pitch_hz))
-            return True
-        except Exception:
-            if attempt < tries:
-                time.sleep(delay * attempt)
-    return False
-
-
-# ============================================================================
-# CACHING FOR FILE PROCESSING
-# ============================================================================
+    logger = logging.getLogger("app")
+    logger.info(
+        "Cold start: %.2fs since process start, script %.2fs (voices %.1fms from %s)",
+        record["process_s"],
+        record["script_s"],
+        record["voices_ms"],
+        record["voices_source"],
+    )
+    if record["script_s"] > COLD_START_BUDGET_S:
+        logger.warning(
+            "Cold start over budget: script took %.2fs (budget %.2fs)",
+            record["script_s"],
+            COLD_START_BUDGET_S,
+        )
+    try:
+        with open(data_dir("telemetry") / "startup.jsonl", "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError:
+        pass
 
+# --- Helper Functions --------------------------------------------------------
+# Extraction, cleaning and synthesis run in background worker processes fed
+# from a persistent queue; this script only submits jobs and polls them, so a
+# rerun or a dropped connection never loses a book in progress.
+POLL_SECONDS = 0.5
+
+
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    return JobQueue()
+
+
+def make_file_id(uploaded) -> str:
+    """Create stable cache key (from a view of the upload, not a copy)."""
+    with uploaded.getbuffer() as view:
+        h = hashlib.md5(view[:1_000_000]).hexdigest()
+    return f"{uploaded.name}:{uploaded.size}:{h}"
+
+
+# Finished audio is streamed from disk by a small file server rather than
+# handed to Streamlit, which would hold every file it shows in memory.
+@st.cache_resource
+def get_file_server():
+    return serve_files()
+
+
+def download_base_url():
+    """Where the browser reaches the file server, or None to fall back."""
+    server = get_file_server()
+    if DOWNLOAD_BASE_URL:
+        return DOWNLOAD_BASE_URL
+    context = getattr(st, "context", None)  # Streamlit 1.37+
+    host = context.headers.get("Host") if context is not None else None
+    if server is None or not host:
+        return None
+    return f"http://{host.rsplit(':', 1)[0]}:{DOWNLOAD_PORT}"
+
+
+def offer_download(area, label: str, path: str, file_name: str, mime: str, key: str):
+    """Link to a finished file; without the file server, read it only on request."""
+    base_url = download_base_url()
+    if base_url:
+        area.link_button(label, file_url(path, file_name, base_url))
+    elif area.button(label, key=f"{key}_prepare"):
+        with open(path, "rb") as f:
+            area.download_button(
+                f"💾 Save {file_name}", data=f, file_name=file_name, mime=mime, key=key
+            )
 
-@st.cache_data(max_entries=3, ttl=900)
-def process_file_unified(
-    file_bytes: bytes,
-    file_name: str,
-    remove_headers: bool,
-    remove_footnotes: bool,
-) -> dict:
-    """
-    Unified file processing that properly uses TextProcessor.
-    """
-    # Detect file type
-    ext = Path(file_name).suffix.lower()
-    is_pdf = ext == ".pdf" or file_bytes.startswith(b"%PDF-")
 
-    # Extract text
-    if is_pdf:
-        raw_text = TextProcessor.read_pdf_file(file_bytes)
-    else:
-        raw_text = TextProcessor.read_text_file(file_bytes)
-
-    if not raw_text or not raw_text.strip():
-        return {
-            "raw_text": "",
-            "cleaned_text": "",
-            "chunks": [],
-            "meta": {"error": "Could not extract text from file"},
-        }
+def play_audio(area, path: str):
+    """A player streaming from the file server (from memory as a fallback)."""
+    base_url = download_base_url()
+    source = file_url(path, base_url=base_url) if base_url else path
+    area.audio(source, format="audio/mpeg")
 
-    # Clean text using TextProcessor
-    cleaned_text = TextProcessor.clean_text(
-        text=raw_text,
-        remove_running_headers=remove_headers,
-        remove_bottom_footnotes=remove_footnotes,
-        is_pdf=is_pdf,
-    )
 
-    # Fallback if cleaning removed too much
-    if len(cleaned_text.strip()) < max(50, int(0.02 * len(raw_text))):
-        cleaned_text = raw_text
-
-    # Chunk the text
-    chunk_size = pick_chunk_size(cleaned_text)
-    chunks = TextProcessor.smart_split_into_chunks(cleaned_text, max_length=chunk_size)
-
-    # Coalesce small chunks
-    chunks = coalesce_chunks(chunks, target=3300, hard_cap=3800)
-
-    return {
-        "raw_text": raw_text,
-        "cleaned_text": cleaned_text,
-        "chunks": chunks,
-        "meta": {
-            "kind": "pdf" if is_pdf else "txt",
-            "file_name": file_name,
-            "chars_raw": len(raw_text),
-            "chars_clean": len(cleaned_text),
-            "chunk_size": chunk_size,
-            "num_chunks": len(chunks),
-        },
-    }
+def discard_outputs() -> None:
+    """Delete every audio file the current session has produced."""
+    remove_output(st.session_state.get("mp3_path"))
+    remove_output(st.session_state.get("m4b_path"))
+    for chapter in st.session_state.get("chapter_mp3s") or []:
+        remove_output(chapter["path"])
+    st.session_state.mp3_path = None
+    st.session_state.m4b_path = None
+    st.session_state.chapter_mp3s = []
+    st.session_state.render_result = None
 
 
-def make_file_id(file_bytes: bytes, file_name: str) -> str:
-    """Create stable cache key."""
-    h = hashlib.md5(file_bytes[:1_000_000]).hexdigest()
-    return f"{file_name}:{len(file_bytes)}:{h}"
+def wait_for_job(job_id: str, on_progress=None) -> dict:
+    """Poll a queued job until it finishes; returns it with its result."""
+    queue = get_job_queue()
+    while True:
+        job = queue.get(job_id)
+        if job is None or job["status"] not in ACTIVE:
+            return queue.get(job_id, with_result=True) or {"status": "failed"}
+        if on_progress:
+            on_progress(job)
+        time.sleep(POLL_SECONDS)
 
 
 # --- UI & State Initialization ------------------------------------------------
 st.session_state.setdefault("last_file_identifier", None)
 st.session_state.setdefault("last_options", None)
 st.session_state.setdefault("chunks", [])
+st.session_state.setdefault("chapters", [])
 st.session_state.setdefault("cleaned_text", "")
-st.session_state.setdefault("mp3_bytes", None)
+st.session_state.setdefault("mp3_path", None)
+st.session_state.setdefault("chapter_mp3s", [])
+st.session_state.setdefault("m4b_path", None)
 st.session_state.setdefault("mp3_filename", "")
 st.session_state.setdefault("txt_filename", "")
+# Edited re-uploads reuse the parts of versions rendered in this session only
+st.session_state.setdefault("lineage", uuid.uuid4().hex)
 
 
 # File uploader
@@ -487,9 +423,13 @@ st.markdown("""
 
 # Voice settings
 default_idx = VOICES.index(DEFAULT_VOICE) if DEFAULT_VOICE in VOICES else 0
+if st.session_state.get("voice") and st.session_state.voice not in VOICES:
+    # Picked from an older catalogue than the one loaded now; keep it
+    VOICES.append(st.session_state.voice)
 voice = st.selectbox("Voice", VOICES, index=default_idx, key="voice")
 rate_pct = st.slider("Rate (% change)", -20, 20, 0, 1, key="rate")
 pitch_hz = st.slider("Pitch (Hz change)", -20, 20, 0, 1, key="pitch")
+record_cold_start()
 
 st.write("---")
 st.markdown("##### Text Cleaning Options")
@@ -497,16 +437,21 @@ remove_headers = st.checkbox(
     "Remove running headers/page numbers", value=True, key="rm_hdr"
 )
 remove_footnotes = st.checkbox("Remove footnote markers", value=True, key="rm_foot")
+make_m4b = False
+if ffmpeg_available():
+    make_m4b = st.checkbox(
+        "Also build an M4B audiobook with chapter markers", value=False, key="m4b"
+    )
 st.write("---")
 
 # Process uploaded file
 if uploaded:
-    file_bytes = uploaded.getvalue()
     file_name = uploaded.name
 
     # Check if reprocessing needed
-    file_identifier = make_file_id(file_bytes, file_name)
-    current_options = (remove_headers, remove_footnotes)
+    file_identifier = make_file_id(uploaded)
+    # The voice picks the part size, so a new voice re-prepares too
+    current_options = (remove_headers, remove_footnotes, voice)
     needs_processing = file_identifier != st.session_state.get(
         "last_file_identifier"
     ) or current_options != st.session_state.get("last_options")
@@ -514,146 +459,269 @@ if uploaded:
     if needs_processing:
         st.session_state.last_file_identifier = file_identifier
         st.session_state.last_options = current_options
-        st.session_state.mp3_bytes = None
+        discard_outputs()
         st.session_state.mp3_filename = ""
         st.session_state.txt_filename = ""
 
         # Clear old data
-        for key in ("chunks", "cleaned_text"):
+        for key in ("chunks", "chapters", "cleaned_text"):
             if key in st.session_state:
                 del st.session_state[key]
         gc.collect()
 
-        with st.spinner("Analyzing and cleaning text..."):
-            result = process_file_unified(
-                file_bytes=file_bytes,
-                file_name=file_name,
-                remove_headers=remove_headers,
-                remove_footnotes=remove_footnotes,
-            )
+        # Identical uploads with identical options share one prepare job. The
+        # upload is spooled to disk (and hashed) in chunks; workers read the
+        # file from there, so no further copy of it is made in this process
+        uploaded.seek(0)
+        upload_path, digest = save_upload(uploaded, Path(file_name).suffix.lower())
+        ensure_workers()
+        st.session_state.prepare_job = get_job_queue().submit(
+            "prepare",
+            {
+                "path": upload_path,
+                "file_name": file_name,
+                "remove_headers": remove_headers,
+                "remove_footnotes": remove_footnotes,
+                # Picks the part size
+                "voice": voice,
+                "lineage": st.session_state.lineage,
+            },
+            key=(
+                f"{digest}:{file_name}:{remove_headers}:{remove_footnotes}:"
+                f"{voice}:{st.session_state.lineage}"
+            ),
+        )
 
-            err = result["meta"].get("error")
-            if err:
-                st.error(err)
-                st.session_state.chunks = []
-                st.session_state.cleaned_text = ""
+    # Collected until its result is stored, even across reruns that
+    # interrupted the wait below
+    prepare_job = st.session_state.get("prepare_job")
+    if prepare_job:
+        prepare_status = st.empty()
+
+        # Writing to the page on every poll hands control back to Streamlit,
+        # so a rerun or a closed tab interrupts the wait promptly
+        def _show_prepare(job: dict):
+            if job["status"] == "queued" or not job["started"]:
+                prepare_status.caption("⏳ Waiting for a worker…")
             else:
-                st.session_state.cleaned_text = result["cleaned_text"]
-                st.session_state.chunks = result["chunks"]
-
-                # Show stats
-                meta = result["meta"]
-                st.success(
-                    f"**{meta['kind'].upper()}** • "
-                    f"Raw: {meta['chars_raw']:,} chars • "
-                    f"Clean: {meta['chars_clean']:,} chars • "
-                    f"Chunks: {meta['num_chunks']}"
+                prepare_status.caption(
+                    f"🔎 Extracting and cleaning… {time.time() - job['started']:.0f}s"
+                )
+
+        with st.spinner("Analyzing and cleaning text..."):
+            job = wait_for_job(prepare_job, on_progress=_show_prepare)
+        prepare_status.empty()
+        result = job.get("result") or {}
+
+        err = job.get("error") or result.get("meta", {}).get("error")
+        if job["status"] != "done" or err:
+            st.error(err or "Could not process the file")
+            st.session_state.chunks = []
+            st.session_state.chapters = []
+            st.session_state.cleaned_text = ""
+            st.session_state.prepare_job = None
+        else:
+            st.session_state.cleaned_text = result["cleaned_text"]
+            st.session_state.chunks = result["chunks"]
+            st.session_state.chapters = result["chapters"]
+            st.session_state.doc_key = result["doc_key"]
+            st.session_state.prepare_job = None
+
+            # Show stats
+            meta = result["meta"]
+            st.success(
+                f"**{meta['kind'].upper()}** • "
+                f"Raw: {meta['chars_raw']:,} chars • "
+                f"Clean: {meta['chars_clean']:,} chars • "
+                f"Chunks: {meta['num_chunks']}"
+                + (
+                    f" • Chapters: {meta['num_chapters']}"
+                    if meta["num_chapters"] > 1
+                    else ""
+                )
+            )
+            if meta["reused_chunks"]:
+                st.info(
+                    f"♻️ {meta['reused_chunks']} of {meta['num_chunks']} parts are "
+                    "unchanged since this document was last rendered and come "
+                    "straight from the synthesis cache; only the rest is sent to "
+                    "the voice."
                 )
 
 # Generate audio button (drop-in replacement)
 if st.button(
-    "🎧 Generate Audio", key="generate", disabled=not st.session_state.get("chunks")
+    "🎧 Generate Audio",
+    key="generate",
+    disabled=not st.session_state.get("chunks")
+    or bool(st.session_state.get("render_job")),
 ):
-    chunks = st.session_state.get("chunks", [])
-    if not chunks:
+    chapters = st.session_state.get("chapters", [])
+    if not chapters:
         st.warning("No chunks available. Upload and process a file first.")
         st.stop()
+    ensure_workers()
+    st.session_state.render_job = get_job_queue().submit(
+        "render",
+        {
+            "chapters": chapters,
+            "voice": voice,
+            "rate_pct": rate_pct,
+            "pitch_hz": pitch_hz,
+            "out_base": Path(uploaded.name).stem,
+            "doc_key": st.session_state.get("doc_key"),
+            "make_m4b": make_m4b,
+        },
+    )
 
-    total = len(chunks)
-    prog = st.progress(0.0, text="Starting… 0%")
-    status = st.empty()
-    started = time.monotonic()
+render_job = st.session_state.get("render_job")
+if render_job:
+    if st.session_state.get("cancel_generation"):
+        get_job_queue().request_cancel(render_job)
 
-    try:
-        with tempfile.TemporaryDirectory() as td:
-            part_paths = []
-            skipped = []
+    prog = st.progress(0.0, text="Queued…")
+    status = st.empty()
+    # Rendering happens in a worker: leaving or rerunning the page does not
+    # stop it, and the next run simply resumes watching the same job
+    st.button("✖ Cancel", key="cancel_generation")
+    preview = st.empty()
+    view = {"next_preview": 1, "ready": set()}
+    ready_area = st.container()
+
+    def _show_progress(job: dict):
+        progress = job["progress"]
+        total = progress.get("total")
+        if job["status"] == "queued" or not total:
+            status.write("⏳ Waiting for a worker…")
+            return
+        done = progress["done"]
+        frac = done / max(1, total)
+        prog.progress(
+            frac, text=f"Completed part {done}/{total}… {int(frac * 100)}%"
+        )
+        queue = progress.get("queue") or {}
+        status.write(
+            f"🔊 Generating audio… {done}/{total} parts in "
+            f"{progress['chapters']} chapter(s) • {progress.get('elapsed', 0):.0f}s"
+            + (
+                f" • {queue['waiting']} part(s) queued for the voice service "
+                f"({queue['depth']} across all books, "
+                f"average wait {queue['wait_mean']:.1f}s)"
+                if queue.get("waiting")
+                else ""
+            )
+        )
+        # Chapters are published once, as each one completes
+        if progress["chapters"] > 1:
+            for chapter in progress.get("ready", []):
+                if chapter["index"] not in view["ready"]:
+                    view["ready"].add(chapter["index"])
+                    title = chapter["title"] or f"Chapter {chapter['index'] + 1}"
+                    ready_area.caption(f"✅ {title}")
+                    play_audio(ready_area, chapter["path"])
+        # Re-publishing restarts the player, so do it at doubling milestones
+        first = progress["preview"]
+        if first["complete"]:
+            preview.empty()
+        elif first["parts_written"] >= view["next_preview"]:
+            view["next_preview"] = first["parts_written"] * 2
+            with preview.container():
+                st.caption(
+                    f"▶️ Preview: first {first['settled']} of {first['total']} parts"
+                    f"{' of chapter 1' if progress['chapters'] > 1 else ''} "
+                    "(updates as more audio is ready)"
+                )
+                play_audio(st, first["path"])
+
+    job = wait_for_job(render_job, on_progress=_show_progress)
+    st.session_state.render_job = None
+    preview.empty()
+    status.empty()
+
+    if job["status"] == "done":
+        result = job["result"]
+        discard_outputs()
+        st.session_state.mp3_path = result["mp3_path"]
+        st.session_state.mp3_filename = result["mp3_filename"]
+        st.session_state.chapter_mp3s = result["chapter_mp3s"]
+        st.session_state.m4b_path = result["m4b_path"]
+        st.session_state.m4b_filename = result["m4b_filename"]
+        st.session_state.txt_filename = f"{Path(result['mp3_filename']).stem}.clean.txt"
+        st.session_state.render_result = result
+        prog.progress(1.0, text=f"Done in {result['elapsed']:.1f}s")
+        if result["m4b_failed"]:
+            st.warning("M4B export failed; the MP3 downloads are unaffected.")
+    elif job["status"] == "cancelled":
+        prog.empty()
+        st.info("Generation cancelled. Finished parts are kept and reused next time.")
+    else:
+        prog.progress(0.0, text="Failed")
+        st.error(f"Error: {job.get('error') or 'generation failed'}")
 
-            # precompute per-chunk progress width
-            per_chunk = 1.0 / max(1, total)
 
-            for i, chunk in enumerate(chunks, 1):
-                if not chunk.strip():
-                    continue
+# Download section
+mp3_path = st.session_state.get("mp3_path")
+if mp3_path and os.path.exists(mp3_path):
+    st.success("✅ Your audiobook is ready!")
+    result = st.session_state.get("render_result")
+    if result:
+        job_metrics = result["metrics"]
+        st.caption(
+            f"Resumed {job_metrics['resumed']} part(s) • "
+            f"Repeated parts: {job_metrics.get('deduplicated', 0)} request(s) saved • "
+            f"Synthesis cache: {job_metrics['cache_hits']} hit(s), "
+            f"{job_metrics['cache_misses']} miss(es) • "
+            f"Hedges won: {job_metrics['hedges_won']}/{job_metrics['hedges_issued']}"
+            + (
+                f" • Waited for the voice service: "
+                f"{job_metrics['scheduler']['wait_mean']:.1f}s average, "
+                f"{job_metrics['scheduler']['wait_max']:.1f}s max"
+                if job_metrics.get("scheduler")
+                else ""
+            )
+        )
+        window = job_metrics["concurrency"]
+        with st.expander(
+            f"Concurrency window: {window['window']} "
+            f"(peak {window['peak_window']}, {window['backoffs']} back-off(s))"
+        ):
+            st.line_chart(
+                {
+                    "seconds": [t for t, _ in window["history"]],
+                    "window": [w for _, w in window["history"]],
+                },
+                x="seconds",
+                y="window",
+            )
 
-                # Heartbeat BEFORE doing work on this chunk
-                start_frac = (i - 1) * per_chunk
-                prog.progress(
-                    start_frac,
-                    text=f"Preparing chunk {i}/{total}… {int(start_frac * 100)}%",
+        report = job_metrics.get("telemetry")
+        if report and report["latency_seconds"]["count"]:
+            latency = report["latency_seconds"]
+            counters = report["counters"]
+            with st.expander(
+                f"Part latency: p50 ≤ {latency['p50']}s, p95 ≤ {latency['p95']}s "
+                f"({latency['count']} request(s))"
+            ):
+                st.caption(
+                    f"{report['chars_per_second']['mean']:.0f} characters/s per request • "
+                    f"{counters['audio_bytes'] / 1e6:.1f} MB of audio • "
+                    f"{counters['retries']} retr(y/ies), {counters['failures']} failed "
+                    f"attempt(s), {counters['timeouts']} timeout(s)"
                 )
-                status.write(f"🔊 Generating audio… chunk {i}/{total}")
-
-                base_path = os.path.join(td, f"part_{i:03d}")
-
-                safe_chunk = sanitize_for_tts(chunk)
-
-                # Split if over TTS limit
-                if len(safe_chunk) > SAFE_MAX:
-                    parts = [
-                        safe_chunk[j : j + SAFE_MAX]
-                        for j in range(0, len(safe_chunk), SAFE_MAX)
-                    ]
-                else:
-                    parts = [safe_chunk]
-
-                # Progress within this chunk
-                num_parts = len(parts)
-                for j, part in enumerate(parts, 1):
-                    # inner progress: advance within the chunk
-                    inner_frac = start_frac + (j - 1) / max(1, num_parts) * per_chunk
-                    prog.progress(
-                        inner_frac,
-                        text=f"Chunk {i}/{total}, part {j}/{num_parts}… {int(inner_frac * 100)}%",
-                    )
-
-                    part_path = (
-                        f"{base_path}_{j:02d}.mp3"
-                        if num_parts > 1
-                        else f"{base_path}.mp3"
-                    )
-                    ok = synthesize_with_retry(
-                        part, voice, part_path, rate_pct, pitch_hz
-                    )
-                    if ok:
-                        part_paths.append(part_path)
-                    else:
-                        skipped.append(part)
-
-                # Mark this whole chunk as done
-                done_frac = i * per_chunk
-                prog.progress(
-                    done_frac,
-                    text=f"Completed chunk {i}/{total}… {int(done_frac * 100)}%",
+                st.table(
+                    {
+                        "latency": [f"≤ {b:g}s" for b in latency["buckets"]]
+                        + [f"> {latency['buckets'][-1]:g}s"],
+                        "requests": latency["counts"],
+                    }
+                )
+                st.download_button(
+                    "⬇️ Download telemetry (JSON)",
+                    data=json.dumps(report, indent=2).encode("utf-8"),
+                    file_name=f"{Path(result['mp3_filename']).stem}.telemetry.json",
+                    mime="application/json",
                 )
 
-            if not part_paths:
-                raise RuntimeError("All chunks failed to synthesize.")
-
-            prog.progress(1.0, text="Merging audio… 100%")
-
-            # Merge audio files
-            audio_chunks = []
-            for path in part_paths:
-                with open(path, "rb") as f:
-                    audio_chunks.append(f.read())
-                if len(audio_chunks) >= 50:
-                    audio_chunks = [b"".join(audio_chunks)]
-                    gc.collect()
-
-            final_bytes = b"".join(audio_chunks)
-            del audio_chunks
-            gc.collect()
-
-        # Save results to session
-        st.session_state.mp3_bytes = final_bytes
-        out_base = Path(uploaded.name).stem
-        st.session_state.mp3_filename = f"{out_base}.mp3"
-        st.session_state.txt_filename = f"{out_base}.clean.txt"
-
-        elapsed = time.monotonic() - started
-        prog.progress(1.0, text=f"Done in {elapsed:.1f}s")
-
+        skipped = result["skipped"]
         if skipped:
             with st.expander(f"⚠️ Skipped {len(skipped)} fragment(s)"):
                 st.write("These fragments failed after retries:")
@@ -661,27 +729,18 @@ if st.button(
                 st.download_button(
                     "⬇️ Download skipped fragments",
                     data=skipped_txt.encode("utf-8"),
-                    file_name=f"{out_base}.skipped.txt",
+                    file_name=f"{Path(result['mp3_filename']).stem}.skipped.txt",
                     mime="text/plain",
                 )
 
-    except Exception as e:
-        prog.progress(0.0, text="Failed")
-        st.error(f"Error: {str(e)}")
-        st.session_state.mp3_bytes = None
-    finally:
-        status.empty()
-
-
-# Download section
-if st.session_state.get("mp3_bytes"):
-    st.success("✅ Your audiobook is ready!")
     c1, c2 = st.columns(2)
-    c1.download_button(
+    offer_download(
+        c1,
         "⬇️ Download MP3",
-        data=st.session_state.mp3_bytes,
-        file_name=st.session_state.mp3_filename,
-        mime="audio/mpeg",
+        mp3_path,
+        st.session_state.mp3_filename,
+        "audio/mpeg",
+        key="mp3_download",
     )
     c2.download_button(
         "⬇️ Download Cleaned Text",
@@ -690,9 +749,36 @@ if st.session_state.get("mp3_bytes"):
         mime="text/plain",
     )
 
+    m4b_path = st.session_state.get("m4b_path")
+    if m4b_path and os.path.exists(m4b_path):
+        offer_download(
+            st,
+            "⬇️ Download M4B (with chapters)",
+            m4b_path,
+            st.session_state.m4b_filename,
+            "audio/mp4",
+            key="m4b_download",
+        )
+
+    chapter_mp3s = st.session_state.get("chapter_mp3s") or []
+    if chapter_mp3s:
+        with st.expander(f"📑 Chapters ({len(chapter_mp3s)})"):
+            for n, chapter in enumerate(chapter_mp3s):
+                if not os.path.exists(chapter["path"]):
+                    continue
+                offer_download(
+                    st,
+                    f"⬇️ {chapter['title'] or f'Chapter {n + 1}'}",
+                    chapter["path"],
+                    chapter["file_name"],
+                    "audio/mpeg",
+                    key=f"chapter_download_{n}",
+                )
+
     if st.button("🔄 Reset and Start Over"):
         # Clear everything except user preferences
-        keys_to_keep = {"voice", "rate", "pitch", "rm_hdr", "rm_foot"}
+        keys_to_keep = {"voice", "rate", "pitch", "rm_hdr", "rm_foot", "m4b", "lineage"}
+        discard_outputs()
         for key in list(st.session_state.keys()):
             if key not in keys_to_keep:
                 del st.session_state[key]
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Peak RSS of handing a finished audiobook to the browser, for 1h vs 10h books.
+
+"button" is what st.download_button and st.audio do with a file: read all of
+it into bytes kept by Streamlit's media store. "serve" fetches the file
+through textproc.delivery's file server in the same process, as the app now
+links to it. Each measurement runs in a fresh subprocess so ru_maxrss
+reflects only that delivery. Unix only (uses the resource module).
+
+    python benchmarks/delivery_memory.py [--hours 1 10]
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BYTES_PER_SECOND = 6000  # edge-tts default: 48 kbit/s mono MP3
+
+
+def deliver_button(path: str) -> int:
+    with open(path, "rb") as f:
+        media = {"book.mp3": f.read()}  # the media store's copy
+    return len(media["book.mp3"])
+
+
+def deliver_serve(path: str) -> int:
+    import urllib.request
+
+    from textproc.delivery import file_url, serve_files
+
+    server = serve_files(port=0, host="127.0.0.1")
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    received = 0
+    try:
+        with urllib.request.urlopen(file_url(path, "book.mp3", base_url)) as response:
+            while True:
+                block = response.read(64 * 1024)
+                if not block:
+                    break
+                received += len(block)
+    finally:
+        server.shutdown()
+    return received
+
+
+def child(mode: str, path: str):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    delivered = {"button": deliver_button, "serve": deliver_serve}[mode](path)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux
+    print(baseline, peak, delivered)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--hours", type=float, nargs="+", default=[1, 10])
+    ap.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    print(
+        f"{'output':>8} {'size MB':>8} {'mode':>7} {'sent MB':>8} "
+        f"{'peak RSS MB':>12} {'delivery delta MB':>18}"
+    )
+    for hours in args.hours:
+        with tempfile.TemporaryDirectory() as td:
+            env = dict(os.environ, BILBOT_DATA_DIR=td)
+            outputs = os.path.join(td, "outputs")
+            os.makedirs(outputs)
+            path = os.path.join(outputs, "book.mp3")
+            size = int(hours * 3600 * BYTES_PER_SECOND)
+            block = os.urandom(1024 * 1024)
+            with open(path, "wb") as f:
+                for offset in range(0, size, len(block)):
+                    f.write(block[: size - offset])
+            for mode in ("button", "serve"):
+                out = subprocess.run(
+                    [sys.executable, __file__, "--child", mode, path],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                    env=env,
+                ).stdout.split()
+                baseline, peak = int(out[0]) / 1024, int(out[1]) / 1024
+                if int(out[2]) != size:
+                    sys.exit(f"{mode} delivered {out[2]} of {size} bytes")
+                print(
+                    f"{hours:>7g}h {size / 2**20:>8.1f} {mode:>7} "
+                    f"{int(out[2]) / 2**20:>8.1f} {peak:>12.1f} {peak - baseline:>18.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Peak RSS of the MP3 merge stage for 1h vs 10h audiobooks.
+
+Compares the old in-memory b"".join merge with textproc.mp3.concat_parts.
+Each measurement runs in a fresh subprocess so ru_maxrss reflects only that
+merge. Unix only (uses the resource module).
+
+    python benchmarks/merge_memory.py [--hours 1 10]
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BYTES_PER_SECOND = 6000  # edge-tts default: 48 kbit/s mono MP3
+PART_SECONDS = 120  # ~1800 characters of speech per part
+
+# MPEG-2 Layer III, 48 kbit/s, 24 kHz, mono: 144-byte frames of 24 ms
+_FRAME_HEADER = bytes((0xFF, 0xF3, 0x64, 0xC0))
+_FRAME_BYTES = 144
+
+
+def make_part(part_bytes: int) -> bytes:
+    """Real MPEG frames (valid header, random payload) so the parser runs."""
+    payload = os.urandom(_FRAME_BYTES - len(_FRAME_HEADER)).replace(b"\xff", b"\x00")
+    return (_FRAME_HEADER + payload) * (part_bytes // _FRAME_BYTES)
+
+
+def make_parts(root: str, hours: float) -> list:
+    part_bytes = BYTES_PER_SECOND * PART_SECONDS
+    count = int(hours * 3600 / PART_SECONDS)
+    block = make_part(part_bytes)
+    paths = []
+    for i in range(count):
+        path = os.path.join(root, f"part_{i:04d}.mp3")
+        with open(path, "wb") as f:
+            f.write(block)
+        paths.append(path)
+    return paths
+
+
+def merge_join(paths, out_path):
+    """The pre-streaming merge from app.py (list of reads + b"".join)."""
+    chunks = []
+    for path in paths:
+        with open(path, "rb") as f:
+            chunks.append(f.read())
+        if len(chunks) >= 50:
+            chunks = [b"".join(chunks)]
+    final_bytes = b"".join(chunks)
+    with open(out_path, "wb") as f:
+        f.write(final_bytes)
+
+
+def merge_stream(paths, out_path):
+    from textproc.mp3 import concat_parts
+
+    concat_parts(paths, out_path)
+
+
+def child(mode: str, parts_dir: str):
+    paths = sorted(
+        os.path.join(parts_dir, name)
+        for name in os.listdir(parts_dir)
+        if name.startswith("part_")
+    )
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    out_path = os.path.join(parts_dir, f"out_{mode}.mp3")
+    {"join": merge_join, "stream": merge_stream}[mode](paths, out_path)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    written = os.path.getsize(out_path)
+    os.unlink(out_path)
+    # ru_maxrss is KiB on Linux
+    print(baseline, peak, written)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--hours", type=float, nargs="+", default=[1, 10])
+    ap.add_argument("--child", nargs=2, metavar=("MODE", "DIR"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    print(
+        f"{'output':>8} {'size MB':>8} {'mode':>7} {'written MB':>10} "
+        f"{'peak RSS MB':>12} {'merge delta MB':>15}"
+    )
+    for hours in args.hours:
+        with tempfile.TemporaryDirectory() as td:
+            paths = make_parts(td, hours)
+            size_mb = sum(os.path.getsize(p) for p in paths) / 2**20
+            for mode in ("join", "stream"):
+                out = subprocess.run(
+                    [sys.executable, __file__, "--child", mode, td],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout.split()
+                baseline, peak = int(out[0]) / 1024, int(out[1]) / 1024
+                written_mb = int(out[2]) / 2**20
+                if not int(out[2]):
+                    sys.exit(f"{mode} merge wrote nothing")
+                print(
+                    f"{hours:>7g}h {size_mb:>8.1f} {mode:>7} {written_mb:>10.1f} "
+                    f"{peak:>12.1f} {peak - baseline:>15.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
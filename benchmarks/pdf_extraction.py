@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+PDF text extraction time against the number of extraction processes.
+
+Builds a synthetic book (dense text pages with a running header and page
+number, like a typical OCR'd scan) and extracts it with each worker count,
+checking that every run returns exactly the single-process text.
+
+    python benchmarks/pdf_extraction.py --pages 200 800 --workers 1 2 4 8
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Measure extraction itself, not page cache hits (workers inherit this)
+os.environ["BILBOT_PAGE_CACHE_MB"] = "0"
+
+from textproc.extractors import PAGE_BREAK, extract_with_pymupdf  # noqa: E402
+
+_SENTENCE = (
+    "The river ran quietly past the old mill, and the miller's daughter "
+    "counted the boats as they drifted toward the town below. "
+)
+
+
+def make_pdf(pages: int) -> bytes:
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    body = _SENTENCE * 28
+    for n in range(1, pages + 1):
+        page = doc.new_page()
+        page.insert_text((72, 50), "A HISTORY OF THE VALLEY", fontsize=9)
+        page.insert_textbox(fitz.Rect(72, 72, 540, 740), body, fontsize=10)
+        page.insert_text((300, 770), str(n), fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, nargs="+", default=[200, 800])
+    ap.add_argument(
+        "--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1]
+    )
+    ap.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    args = ap.parse_args()
+
+    print(f"{os.cpu_count()} CPU(s)")
+    print(f"{'pages':>6} {'workers':>7} {'seconds':>8} {'pages/s':>8} {'speedup':>7}")
+    for pages in args.pages:
+        data = make_pdf(pages)
+        baseline = reference = None
+        for workers in sorted(set(args.workers)):
+            best = float("inf")
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                text = extract_with_pymupdf(data, workers=workers)
+                best = min(best, time.perf_counter() - started)
+            if reference is None:
+                reference, baseline = text, best
+            elif text != reference:
+                sys.exit(f"{workers} workers changed the extracted text")
+            assert text.count(PAGE_BREAK) == pages - 1
+            print(
+                f"{pages:>6} {workers:>7} {best:>8.2f} {pages / best:>8.0f} "
+                f"{baseline / best:>6.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Extraction spacing repair time: the single-pass fix_extraction_spacing
+against the previous one-regex-per-word version kept below.
+
+Builds a text of about --mb megabytes of prose in which some words are split
+after their first letter and some spaces before capitals are lost, as PDF
+extraction does, then times both versions on it. The new version is timed
+again with --extra-words more words added to its list, to show the cost does
+not grow with the list. Outputs are compared ignoring case and spaces after
+sentence ends: the old version lower-cased most of the words it rejoined,
+so it also missed the capital after "end.I t" that the new one separates.
+
+    python benchmarks/spacing_repair.py --mb 5 --extra-words 5000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from textproc import extractors  # noqa: E402
+
+_PROSE = (
+    "The river ran quietly past the old mill, and the miller's daughter "
+    "counted the boats as they drifted toward the town below. It was late "
+    "in the year, and the water had risen with the rains. She had been told "
+    "that the bridge would not hold, but her father said he was sure of it. "
+    "What they were waiting for, no one could say; if the boats came at all, "
+    "they came by night, with their lamps dark and their cargo hidden from "
+    "the customs men who watched the road. "
+)
+
+# ============================================================================
+# PREVIOUS IMPLEMENTATION
+# ============================================================================
+
+_BROKEN_WORDS = re.compile(
+    r"\b(t\s+he|w\s+as|i\s+s|a\s+re|h\s+as|h\s+ad|w\s+ith|f\s+rom|t\s+hat|t\s+his)\b",
+    re.IGNORECASE,
+)
+_WORD_BOUNDARIES = re.compile(r"([a-z])([A-Z])")
+_SENTENCE_BOUNDARIES = re.compile(r"([.!?])([A-Z])")
+_BROKEN_WORD_FIXES = [
+    (re.compile(rf"\b{word[0]}\s+{word[1:]}\b", re.IGNORECASE), word)
+    for word in (
+        "were have been what and for not but of in to at on it as by my we he "
+        "me no do if"
+    ).split()
+]
+
+
+def legacy_fix_extraction_spacing(text: str) -> str:
+    if not text:
+        return ""
+    text = _BROKEN_WORDS.sub(lambda m: m.group(0).replace(" ", ""), text)
+    for pat, replacement in _BROKEN_WORD_FIXES:
+        text = pat.sub(replacement, text)
+    text = _WORD_BOUNDARIES.sub(r"\1 \2", text)
+    text = _SENTENCE_BOUNDARIES.sub(r"\1 \2", text)
+    return text
+
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+
+def make_text(mb: float, broken: float, seed: int = 1) -> str:
+    rng = random.Random(seed)
+    words = _PROSE.split()
+    out = []
+    size = 0
+    while size < mb * 1024 * 1024:
+        for word in words:
+            r = rng.random()
+            if r < broken and len(word) > 1 and word[1].isalpha():
+                word = f"{word[0]} {word[1:]}"
+            out.append(word)
+            # Lose the space before a capital now and then
+            out.append("" if r > 0.995 and word.endswith(".") else " ")
+            size += len(word) + 1
+    return "".join(out)
+
+
+def make_words(count: int, seed: int = 2) -> list:
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return [
+        "".join(rng.choice(letters) for _ in range(rng.randint(4, 12)))
+        for _ in range(count)
+    ]
+
+
+def _comparable(text: str) -> str:
+    return re.sub(r"([.!?]) ", r"\1", text.lower())
+
+
+def best_of(fn, text: str, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(text)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=float, default=5.0, help="size of the text")
+    ap.add_argument(
+        "--broken", type=float, default=0.03, help="share of words split after a letter"
+    )
+    ap.add_argument("--extra-words", type=int, default=5000)
+    ap.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    args = ap.parse_args()
+
+    text = make_text(args.mb, args.broken)
+    mb = len(text) / (1024 * 1024)
+    old_s, old = best_of(legacy_fix_extraction_spacing, text, args.repeat)
+    new_s, new = best_of(extractors.fix_extraction_spacing, text, args.repeat)
+    base = len(extractors.spacing_words())
+    extractors.add_spacing_words(make_words(args.extra_words))
+    big_s, big = best_of(extractors.fix_extraction_spacing, text, args.repeat)
+
+    print(f"{mb:.1f} MB, {args.broken:.0%} of words split")
+    print(f"{'version':<28} {'seconds':>8} {'MB/s':>7} {'speedup':>7}")
+    for name, seconds in (
+        ("per-word regexes (old)", old_s),
+        (f"single pass, {base} words", new_s),
+        (f"single pass, {len(extractors.spacing_words())} words", big_s),
+    ):
+        print(
+            f"{name:<28} {seconds:>8.2f} {mb / seconds:>7.1f} "
+            f"{old_s / seconds:>6.1f}x"
+        )
+    print("same text as old:", _comparable(old) == _comparable(new))
+    if big != new:
+        sys.exit("the extra words changed the output")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Offline synthesis throughput against FakeTTSBackend.
+
+Runs the real engine (retries, manifest-free, no cache) over synthetic parts
+for a range of concurrency limits, so scheduling changes can be measured
+without the live TTS endpoint. Each limit is a fixed ceiling (the AIMD
+window starts there and may only back off below it; `peak` is the largest
+window the run used), unless --aimd-max lets the window grow to it.
+
+    python benchmarks/synthesis_throughput.py --parts 120 \\
+        --backend "fake:latency=0.8,jitter=0.4,failure_rate=0.02" \\
+        --concurrency 1 2 4 8 16
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from textproc.synthesis import synthesize_parts  # noqa: E402
+from textproc.tts_backends import make_backend  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--parts", type=int, default=120)
+    ap.add_argument("--chars", type=int, default=1500, help="characters per part")
+    ap.add_argument("--backend", default="fake:latency=0.8,jitter=0.4,failure_rate=0.02")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    ap.add_argument(
+        "--aimd-max",
+        type=int,
+        default=None,
+        help="let the AIMD window grow up to this instead of fixing it",
+    )
+    args = ap.parse_args()
+
+    parts = [f"Part {i}. " + "x" * args.chars for i in range(args.parts)]
+    print(
+        f"{'concurrency':>11} {'peak':>4} {'seconds':>8} {'parts/s':>8} "
+        f"{'chars/s':>9} {'failed':>6}"
+    )
+    for concurrency in args.concurrency:
+        backend = make_backend(args.backend)
+        metrics = {}
+        with tempfile.TemporaryDirectory() as td:
+            started = time.perf_counter()
+            results = synthesize_parts(
+                parts, "en-US-AndrewNeural", td, 0, 0,
+                concurrency=concurrency,
+                max_concurrency=args.aimd_max or concurrency,
+                backend=backend,
+                metrics=metrics,
+            )
+            elapsed = time.perf_counter() - started
+        failed = sum(1 for r in results if r is None)
+        print(
+            f"{concurrency:>11} {metrics['concurrency']['peak_window']:>4} "
+            f"{elapsed:>8.2f} {args.parts / elapsed:>8.2f} "
+            f"{args.parts * args.chars / elapsed:>9.0f} {failed:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
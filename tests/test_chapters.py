@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+from textproc.chapters import (
+    MIN_CHAPTER_CHARS,
+    chapters_from_headings,
+    chapters_from_outline,
+    split_into_chapters,
+)
+from textproc.extractors import PAGE_BREAK
+
+
+def body(word: str) -> str:
+    """A paragraph long enough to stand as a chapter of its own."""
+    return " ".join([word] * (MIN_CHAPTER_CHARS // len(word) + 1)) + "\n"
+
+
+def test_outline_splits_on_top_level_pages():
+    pages = [body("front"), body("one"), body("more"), body("two")]
+    toc = [[1, "The Start", 2], [2, "A Section", 3], [1, "The  End", 4]]
+    chapters = chapters_from_outline(PAGE_BREAK.join(pages), toc)
+    assert [c.title for c in chapters] == ["Opening", "The Start", "The End"]
+    assert chapters[1].text == PAGE_BREAK.join(pages[1:3])
+    assert chapters[2].text == pages[3]
+
+
+def test_outline_entries_sharing_a_page_keep_the_first():
+    pages = [body("one"), body("two")]
+    toc = [[1, "First", 1], [1, "Also first", 1], [1, "Second", 2]]
+    chapters = chapters_from_outline(PAGE_BREAK.join(pages), toc)
+    assert [c.title for c in chapters] == ["First", "Second"]
+
+
+def test_outline_short_front_matter_joins_the_first_chapter():
+    pages = ["Title page\n", body("one"), body("two")]
+    chapters = chapters_from_outline(PAGE_BREAK.join(pages), [[1, "A", 2], [1, "B", 3]])
+    assert [c.title for c in chapters] == ["A", "B"]
+    assert chapters[0].text.startswith("Title page")
+
+
+def test_unusable_outline_is_empty():
+    assert chapters_from_outline("text", [[1, "No page", 0]]) == []
+
+
+def test_headings_split_chapters():
+    text = (
+        f"CHAPTER I\nAn Unexpected Party\n{body('hobbit')}"
+        f"CHAPTER II\nRoast Mutton\n{body('trolls')}"
+    )
+    chapters = chapters_from_headings(text)
+    assert [c.title for c in chapters] == [
+        "CHAPTER I: An Unexpected Party",
+        "CHAPTER II: Roast Mutton",
+    ]
+    assert "trolls" not in chapters[0].text
+
+
+def test_headings_skip_contents_list_and_running_headers():
+    contents = "Contents\nChapter 1 Start\nChapter 2 Middle\nChapter 3 End\n"
+    text = (
+        contents
+        + f"CHAPTER I\n{body('one')}"
+        + f"CHAPTER II\n{body('two')}CHAPTER II\n{body('still two')}"
+        + f"CHAPTER III\n{body('three')}"
+    )
+    chapters = chapters_from_headings(text)
+    assert [c.title for c in chapters] == ["CHAPTER I", "CHAPTER II", "CHAPTER III"]
+    assert chapters[0].text.startswith("Contents")
+    assert "still two" in chapters[1].text
+
+
+def test_headings_need_a_heading():
+    assert chapters_from_headings(body("nothing")) == []
+
+
+def test_split_prefers_outline_then_headings_then_whole_text():
+    # Pages as the extractor joins them
+    pages = [f"CHAPTER 1\n{body('one')}", f"CHAPTER 2\n{body('two')}"]
+    text = (PAGE_BREAK + "\n").join(pages)
+    by_outline = split_into_chapters(text, [[1, "Alpha", 1], [1, "Beta", 2]])
+    assert [c.title for c in by_outline] == ["Alpha", "Beta"]
+    assert [c.title for c in split_into_chapters(text)] == ["CHAPTER 1", "CHAPTER 2"]
+    assert split_into_chapters(body("plain"))[0].title == ""
+    assert split_into_chapters("  ") == []
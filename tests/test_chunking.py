@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import itertools
+import random
+
+import pytest
+
+from textproc.chunking import _balanced_pack, split_into_tts_parts
+
+
+def best_splits(units, max_length):
+    """Fewest pieces, then smallest largest piece, over every split: (count, size)."""
+    best = None
+    for cuts in itertools.product((False, True), repeat=len(units) - 1):
+        pieces, cur = [], [units[0]]
+        for unit, cut in zip(units[1:], cuts):
+            if cut:
+                pieces.append(" ".join(cur))
+                cur = []
+            cur.append(unit)
+        pieces.append(" ".join(cur))
+        if max(map(len, pieces)) <= max_length:
+            score = (len(pieces), max(map(len, pieces)))
+            best = score if best is None else min(best, score)
+    return best
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_pack_is_as_few_and_even_as_possible(seed):
+    rng = random.Random(seed)
+    units = ["x" * rng.randint(1, 30) for _ in range(rng.randint(1, 11))]
+    max_length = rng.randint(30, 120)
+    pieces = _balanced_pack(units, max_length)
+    assert " ".join(pieces) == " ".join(units)
+    assert (len(pieces), max(map(len, pieces))) == best_splits(units, max_length)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_pieces_stay_within_max_and_close_in_size(seed):
+    rng = random.Random(seed)
+    longest = rng.randint(5, 150)
+    max_length = rng.randint(10 * longest, 4000)
+    units = ["x" * rng.randint(1, longest) for _ in range(rng.randint(50, 400))]
+    pieces = _balanced_pack(units, max_length)
+    sizes = [len(p) for p in pieces]
+    assert " ".join(pieces) == " ".join(units)
+    assert max(sizes) <= max_length
+    # No tiny trailing piece: every piece is within a few units of the rest
+    if len(pieces) > 1:
+        assert max(sizes) - min(sizes) <= 4 * (longest + 1)
+
+
+def test_slack_is_shared_rather_than_left_to_the_last_piece():
+    # Packing up to the limit would give 100 + 100 + 100 + 10
+    pieces = _balanced_pack(["x" * 9] * 31, 100)
+    assert [len(p) for p in pieces] == [79, 79, 79, 69]
+
+
+def test_tts_parts_break_between_sentences():
+    sentences = [f"Sentence number {n} is here." for n in range(40)]
+    parts = split_into_tts_parts(" ".join(sentences), max_length=200)
+    assert all(len(p) <= 200 for p in parts)
+    assert all(p.endswith(".") for p in parts)
+    assert " ".join(parts) == " ".join(sentences)
+
+
+def test_over_long_sentence_breaks_between_words():
+    sentence = " ".join(["word"] * 200) + "."
+    parts = split_into_tts_parts(sentence, max_length=150)
+    assert all(len(p) <= 150 for p in parts)
+    assert all(w in ("word", "word.") for p in parts for w in p.split())
+    assert " ".join(parts) == sentence
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from textproc.concurrency import AIMDLimiter
+from textproc.scheduler import SynthesisScheduler
+
+
+def test_full_window_of_successes_adds_one():
+    limiter = AIMDLimiter(initial=4, max_limit=16)
+    for _ in range(4):
+        limiter.record(True, 1.0, chars=100)
+    assert limiter.limit == pytest.approx(5.0, abs=0.1)
+    limiter.record(True, 1.0, chars=100)
+    assert limiter.window == 5
+
+
+def test_increase_stops_at_max_limit():
+    limiter = AIMDLimiter(initial=2, max_limit=3)
+    for _ in range(50):
+        limiter.record(True, 1.0, chars=100)
+    assert limiter.window == 3
+    assert limiter.snapshot()["peak_window"] == 3
+
+
+def test_slow_successes_hold_the_window():
+    limiter = AIMDLimiter(initial=4, latency_tolerance=2.0)
+    limiter.record(True, 1.0, chars=100)
+    before = limiter.limit
+    for _ in range(10):
+        limiter.record(True, 50.0, chars=100)
+    assert limiter.limit == before
+
+
+def test_failure_halves_once_per_window():
+    limiter = AIMDLimiter(initial=8, min_limit=1)
+    started = 0.0  # both requests started before the back-off
+    limiter.record(False, 1.0, chars=100, started=started)
+    limiter.record(False, 1.0, chars=100, started=started)
+    assert (limiter.window, limiter.backoffs, limiter.failures) == (4, 1, 2)
+    # A request admitted after the back-off is a new congestion signal
+    limiter.record(False, 1.0, chars=100, started=limiter._last_backoff)
+    assert limiter.window == 2
+    for _ in range(5):
+        limiter.record(False, 1.0, chars=100, started=limiter._last_backoff)
+    assert limiter.window == 1
+
+
+def test_window_caps_requests_in_flight():
+    async def main():
+        limiter = AIMDLimiter(initial=3, max_limit=3)
+        peak = 0
+
+        async def request():
+            nonlocal peak
+            async with limiter.slot(chars=10):
+                peak = max(peak, limiter.in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(request() for _ in range(12)))
+        return peak, limiter.in_flight
+
+    assert asyncio.run(main()) == (3, 0)
+
+
+def test_upstream_share_bounds_a_wider_window():
+    async def main():
+        shared = SynthesisScheduler(max_in_flight=2)
+        share = shared.register("book", 1000)
+        limiter = AIMDLimiter(initial=4, max_limit=8, upstream=share)
+        peak = 0
+
+        async def request(n):
+            nonlocal peak
+            async with limiter.slot(chars=10, priority=n):
+                peak = max(peak, shared.in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(request(n) for n in range(16)))
+        shared.unregister(share)
+        return peak, limiter.window, shared.in_flight
+
+    peak, window, in_flight = asyncio.run(main())
+    assert peak == 2
+    # Time spent queueing for the share is not latency: the window still grows
+    assert window > 4
+    assert in_flight == 0
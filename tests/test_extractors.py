@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from textproc import extractors
+from textproc.extractors import add_spacing_words, fix_extraction_spacing
+
+
+@pytest.fixture(autouse=True)
+def builtin_words(monkeypatch):
+    """Start every test from the built-in word list only."""
+    monkeypatch.setattr(extractors, "_spacing_words", set(extractors._SPACING_WORDS))
+
+
+@pytest.mark.parametrize(
+    "broken, fixed",
+    [
+        ("T he cat w as here", "The cat was here"),
+        ("bread a nd butter", "bread and butter"),
+        ("they a re here", "they are here"),
+        ("I s it true? I t is.", "Is it true? It is."),
+        ("look a t this", "look at this"),
+        ("I n the end", "In the end"),
+        ("as well a s that", "as well as that"),
+        ("I w as sure", "I was sure"),
+    ],
+)
+def test_rejoins_broken_words(broken, fixed):
+    assert fix_extraction_spacing(broken) == fixed
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "a way out",
+        "A way out",
+        "a long road",
+        "a mount",
+        "a do about nothing",
+        "I deal with it",
+        "I go",
+        "a to-do list",
+        "a the",
+    ],
+)
+def test_keeps_a_and_i_apart_from_words(text):
+    add_spacing_words(["away", "along", "amount", "ado", "ideal", "igo", "ato", "athe"])
+    assert fix_extraction_spacing(text) == text
+
+
+@pytest.mark.parametrize(
+    "broken, fixed",
+    [
+        ("A nother day", "Another day"),
+        ("I mportant news", "Important news"),
+        ("just a bout done", "just about done"),
+        ("an I dea", "an Idea"),
+    ],
+)
+def test_rejoins_listed_words_after_a_and_i(broken, fixed):
+    assert fix_extraction_spacing(broken) == broken
+    add_spacing_words(["another", "important", "about", "idea"])
+    assert fix_extraction_spacing(broken) == fixed
+
+
+def test_user_words_are_rejoined():
+    assert fix_extraction_spacing("the g overnment") == "the g overnment"
+    assert add_spacing_words(["government", "x1", "a"]) == 1
+    assert fix_extraction_spacing("the g overnment") == "the government"
+
+
+def test_restores_missing_spaces_before_capitals():
+    assert fix_extraction_spacing("endThe end.The") == "end The end. The"
+    assert fix_extraction_spacing("below.I t was") == "below. It was"
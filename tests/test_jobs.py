@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from textproc import jobs, worker
+from textproc.jobs import JobCancelled, JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(tmp_path / "jobs.sqlite3")
+
+
+def _all(queue):
+    with queue._connect() as db:
+        return [dict(r) for r in db.execute("SELECT id FROM jobs ORDER BY created")]
+
+
+def test_claim_takes_oldest_job_once(queue):
+    first = queue.submit("prepare", {"n": 1})
+    second = queue.submit("render", {"n": 2})
+    job = queue.claim("w1")
+    assert (job["id"], job["spec"], job["attempt"]) == (first, {"n": 1}, 1)
+    assert queue.claim("w2", kinds=("prepare",)) is None
+    assert queue.claim("w2")["id"] == second
+    assert queue.claim("w3") is None
+    assert queue.get(first)["status"] == "running"
+
+
+def test_concurrent_claims_never_share_a_job(queue):
+    submitted = {queue.submit("render", {"n": n}) for n in range(20)}
+    claimed = []
+
+    def _claim(worker_id):
+        while True:
+            job = queue.claim(worker_id)
+            if job is None:
+                return
+            claimed.append(job["id"])
+
+    threads = [threading.Thread(target=_claim, args=(f"w{n}",)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(claimed) == sorted(submitted)
+
+
+def test_job_key_returns_the_existing_job(queue):
+    job_id = queue.submit("prepare", {}, key="digest:book.pdf")
+    assert queue.submit("prepare", {}, key="digest:book.pdf") == job_id
+    assert queue.submit("render", {}, key="digest:book.pdf") != job_id
+    assert queue.submit("prepare", {}, key="other") != job_id
+    # A failed job is not reused: submitting again retries it
+    queue.finish(queue.claim("w")["id"], "failed", error="boom")
+    assert queue.submit("prepare", {}, key="digest:book.pdf") != job_id
+
+
+def test_cancel_queued_job_on_the_spot(queue):
+    job_id = queue.submit("render", {})
+    queue.request_cancel(job_id)
+    assert queue.get(job_id)["status"] == "cancelled"
+    assert queue.claim("w") is None
+
+
+def test_cancel_running_job_through_report(queue, monkeypatch):
+    started = threading.Event()
+
+    def _long_job(spec, report):
+        started.set()
+        while True:
+            report({"step": 1})
+
+    monkeypatch.setitem(worker.HANDLERS, "render", _long_job)
+    queue.submit("render", {})
+    job = queue.claim("w")
+    runner = threading.Thread(target=worker.run_job, args=(queue, job))
+    runner.start()
+    started.wait(5)
+    queue.request_cancel(job["id"])
+    runner.join(5)
+    assert not runner.is_alive()
+    assert queue.get(job["id"])["status"] == "cancelled"
+    with pytest.raises(JobCancelled):
+        queue.report(job["id"])
+
+
+def test_run_job_records_result_or_error(queue, monkeypatch):
+    monkeypatch.setitem(worker.HANDLERS, "prepare", lambda spec, report: {"ok": 1})
+    monkeypatch.setitem(worker.HANDLERS, "render", lambda spec, report: 1 / 0)
+    for kind in ("prepare", "render"):
+        queue.submit(kind, {})
+        worker.run_job(queue, queue.claim("w"))
+    done, failed = (queue.get(j["id"], with_result=True) for j in _all(queue))
+    assert (done["status"], done["result"]) == ("done", {"ok": 1})
+    assert (failed["status"], failed["error"]) == ("failed", "division by zero")
+
+
+def test_stale_job_is_reclaimed_then_failed(queue, monkeypatch):
+    job_id = queue.submit("render", {})
+    queue.claim("dead")
+    assert queue.claim("w") is None  # still heartbeating
+    now = [time.time()]
+    monkeypatch.setattr(jobs, "time", SimpleNamespace(time=lambda: now[0]))
+    for attempt in range(2, jobs.MAX_ATTEMPTS + 1):
+        now[0] += jobs.JOB_STALE_S + 1
+        job = queue.claim(f"w{attempt}")
+        assert (job["id"], job["attempt"]) == (job_id, attempt)
+    now[0] += jobs.JOB_STALE_S + 1
+    assert queue.claim("last") is None
+    failed = queue.get(job_id)
+    assert failed["status"] == "failed"
+    assert "died 3 times" in failed["error"]
+
+
+def test_concurrent_ensure_workers_start_them_once(queue, monkeypatch):
+    spawned = []
+
+    class FakePopen:
+        def __init__(self, args, **kwargs):
+            count = int(args[args.index("--workers") + 1])
+            spawned.append(count)
+            for n in range(count):
+                queue.worker_heartbeat(f"fake-{len(spawned)}-{n}")
+
+    monkeypatch.setattr(worker.subprocess, "Popen", FakePopen)
+    threads = [
+        threading.Thread(target=worker.ensure_workers, args=(2, queue)) for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert spawned == [2]
+    assert queue.live_workers() == 2
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+from textproc import manifest as manifest_module
+from textproc.manifest import JobManifest, prune_jobs
+
+pytestmark = pytest.mark.skipif(
+    manifest_module.fcntl is None, reason="render locks need fcntl"
+)
+
+_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def lock_in_other_process(job_id: str, root) -> bool:
+    code = (
+        "import sys; from textproc.manifest import JobManifest; "
+        "print(JobManifest(sys.argv[1], root=sys.argv[2]).lock())"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code, job_id, str(root)],
+        cwd=_REPO,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return out.strip() == "True"
+
+
+def age(job_dir, seconds: float) -> None:
+    past = time.time() - seconds
+    for path in (job_dir / "parts.jsonl", job_dir):
+        if path.exists():
+            os.utime(path, (past, past))
+
+
+def test_second_process_cannot_take_the_lock(tmp_path):
+    held = JobManifest("job", root=tmp_path)
+    assert held.lock()
+    assert not lock_in_other_process("job", tmp_path)
+    held.close()
+    assert lock_in_other_process("job", tmp_path)
+
+
+def test_second_render_gets_a_private_directory(tmp_path):
+    args = (["part one", "part two"], "voice", 0, 0, "edge")
+    first = JobManifest.for_job(*args, root=tmp_path)
+    second = JobManifest.for_job(*args, root=tmp_path)
+    assert not first.private and second.private
+    assert second.dir != first.dir
+    second.discard()
+    first.close()
+    assert JobManifest.for_job(*args, root=tmp_path).dir == first.dir
+
+
+def test_finished_parts_survive_a_restart(tmp_path):
+    manifest = JobManifest("job", root=tmp_path)
+    part = manifest.dir / "part_0.mp3"
+    part.write_bytes(b"audio")
+    manifest.mark_done(0, "hello", str(part))
+    with open(manifest.dir / "parts.jsonl", "a") as f:
+        f.write('{"index": 1, "te')  # torn by a crash
+    manifest.close()
+    resumed = JobManifest("job", root=tmp_path)
+    assert resumed.is_done(0, "hello")
+    assert not resumed.is_done(0, "edited")
+    assert not resumed.is_done(1, "anything")
+    part.write_bytes(b"audio, truncated differently")
+    assert not resumed.is_done(0, "hello")
+
+
+def test_prune_skips_recent_and_locked_jobs(tmp_path):
+    week = 7 * 24 * 3600
+    stale = JobManifest("stale", root=tmp_path)
+    busy = JobManifest("busy", root=tmp_path)
+    fresh = JobManifest("fresh", root=tmp_path)
+    assert busy.lock()
+    age(stale.dir, week + 60)
+    age(busy.dir, week + 60)
+    assert prune_jobs(root=tmp_path) == 1
+    assert not stale.dir.exists()
+    assert busy.dir.exists() and fresh.dir.exists()
+    busy.close()
+    assert prune_jobs(root=tmp_path) == 1
+    assert not busy.dir.exists()
+
+
+def test_lock_on_a_pruned_directory_is_refused(tmp_path, monkeypatch):
+    manifest = JobManifest("job", root=tmp_path)
+    flock = manifest_module.fcntl.flock
+
+    def flock_after_prune(f, operation):
+        # prune_jobs deletes the directory between open() and flock(), and
+        # another render recreates it
+        shutil.rmtree(manifest.dir)
+        manifest.dir.mkdir()
+        (manifest.dir / ".lock").touch()
+        return flock(f, operation)
+
+    monkeypatch.setattr(manifest_module.fcntl, "flock", flock_after_prune)
+    assert not manifest.lock()
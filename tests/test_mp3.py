@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import io
+import struct
+
+import pytest
+
+from textproc.mp3 import (
+    MP3Assembler,
+    OrderedPrefixWriter,
+    iter_audio_frames,
+    iter_file_frames,
+    parse_header,
+)
+
+# MPEG-2 Layer III, 48 kbit/s, 24 kHz, mono: 144-byte frames of 576 samples
+HEADER = bytes((0xFF, 0xF3, 0x64, 0xC0))
+FRAME_BYTES = 144
+
+
+def frame(n: int) -> bytes:
+    """An audio frame whose payload (no 0xFF bytes) identifies it."""
+    return HEADER + bytes([n % 200]) * (FRAME_BYTES - 4)
+
+
+def info_frame() -> bytes:
+    # The tag follows the header and 9 bytes of mono MPEG-2 side information
+    body = bytes(9) + b"Info" + struct.pack(">III", 1, 0, 0)
+    return HEADER + body + bytes(FRAME_BYTES - 4 - len(body))
+
+
+def id3v2(body: bytes) -> bytes:
+    size = len(body)
+    syncsafe = bytes((size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    return b"ID3\x04\x00\x00" + syncsafe + body
+
+
+def test_parse_header():
+    hdr = parse_header(HEADER)
+    assert (hdr.version, hdr.layer, hdr.sample_rate, hdr.length) == (2, 3, 24000, 144)
+    assert hdr.mono and hdr.samples == 576
+    assert parse_header(b"\xff\xf3\xf4\xc0") is None  # bitrate index 15
+    assert parse_header(b"ID3\x04") is None
+
+
+@pytest.mark.parametrize("read_size", [1, 7, 143, 144, 145, 1000, 65536])
+def test_frames_survive_buffer_boundaries(read_size):
+    frames = [frame(n) for n in range(40)]
+    # Tags full of fake sync words, junk to resync past and a trailing ID3v1
+    data = (
+        id3v2(HEADER * 50)
+        + info_frame()
+        + b"".join(frames[:20])
+        + id3v2(b"\xff" * 300)
+        + b"\x00\xff\x12junk"
+        + b"".join(frames[20:])
+        + b"TAG"
+        + bytes(125)
+    )
+    parsed = [f for _, f in iter_file_frames(io.BytesIO(data), read_size=read_size)]
+    assert parsed == frames
+
+
+def test_info_frame_is_only_dropped_at_the_start():
+    data = frame(1) + info_frame() + frame(2)
+    assert [f for _, f in iter_audio_frames(data)] == [frame(1), info_frame(), frame(2)]
+
+
+def test_assembler_writes_frame_count_and_toc(tmp_path):
+    parts = []
+    for p in range(3):
+        path = tmp_path / f"part{p}.mp3"
+        path.write_bytes(id3v2(b"x" * 20) + info_frame() + frame(p) * 50)
+        parts.append(str(path))
+    out = tmp_path / "book.mp3"
+    with MP3Assembler(str(out)) as asm:
+        for path in parts:
+            assert asm.append_file(path) == 50
+    data = out.read_bytes()
+
+    header = parse_header(data[:4])
+    tag_at = 4 + header.side_info
+    assert data[tag_at : tag_at + 4] == b"Info"
+    flags, frames, size = struct.unpack(">III", data[tag_at + 4 : tag_at + 16])
+    assert (flags, frames, size) == (7, 150, len(data))
+    toc = data[tag_at + 16 : tag_at + 116]
+    assert toc[0] * len(data) // 256 <= header.length
+    assert list(toc) == sorted(toc)
+    # Entry 50 points at the middle frame, within the TOC's resolution
+    middle = header.length + 75 * FRAME_BYTES
+    assert abs(toc[50] * len(data) / 256 - middle) < len(data) / 256
+
+    body = [f for _, f in iter_audio_frames(data)]
+    assert body == [frame(0)] * 50 + [frame(1)] * 50 + [frame(2)] * 50
+    assert asm.duration_seconds == pytest.approx(150 * 576 / 24000)
+
+
+def test_prefix_writer_appends_in_order_as_gaps_fill(tmp_path):
+    paths = []
+    for p in range(4):
+        path = tmp_path / f"part{p}.mp3"
+        path.write_bytes(frame(p) * 3)
+        paths.append(str(path))
+    out = tmp_path / "book.mp3"
+    with OrderedPrefixWriter(str(out), total=4) as writer:
+        writer.add(2, paths[2])
+        assert (writer.settled, writer.parts_written) == (0, 0)
+        writer.add(1, None)  # failed for good
+        writer.add(0, paths[0])
+        assert (writer.settled, writer.parts_written) == (3, 2)
+        assert [f for _, f in iter_audio_frames(out.read_bytes())] == (
+            [frame(0)] * 3 + [frame(2)] * 3
+        )
+        assert not writer.complete
+        writer.add(3, paths[3])
+        assert writer.complete
+    body = [f for _, f in iter_audio_frames(out.read_bytes())]
+    assert body == [frame(0)] * 3 + [frame(2)] * 3 + [frame(3)] * 3
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import json
+
+from textproc.revisions import (
+    MIN_ANCHOR_CHARS,
+    align_chapters,
+    document_key,
+    load_revision,
+    save_revision,
+)
+
+
+def passage(n: int) -> str:
+    """A distinct sentence-aligned passage long enough to be an anchor."""
+    words = " ".join(f"word{n}x{i}" for i in range(MIN_ANCHOR_CHARS // 8))
+    return f"Passage {n} says {words}."
+
+
+def rendered(tmp_path, chapters):
+    save_revision("book", chapters, root=tmp_path)
+    return load_revision("book", root=tmp_path)
+
+
+def test_unchanged_passages_keep_their_parts(tmp_path):
+    old = [passage(n) for n in range(6)]
+    previous = rendered(
+        tmp_path,
+        [{"title": "One", "chunks": old[:3]}, {"title": "Two", "chunks": old[3:]}],
+    )
+    edited = " ".join(old[:2] + ["An added sentence."] + old[2:5] + [passage(9)])
+    chapters, reused = align_chapters(edited, previous, max_length=300)
+    assert reused == 5
+    assert [c["title"] for c in chapters] == ["One", "Two"]
+    assert chapters[0]["chunks"] == old[:2] + ["An added sentence."] + old[2:3]
+    assert chapters[1]["chunks"] == old[3:5] + [passage(9)]
+
+
+def test_reuse_ignores_whitespace_changes(tmp_path):
+    old = [passage(n) for n in range(3)]
+    previous = rendered(tmp_path, [{"title": "", "chunks": old}])
+    chapters, reused = align_chapters("\n\n  ".join(old), previous, max_length=300)
+    assert reused == 3
+    assert chapters[0]["chunks"] == old
+
+
+def test_below_min_reuse_fraction_chunks_afresh(tmp_path):
+    old = [passage(n) for n in range(2)]
+    previous = rendered(tmp_path, [{"title": "", "chunks": old}])
+    edited = " ".join(old[:1] + [passage(n) for n in range(10, 13)])
+    assert align_chapters(edited, previous, max_length=300) == (None, 0)
+
+
+def test_revisions_store_digests_not_text(tmp_path):
+    save_revision("book", [{"title": "One", "chunks": [passage(1)]}], root=tmp_path)
+    stored = (tmp_path / "book.json").read_text(encoding="utf-8")
+    assert "word1x" not in stored
+    assert json.loads(stored)["chapters"][0]["title"] == "One"
+
+
+def test_document_key_is_scoped_to_lineage():
+    assert document_key("Book (1).clean.txt", "a") == document_key("book.pdf", "a")
+    assert document_key("book.pdf", "a") != document_key("book.pdf", "b")
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from textproc.scheduler import SynthesisScheduler
+
+
+def grant_order(policy: str, jobs: dict, requests: list) -> list:
+    """
+    Names in the order a one-slot scheduler grants `requests` of
+    (job name, chars, priority), all queued before the first is granted.
+    """
+
+    async def main():
+        shared = SynthesisScheduler(max_in_flight=1, policy=policy)
+        shares = {name: shared.register(name, chars) for name, chars in jobs.items()}
+        blocker = shared.register("blocker")
+        assert blocker.try_acquire()
+        order = []
+
+        async def request(name, chars, priority):
+            async with shares[name].slot(chars, priority):
+                order.append(name)
+                shares[name].part_done(chars)
+
+        tasks = [asyncio.ensure_future(request(*r)) for r in requests]
+        await asyncio.sleep(0)  # everything queues behind the blocker
+        blocker.release()
+        await asyncio.gather(*tasks)
+        assert shared.in_flight == 0
+        return order
+
+    return asyncio.run(main())
+
+
+def test_fair_alternates_between_jobs():
+    requests = [("big", 100, n) for n in range(4)] + [("small", 100, n) for n in range(2)]
+    order = grant_order("fair", {"big": 400, "small": 200}, requests)
+    assert order == ["big", "small", "big", "small", "big", "big"]
+
+
+def test_fair_weighs_by_characters_served():
+    requests = [("long", 300, n) for n in range(2)] + [("short", 100, n) for n in range(4)]
+    order = grant_order("fair", {"long": 600, "short": 400}, requests)
+    assert order == ["long", "short", "short", "short", "long", "short"]
+
+
+def test_srpt_serves_least_remaining_text_first():
+    requests = [("big", 100, n) for n in range(3)] + [("small", 100, n) for n in range(2)]
+    order = grant_order("srpt", {"big": 300, "small": 200}, requests)
+    assert order == ["small", "small", "big", "big", "big"]
+
+
+def test_lowest_priority_first_within_a_job():
+    async def main():
+        shared = SynthesisScheduler(max_in_flight=1)
+        share = shared.register("book")
+        assert share.try_acquire()
+        order = []
+
+        async def request(priority):
+            async with share.slot(10, priority):
+                order.append(priority)
+
+        tasks = [asyncio.ensure_future(request(p)) for p in (3, 1, 2, 0)]
+        await asyncio.sleep(0)
+        share.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(main()) == [0, 1, 2, 3]
+
+
+def test_try_acquire_never_jumps_the_queue():
+    async def main():
+        shared = SynthesisScheduler(max_in_flight=2)
+        hedger = shared.register("hedger")
+        other = shared.register("other")
+        assert hedger.try_acquire(10) and hedger.try_acquire(10)
+        assert not hedger.try_acquire(10)  # all slots taken
+        waiting = asyncio.ensure_future(other.acquire(10))
+        await asyncio.sleep(0)
+        hedger.release()  # goes to the queued request, not a new hedge
+        assert not hedger.try_acquire(10)
+        await waiting
+        other.release()
+        assert hedger.try_acquire(10)
+        assert (hedger.stats()["granted"], shared.in_flight) == (3, 2)
+
+    asyncio.run(main())
+
+
+def test_unregister_cancels_waiting_requests():
+    async def main():
+        shared = SynthesisScheduler(max_in_flight=1)
+        leaving = shared.register("leaving")
+        staying = shared.register("staying")
+        assert staying.try_acquire()
+        stuck = [asyncio.ensure_future(leaving.acquire(10)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert shared.queue_depth == 3
+        shared.unregister(leaving)
+        for task in stuck:
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        assert shared.queue_depth == 0
+        # Nothing was granted to it, and the slot still works for others
+        staying.release()
+        assert shared.in_flight == 0
+        await asyncio.wait_for(staying.acquire(10), 1)
+        staying.release()
+        # An unregistered job gets no further slots
+        assert not leaving.try_acquire()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving.acquire(10)
+
+    asyncio.run(main())
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+from textproc import telemetry as telemetry_module
+from textproc.telemetry import Telemetry, load_reports
+
+
+def process_report(voices: dict, jobs: int = 1) -> Telemetry:
+    """A Telemetry that synthesized `voices` (voice -> part count)."""
+    process = Telemetry()
+    for voice, parts in voices.items():
+        recorder = process.job("book", voice)
+        for _ in range(parts):
+            recorder.record_part(100, 1.0, 16000)
+    process.jobs = jobs
+    return process
+
+
+def test_report_file_is_keyed_by_pid_and_start_time(tmp_path, monkeypatch):
+    monkeypatch.setattr(telemetry_module, "data_dir", lambda name: tmp_path)
+    first = process_report({"a": 1})
+    later = process_report({"a": 2})
+    later.started = first.started + 60  # same pid, reused by a later process
+    first.save()
+    later.save()
+    assert len(list(tmp_path.glob("synthesis-*.json"))) == 2
+    merged = load_reports(root=tmp_path)
+    assert merged["processes"] == 2
+    assert merged["total"]["counters"]["parts"] == 3
+
+
+def test_unreadable_report_is_skipped_as_a_whole(tmp_path):
+    good = process_report({"a": 2}).report()
+    (tmp_path / "synthesis-1-1.json").write_text(json.dumps(good))
+    # The first voice merges fine, the second has a broken histogram
+    bad = process_report({"a": 5, "b": 5}, jobs=7).report()
+    bad["voices"]["b"]["latency_seconds"]["counts"].pop()
+    (tmp_path / "synthesis-2-2.json").write_text(json.dumps(bad))
+    (tmp_path / "synthesis-3-3.json").write_text('{"voices": {"a": ')  # torn
+    merged = load_reports(root=tmp_path)
+    assert (merged["processes"], merged["jobs"]) == (1, 1)
+    assert merged["total"]["counters"]["parts"] == 2
+    assert merged["voices"]["a"]["latency_seconds"]["count"] == 2
+    assert "b" not in merged["voices"]
+
+
+def test_stale_reports_are_deleted(tmp_path):
+    path = tmp_path / "synthesis-1-1.json"
+    path.write_text(json.dumps(process_report({"a": 1}).report()))
+    os.utime(path, (0, 0))
+    assert load_reports(root=tmp_path)["processes"] == 0
+    assert not path.exists()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Command-line entry point.
+
+    python -m textproc convert PATH [PATH ...] [--out-dir DIR] [--summary FILE]
+    python -m textproc telemetry [--prometheus]
+
+`convert` converts documents (files, or directories searched recursively)
+without the Streamlit app; see textproc.batch. `telemetry` prints the
+synthesis telemetry merged from every process; see textproc.telemetry.
+"""
+import argparse
+import json
+import logging
+import sys
+
+from .batch import DEFAULT_RENDER_JOBS, convert_files
+from .telemetry import load_reports, prometheus_text
+from .voices import DEFAULT_VOICE
+
+
+def _convert(args) -> int:
+    def _on_file_done(entry: dict):
+        if entry["status"] == "failed":
+            print(f"failed      {entry['source']}: {entry['error']}", file=sys.stderr)
+        else:
+            print(f"{entry['status']:<11} {entry['source']}", file=sys.stderr)
+
+    summary = convert_files(
+        args.paths,
+        out_dir=args.out_dir,
+        voice=args.voice,
+        rate_pct=args.rate,
+        pitch_hz=args.pitch,
+        remove_headers=not args.keep_headers,
+        remove_footnotes=not args.keep_footnotes,
+        make_m4b=args.m4b,
+        workers=args.workers,
+        render_jobs=args.render_jobs,
+        force=args.force,
+        on_file_done=_on_file_done,
+        stream=args.stream,
+    )
+    report = json.dumps(summary, indent=2)
+    if args.summary == "-":
+        print(report)
+    elif args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    totals = summary["totals"]
+    print(
+        f"{totals['converted']} converted, {totals['up_to_date']} up to date, "
+        f"{totals['failed']} failed in {summary['elapsed']:.1f}s",
+        file=sys.stderr,
+    )
+    return 1 if totals["failed"] else 0
+
+
+def _telemetry(args) -> int:
+    report = load_reports()
+    if args.prometheus:
+        sys.stdout.write(prometheus_text(report))
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m textproc")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert = commands.add_parser(
+        "convert", help="Convert PDF and TXT files to MP3 and cleaned text"
+    )
+    convert.add_argument("paths", nargs="+", help="Files or directories")
+    convert.add_argument(
+        "--out-dir", help="Write outputs here instead of next to each source"
+    )
+    convert.add_argument("--voice", default=DEFAULT_VOICE)
+    convert.add_argument("--rate", type=int, default=0, help="Rate change in %%")
+    convert.add_argument("--pitch", type=int, default=0, help="Pitch change in Hz")
+    convert.add_argument("--keep-headers", action="store_true")
+    convert.add_argument("--keep-footnotes", action="store_true")
+    convert.add_argument("--m4b", action="store_true", help="Also write an M4B")
+    convert.add_argument(
+        "--workers", type=int, help="Preparation processes (default: CPU count)"
+    )
+    convert.add_argument(
+        "--render-jobs",
+        type=int,
+        default=DEFAULT_RENDER_JOBS,
+        help="Books synthesized at the same time",
+    )
+    convert.add_argument(
+        "--force", action="store_true", help="Convert even if outputs are up to date"
+    )
+    convert.add_argument(
+        "--stream",
+        action="store_true",
+        help="Start synthesis while pages are still being extracted (one MP3, "
+        "no chapters)",
+    )
+    convert.add_argument(
+        "--summary", help="Write the JSON timing summary to FILE ('-' for stdout)"
+    )
+    convert.add_argument("-v", "--verbose", action="store_true")
+    convert.set_defaults(run=_convert)
+
+    report = commands.add_parser(
+        "telemetry", help="Print synthesis latency and throughput telemetry"
+    )
+    report.add_argument(
+        "--prometheus", action="store_true", help="Prometheus text format instead of JSON"
+    )
+    report.set_defaults(run=_telemetry, verbose=False)
+
+    args = parser.parse_args(argv)
+    if args.command == "convert" and args.stream and args.m4b:
+        parser.error("--stream makes no chapters, so it can't be combined with --m4b")
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s %(name)s %(levelname)s %(message)s",
+    )
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
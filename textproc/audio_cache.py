@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+from .storage import LRUFileStore, atomic_copy, data_dir
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = int(os.environ.get("BILBOT_TTS_CACHE_MB", "2048")) * 1024 * 1024
+
+
+class AudioCache(LRUFileStore):
+    """
+    Content-addressed store of synthesized MP3 parts.
+
+    Entries are keyed by a hash of everything that affects the audio, written
+    atomically, and evicted least-recently-used first once the directory grows
+    past `max_bytes`. Safe to share between sessions and processes: the worst
+    case of a race is one redundant synthesis.
+    """
+
+    suffix = ".mp3"
+    label = "TTS cache"
+
+    def __init__(self, root=None, max_bytes: int = DEFAULT_MAX_BYTES):
+        super().__init__(root or data_dir("tts-cache"), max_bytes)
+
+    @staticmethod
+    def make_key(
+        text: str, voice: str, rate_pct: int, pitch_hz: int, backend_version: str
+    ) -> str:
+        payload = json.dumps(
+            [text, voice, int(rate_pct), int(pitch_hz), backend_version],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def fetch(self, key: str, out_path: str) -> bool:
+        """Copy a cached part to out_path; returns False on a miss."""
+        entry = self._entry(key)
+        try:
+            shutil.copyfile(entry, out_path)
+        except OSError:
+            self._miss()
+            return False
+        self._hit(entry)
+        return True
+
+    def store(self, key: str, src_path: str) -> None:
+        entry = self._entry(key)
+        try:
+            entry.parent.mkdir(exist_ok=True)
+            atomic_copy(src_path, entry)
+            added = entry.stat().st_size
+        except OSError as e:
+            logger.warning("TTS cache store failed for %s: %s", key[:12], e)
+            return
+        self._added(added)
@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+"""
+Headless conversion of many documents at once.
+
+    python -m textproc convert books/ extra.pdf --out-dir audio/ --summary run.json
+
+Extraction and cleaning run in a process pool, several books synthesize at
+the same time, and each book's MP3 and cleaned text are written side by
+side (next to the source, or in `out_dir`). Books whose outputs are already
+up to date for the same settings are skipped. With `stream`, synthesis of
+each book starts with its first pages instead of after preparation.
+"""
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional
+
+from .mp3 import new_output_path, remove_output
+from .pipeline import (
+    TTS_CONCURRENCY,
+    TTS_HEDGE_PERCENTILE,
+    TTS_JOB_TIMEOUT,
+    TTS_MAX_CONCURRENCY,
+    TTS_PART_TIMEOUT,
+    audio_cache,
+    prepare_document,
+    render_book,
+)
+from .storage import atomic_write_bytes, data_dir
+from .streaming import estimate_chars, stream_document, synthesize_stream
+from .voices import DEFAULT_VOICE
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_SUFFIXES = (".pdf", ".txt")
+
+# Books synthesizing at once; each has its own adaptive request window
+DEFAULT_RENDER_JOBS = int(os.environ.get("BILBOT_BATCH_RENDER_JOBS", 2))
+
+# Our own outputs ("book.clean.txt", "book.skipped.txt") are never inputs
+_OUTPUT_MARKERS = (".clean", ".skipped")
+
+
+def collect_inputs(paths: Iterable[str]) -> List[Path]:
+    """Expand files and directories (recursively) into supported documents."""
+    found = []
+    for path in map(Path, paths):
+        candidates = sorted(path.rglob("*")) if path.is_dir() else [path]
+        for candidate in candidates:
+            if (
+                candidate.is_file()
+                and candidate.suffix.lower() in SUPPORTED_SUFFIXES
+                and not candidate.stem.lower().endswith(_OUTPUT_MARKERS)
+            ):
+                found.append(candidate)
+    # One entry per file, even when named twice
+    seen = set()
+    return [p for p in found if not (p.resolve() in seen or seen.add(p.resolve()))]
+
+
+def output_paths(source: Path, out_dir: Optional[str] = None) -> dict:
+    folder = Path(out_dir) if out_dir else source.parent
+    return {
+        "mp3": folder / f"{source.stem}.mp3",
+        "text": folder / f"{source.stem}.clean.txt",
+        "m4b": folder / f"{source.stem}.m4b",
+        "skipped": folder / f"{source.stem}.skipped.txt",
+    }
+
+
+# --- Up-to-date checks ---------------------------------------------------------
+# A stamp per output MP3 records the source (size and mtime) and the settings
+# it was made with; the book is skipped while both match and the outputs are
+# still there.
+
+
+def _stamp_path(mp3: Path) -> Path:
+    digest = hashlib.sha256(str(mp3.resolve()).encode("utf-8")).hexdigest()[:32]
+    return data_dir("batch") / f"{digest}.json"
+
+
+def _stamp(source: Path, settings: dict) -> dict:
+    st = source.stat()
+    return {
+        "source": str(source.resolve()),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "settings": settings,
+    }
+
+
+def is_up_to_date(source: Path, outputs: dict, settings: dict) -> bool:
+    wanted = [outputs["mp3"], outputs["text"]]
+    if settings.get("make_m4b"):
+        wanted.append(outputs["m4b"])
+    if not all(p.exists() for p in wanted):
+        return False
+    try:
+        with open(_stamp_path(outputs["mp3"]), "r", encoding="utf-8") as f:
+            return json.load(f) == _stamp(source, settings)
+    except (OSError, ValueError):
+        return False
+
+
+def _place(src: str, dst: Path) -> None:
+    """Move a finished output into place without exposing a partial file."""
+    tmp = dst.with_name(f".{dst.name}.part")
+    shutil.move(src, tmp)
+    os.replace(tmp, dst)
+
+
+# --- Stages --------------------------------------------------------------------
+
+
+def _prepare(
+    source: str,
+    remove_headers: bool,
+    remove_footnotes: bool,
+    voice: str,
+    extract_workers: Optional[int] = None,
+) -> dict:
+    """Process-pool stage: extract, split, clean and chunk one document."""
+    result = prepare_document(
+        source,
+        os.path.basename(source),
+        remove_headers,
+        remove_footnotes,
+        voice=voice,
+        extract_workers=extract_workers,
+        # A file re-converted in the same directory is the same book
+        lineage=os.path.dirname(os.path.abspath(source)),
+    )
+    result.pop("raw_text", None)  # the cleaned text is what gets written
+    return result
+
+
+def _render(prepared: dict, source: Path, outputs: dict, settings: dict) -> dict:
+    """Thread stage: synthesize one prepared book and write its outputs."""
+    result = render_book(
+        prepared["chapters"],
+        settings["voice"],
+        settings["rate_pct"],
+        settings["pitch_hz"],
+        source.stem,
+        doc_key=prepared.get("doc_key"),
+        make_m4b=settings["make_m4b"],
+    )
+    started = time.perf_counter()
+    outputs["mp3"].parent.mkdir(parents=True, exist_ok=True)
+    _place(result["mp3_path"], outputs["mp3"])
+    for chapter in result["chapter_mp3s"]:
+        remove_output(chapter["path"])
+    if result["m4b_path"]:
+        _place(result["m4b_path"], outputs["m4b"])
+    if result["skipped"]:
+        skipped = "\n\n".join(result["skipped"])
+        atomic_write_bytes(outputs["skipped"], skipped.encode("utf-8"))
+    result["timings"]["write"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def _stream(source: Path, outputs: dict, settings: dict) -> dict:
+    """
+    Thread stage for streamed conversion: extract, clean and synthesize one
+    document page by page (see streaming.py), writing the text of each part
+    as it is produced. Makes one MP3 without chapters.
+    """
+    started = time.perf_counter()
+    outputs["text"].parent.mkdir(parents=True, exist_ok=True)
+    text_tmp = outputs["text"].with_name(f".{outputs['text'].name}.part")
+    mp3_path = new_output_path()
+    in_flight = {}  # part index -> text, until the part is done
+    skipped = []
+
+    def _parts(text_out):
+        parts = stream_document(
+            source,
+            source.name,
+            settings["remove_headers"],
+            settings["remove_footnotes"],
+        )
+        for n, part in enumerate(parts):
+            text_out.write(f" {part}" if n else part)
+            in_flight[n] = part
+            yield part
+
+    def _on_part_done(index: int, ok: bool, done: int):
+        text = in_flight.pop(index)
+        if not ok:
+            skipped.append(text)
+
+    metrics = {}
+    try:
+        with open(text_tmp, "w", encoding="utf-8") as text_out:
+            with tempfile.TemporaryDirectory() as parts_dir:
+                results = synthesize_stream(
+                    _parts(text_out),
+                    settings["voice"],
+                    parts_dir,
+                    mp3_path,
+                    settings["rate_pct"],
+                    settings["pitch_hz"],
+                    concurrency=TTS_CONCURRENCY,
+                    max_concurrency=TTS_MAX_CONCURRENCY,
+                    cache=audio_cache(),
+                    metrics=metrics,
+                    part_timeout=TTS_PART_TIMEOUT,
+                    job_timeout=TTS_JOB_TIMEOUT,
+                    hedge_percentile=TTS_HEDGE_PERCENTILE,
+                    on_part_done=_on_part_done,
+                    name=source.stem,
+                    total_chars=estimate_chars(source, source.name),
+                )
+        if not results:
+            raise RuntimeError("No text to synthesize")
+        if not any(results):
+            raise RuntimeError("All chunks failed to synthesize.")
+        os.replace(text_tmp, outputs["text"])
+        _place(mp3_path, outputs["mp3"])
+        if skipped:
+            atomic_write_bytes(outputs["skipped"], "\n\n".join(skipped).encode("utf-8"))
+    except BaseException:
+        remove_output(mp3_path)
+        remove_output(text_tmp)
+        raise
+    return {
+        "chunks": len(results),
+        "skipped": skipped,
+        "m4b_path": None,
+        "metrics": metrics,
+        "timings": {"stream": round(time.perf_counter() - started, 3)},
+    }
+
+
+# --- Batch driver --------------------------------------------------------------
+
+
+def convert_files(
+    paths: Iterable[str],
+    out_dir: Optional[str] = None,
+    voice: str = DEFAULT_VOICE,
+    rate_pct: int = 0,
+    pitch_hz: int = 0,
+    remove_headers: bool = True,
+    remove_footnotes: bool = True,
+    make_m4b: bool = False,
+    workers: Optional[int] = None,
+    render_jobs: int = DEFAULT_RENDER_JOBS,
+    force: bool = False,
+    on_file_done: Optional[Callable[[dict], None]] = None,
+    stream: bool = False,
+) -> dict:
+    """
+    Convert every document under `paths` to an MP3 and a cleaned text file.
+
+    Preparation runs on `workers` processes (default: one per CPU) and each
+    book is handed to one of `render_jobs` synthesis threads as soon as it
+    is prepared, so extraction of later books overlaps synthesis of earlier
+    ones. Returns a JSON-friendly summary: per file its status ("converted",
+    "up_to_date", "failed"), outputs and seconds per stage, plus totals.
+    `on_file_done(entry)` is called as each file's entry is final.
+
+    With `stream`, each document instead goes through the streaming pipeline
+    on a synthesis thread: synthesis starts with its first pages, and the
+    book comes out as a single MP3 without chapters (so no M4B).
+    """
+    if stream and make_m4b:
+        raise ValueError("Streamed conversion makes no chapters, so no M4B")
+    started = time.perf_counter()
+    settings = {
+        "voice": voice,
+        "rate_pct": int(rate_pct),
+        "pitch_hz": int(pitch_hz),
+        "remove_headers": bool(remove_headers),
+        "remove_footnotes": bool(remove_footnotes),
+        "make_m4b": bool(make_m4b),
+        "stream": bool(stream),
+    }
+    entries = []
+
+    def _finish(entry: dict) -> None:
+        if on_file_done:
+            on_file_done(entry)
+
+    todo = []
+    for source in collect_inputs(paths):
+        outputs = output_paths(source, out_dir)
+        entry = {
+            "source": str(source),
+            "mp3": str(outputs["mp3"]),
+            "text": str(outputs["text"]),
+            "timings": {},
+        }
+        entries.append(entry)
+        if not force and is_up_to_date(source, outputs, settings):
+            entry["status"] = "up_to_date"
+            _finish(entry)
+        else:
+            todo.append((source, outputs, entry))
+
+    # Several documents already keep every preparation process busy; only a
+    # lone one has its PDF pages split over processes of its own
+    extract_workers = None if len(todo) == 1 else 1
+    prep_pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    render_pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, render_jobs))
+    with prep_pool, render_pool:
+        rendering = {}
+        if stream:
+            for source, outputs, entry in todo:
+                future = render_pool.submit(_stream, source, outputs, settings)
+                rendering[future] = (source, outputs, entry)
+            todo = []
+        preparing = {
+            prep_pool.submit(
+                _prepare,
+                str(source),
+                remove_headers,
+                remove_footnotes,
+                voice,
+                extract_workers,
+            ): (source, outputs, entry)
+            for source, outputs, entry in todo
+        }
+        for future in concurrent.futures.as_completed(preparing):
+            source, outputs, entry = preparing[future]
+            try:
+                prepared = future.result()
+            except Exception as e:
+                logger.exception("Preparing %s failed", source)
+                entry.update(status="failed", error=str(e) or type(e).__name__)
+                _finish(entry)
+                continue
+            meta = prepared["meta"]
+            entry["timings"].update(meta["timings"])
+            if meta.get("error") or not prepared["chunks"]:
+                error = meta.get("error") or "No text to synthesize"
+                entry.update(status="failed", error=error)
+                _finish(entry)
+                continue
+            outputs["text"].parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_bytes(outputs["text"], prepared["cleaned_text"].encode("utf-8"))
+            entry.update(chapters=meta["num_chapters"], chunks=meta["num_chunks"])
+            logger.info(
+                "Prepared %s: %d chapter(s), %d part(s)",
+                source,
+                meta["num_chapters"],
+                meta["num_chunks"],
+            )
+            future = render_pool.submit(_render, prepared, source, outputs, settings)
+            rendering[future] = (source, outputs, entry)
+
+        for future in concurrent.futures.as_completed(rendering):
+            source, outputs, entry = rendering[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.exception("Synthesizing %s failed", source)
+                entry.update(status="failed", error=str(e) or type(e).__name__)
+                _finish(entry)
+                continue
+            entry["timings"].update(result["timings"])
+            if stream:
+                entry["chunks"] = result["chunks"]
+            entry.update(
+                status="converted",
+                skipped_fragments=len(result["skipped"]),
+                requests_saved=result["metrics"].get("deduplicated", 0),
+                cache_hits=result["metrics"].get("cache_hits", 0),
+                telemetry=result["metrics"].get("telemetry"),
+            )
+            if result["m4b_path"]:
+                entry["m4b"] = str(outputs["m4b"])
+            stamp = json.dumps(_stamp(source, settings))
+            atomic_write_bytes(_stamp_path(outputs["mp3"]), stamp.encode("utf-8"))
+            logger.info("Converted %s -> %s", source, outputs["mp3"])
+            _finish(entry)
+
+    stages = {}
+    for entry in entries:
+        for stage, seconds in entry["timings"].items():
+            stages[stage] = round(stages.get(stage, 0.0) + seconds, 3)
+    statuses = [entry["status"] for entry in entries]
+    return {
+        "settings": settings,
+        "elapsed": round(time.perf_counter() - started, 3),
+        "totals": {
+            "files": len(entries),
+            "converted": statuses.count("converted"),
+            "up_to_date": statuses.count("up_to_date"),
+            "failed": statuses.count("failed"),
+            "stage_seconds": stages,
+        },
+        "files": entries,
+    }
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+import re
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from .extractors import PAGE_BREAK
+
+# Chapters shorter than this are folded into a neighbour; it also keeps
+# tables of contents (many headings a line apart) from looking like chapters.
+MIN_CHAPTER_CHARS = 1000
+
+# A heading line: "CHAPTER XII", "Chapter 3: The Shire", "Chapter One"
+_CHAPTER_HEADING_RE = re.compile(
+    r"^[ \t]*((?:CHAPTER|Chapter)\s+(?:[IVXLCDM]+|\d+|[A-Z][a-z]+(?:-[a-z]+)?)\b"
+    r"[^\n]{0,80})$",
+    re.MULTILINE,
+)
+_HEADING_KEY_RE = re.compile(r"^\s*chapter\s+(\S+?)[\s.:]*(?:\s|$)", re.IGNORECASE)
+_ROMAN_RE = re.compile(r"^[IVXLCDM]+$")
+
+
+class Chapter(NamedTuple):
+    title: str
+    text: str
+
+
+def chapters_from_outline(raw_text: str, toc: Sequence[Tuple[int, str, int]]) -> List[Chapter]:
+    """
+    Split extracted PDF text on the top level of its outline.
+
+    `toc` holds PyMuPDF-style [level, title, page] entries with 1-based pages;
+    `raw_text` must still contain the extractor's page breaks. Entries that
+    share a start page are merged. Returns [] if the outline is unusable.
+    """
+    entries = [e for e in toc if len(e) >= 3 and int(e[2]) >= 1]
+    if not entries:
+        return []
+    top = min(int(e[0]) for e in entries)
+    starts: List[Tuple[int, str]] = []
+    for level, title, page in (e[:3] for e in entries):
+        if int(level) != top:
+            continue
+        title = " ".join(str(title).split()) or f"Chapter {len(starts) + 1}"
+        if starts and starts[-1][0] >= page - 1:
+            continue  # same start page (or out of order): keep the first
+        starts.append((int(page) - 1, title))
+
+    pages = raw_text.split(PAGE_BREAK)
+    spans = []
+    for n, (first, title) in enumerate(starts):
+        last = starts[n + 1][0] if n + 1 < len(starts) else len(pages)
+        if first >= len(pages):
+            break
+        spans.append((title, PAGE_BREAK.join(pages[first:last])))
+    front = PAGE_BREAK.join(pages[: starts[0][0]])
+    return _finish(front, spans, PAGE_BREAK)
+
+
+def chapters_from_headings(raw_text: str) -> List[Chapter]:
+    """
+    Split text on "CHAPTER n" style heading lines.
+
+    Headings crowded together (a table of contents) are skipped, except a
+    first chapter that directly follows them, and only the first occurrence
+    of each chapter number counts, so running headers that repeat the
+    chapter title on every page do not start new chapters.
+    """
+    # Group headings less than MIN_CHAPTER_CHARS apart into runs
+    runs: List[list] = []
+    for m in _CHAPTER_HEADING_RE.finditer(raw_text):
+        if runs and m.start() - runs[-1][-1].end() < MIN_CHAPTER_CHARS:
+            runs[-1].append(m)
+        else:
+            runs.append([m])
+
+    kept = []
+    seen = set()
+    for run in runs:
+        # Only the last heading of a run has a chapter body after it. In a
+        # contents list that is just its final entry, unless the real first
+        # chapter follows directly: its number restarts the list or is
+        # written differently ("CHAPTER I" after "Chapter 1 ... Chapter 9").
+        m = run[-1]
+        keys = [_heading_key(h.group(1)) for h in run]
+        if len(run) > 1 and keys[-1] != keys[0]:
+            if keys[-1] in keys[:-1] or _key_kind(keys[-1]) == _key_kind(keys[-2]):
+                continue
+        if keys[-1] in seen:
+            continue
+        seen.add(keys[-1])
+        kept.append(m)
+    if not kept:
+        return []
+
+    spans = []
+    for n, m in enumerate(kept):
+        end = kept[n + 1].start() if n + 1 < len(kept) else len(raw_text)
+        spans.append((_heading_title(raw_text, m), raw_text[m.start() : end]))
+    return _finish(raw_text[: kept[0].start()], spans, "")
+
+
+def _heading_key(heading: str) -> str:
+    m = _HEADING_KEY_RE.match(heading)
+    return (m.group(1) if m else heading).upper()
+
+
+def _heading_title(raw_text: str, m: "re.Match") -> str:
+    """The heading line, plus the next line when that is a short subtitle."""
+    title = " ".join(m.group(1).split())
+    if _heading_key(title) == title.split()[-1].upper():
+        following = raw_text[m.end() :].lstrip("\n").split("\n", 1)[0].strip()
+        if following and len(following) <= 60 and not following.endswith("."):
+            title = f"{title}: {following}"
+    return title
+
+
+def _key_kind(key: str) -> str:
+    if key.isdigit():
+        return "number"
+    return "roman" if _ROMAN_RE.match(key) else "word"
+
+
+def split_into_chapters(
+    raw_text: str, toc: Optional[Sequence[Tuple[int, str, int]]] = None
+) -> List[Chapter]:
+    """
+    Chapters of a document: from the PDF outline when there is one, else
+    from heading lines, else the whole text as a single chapter.
+    """
+    if not raw_text or not raw_text.strip():
+        return []
+    chapters = chapters_from_outline(raw_text, toc) if toc else []
+    if len(chapters) < 2:
+        chapters = chapters_from_headings(raw_text)
+    if len(chapters) < 2:
+        chapters = [Chapter("", raw_text)]
+    return chapters
+
+
+def _finish(front: str, spans: List[Tuple[str, str]], sep: str) -> List[Chapter]:
+    """
+    Attach short front matter and short chapters to their neighbours; `sep`
+    is what originally stood between consecutive spans.
+    """
+    chapters: List[Chapter] = []
+    if len(front.strip()) >= MIN_CHAPTER_CHARS:
+        chapters.append(Chapter("Opening", front))
+    elif front.strip() and spans:
+        spans[0] = (spans[0][0], front + sep + spans[0][1])
+    for title, text in spans:
+        if chapters and len(chapters[-1].text.strip()) < MIN_CHAPTER_CHARS:
+            prev = chapters.pop()
+            chapters.append(Chapter(prev.title, prev.text + sep + text))
+        else:
+            chapters.append(Chapter(title, text))
+    if len(chapters) > 1 and len(chapters[-1].text.strip()) < MIN_CHAPTER_CHARS:
+        last = chapters.pop()
+        prev = chapters.pop()
+        chapters.append(Chapter(prev.title, prev.text + sep + last.text))
+    return chapters
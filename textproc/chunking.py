@@ -94,6 +94,75 @@ def smart_split_into_chunks(text: str, max_length: int = 2200) -> List[str]:
         chunks.append(cur)
     return chunks
 
+def split_into_tts_parts(text: str, max_length: int = 1800) -> List[str]:
+    """
+    Build TTS request parts of near-uniform size that never exceed max_length,
+    breaking only between sentences (or, inside an over-long sentence, between
+    words). Avoids both mid-word splices and tiny trailing requests.
+    """
+    units: List[str] = []
+    for s in split_into_sentences(text):
+        units.extend(sentence_units(s, max_length))
+    return _balanced_pack(units, max_length)
+
+
+def sentence_units(sentence: str, max_length: int) -> List[str]:
+    """The sentence, or balanced word runs of it if it is over max_length."""
+    if len(sentence) <= max_length:
+        return [sentence]
+    words: List[str] = []
+    for w in sentence.split():
+        # A single "word" over the limit (e.g. a URL run) is the only
+        # thing ever sliced by characters.
+        words.extend(w[i : i + max_length] for i in range(0, len(w), max_length))
+    return _balanced_pack(words, max_length)
+
+
+def _balanced_pack(units: List[str], max_length: int) -> List[str]:
+    """
+    Join units with spaces into as few pieces <= max_length as possible, of
+    sizes as even as possible: the pieces are packed greedily up to the
+    smallest cap that still needs no more pieces than packing up to
+    max_length does, so no piece is larger than it must be and the slack
+    is not all left to the last one.
+    """
+    if not units:
+        return []
+    lengths = [len(u) for u in units]
+    needed = _pieces_needed(lengths, max_length)
+    lo, hi = min(max(lengths), max_length), max_length
+    while lo < hi:
+        cap = (lo + hi) // 2
+        if _pieces_needed(lengths, cap) <= needed:
+            hi = cap
+        else:
+            lo = cap + 1
+    pieces: List[str] = []
+    cur: List[str] = []
+    cur_len = 0
+    for u in units:
+        add = len(u) + (1 if cur else 0)
+        if cur and cur_len + add > lo:
+            pieces.append(" ".join(cur))
+            cur, cur_len, add = [], 0, len(u)
+        cur.append(u)
+        cur_len += add
+    pieces.append(" ".join(cur))
+    return pieces
+
+
+def _pieces_needed(lengths: List[int], cap: int) -> int:
+    """Pieces that packing units of these lengths up to `cap` produces."""
+    pieces, cur = 0, -1
+    for n in lengths:
+        if cur >= 0 and cur + 1 + n <= cap:
+            cur += 1 + n
+        else:
+            pieces += 1
+            cur = n
+    return pieces
+
+
 def get_text_stats(text: str) -> dict:
     words = len(text.split())
     characters = len(text)
@@ -15,7 +15,8 @@ _HYPHEN_RE = re.compile(_HYPHEN_CHARS)
 
 # Line break hyphenation patterns
 _HYPHEN_LINEBREAK_RE = re.compile(rf"([A-Za-z]){_HYPHEN_CHARS}\n([A-Za-z])")
-_HYPHEN_MIDLINE_RE = re.compile(rf"(\b\w+){_HYPHEN_CHARS}\s+(\w+\b)")
+# (the continuation starts with a letter: "exam-\n7" is a word and a page number)
+_HYPHEN_MIDLINE_RE = re.compile(rf"(\b\w+){_HYPHEN_CHARS}\s+([^\W\d_]\w*\b)")
 _HYPHEN_SUFFIX_RE = re.compile(
     rf"([a-z]){_HYPHEN_CHARS}(ture|tion|ment|ness|ing|ed|er|est|ly|ity|ous|ive|ful|less|able|ible)(\s|$)",
     re.IGNORECASE,
@@ -389,3 +390,47 @@ def _remove_midtext_roman_runs(text: str) -> str:
     if not text:
         return ""
     return _ROMAN_RUN_RE.sub(" ", text)
+
+
+# ============================================================================
+# CLEANING STAGES
+# ============================================================================
+
+
+def clean_page_structure(
+    text: str, remove_running_headers: bool = True, remove_bottom_footnotes: bool = True
+) -> str:
+    """
+    Structural cleaning: quotes, line-break hyphenation, page numbers, running
+    headers and footnotes. Headers, page numbers and footnote regions are
+    found per page (on PAGE_BREAK), so it can also run on one page at a time.
+    """
+    # 1. Perform initial structural cleaning on the raw text.
+    text = remove_all_quotes(text)
+    text = fix_line_break_hyphenation(text)
+    text = remove_bottom_page_numbers(text)
+
+    # 2.
+    if remove_running_headers:
+        text = strip_firstline_headers(text)
+
+    # 3.
+    if remove_bottom_footnotes:
+        text = remove_footnote_markers(text)
+        text = remove_references(text)
+        text = remove_citation_lines(text)
+    return text
+
+
+def clean_content(text: str) -> str:
+    """Join paragraphs, normalize characters and punctuation, then flatten."""
+    # 4. Clean the actual content.
+    text = join_paragraphs_smart(text)
+    text = _clean_special_characters(text)
+    text = fix_punctuation_spacing(text)
+
+    # 5. Perform a final validation check.
+    text = _remove_midtext_roman_runs(text)
+
+    # 6. Finally, flatten the text.
+    return final_flatten(text)
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import collections
+import contextlib
+import heapq
+import itertools
+import time
+from typing import List, Optional, Tuple
+
+
+class AIMDLimiter:
+    """
+    Adaptive cap on in-flight TTS requests (additive increase, multiplicative
+    decrease), shared by every part of a job.
+
+    Each healthy completion adds `increase / window`, so a full window of
+    successes grows the limit by `increase`. "Healthy" means the call
+    succeeded and its per-character latency stayed within `latency_tolerance`
+    of the best smoothed latency seen so far; slow successes hold the window
+    steady. A failure or timeout multiplies the limit by `decrease`, at most
+    once per window: failures of requests that started before the last
+    back-off are the same congestion event and are not counted twice.
+
+    Waiters are served lowest `priority` first (FIFO among equals); the
+    engine passes the part index so the start of a book is always rendered
+    first, retries included.
+
+    With an `upstream` (a ScheduledJob), a request admitted by this window
+    then waits for a slot of the process-wide scheduler; latency is timed
+    from that grant, so queueing behind other jobs never looks like a slow
+    service.
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 16,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+        upstream=None,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.upstream = upstream
+        self.in_flight = 0
+        self.successes = 0
+        self.failures = 0
+        self.backoffs = 0
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._t0 = time.monotonic()
+        self._last_backoff = float("-inf")
+        self._ewma: Optional[float] = None
+        self._best: Optional[float] = None
+        self.history: List[Tuple[float, int]] = [(0.0, self.window)]
+
+    @property
+    def window(self) -> int:
+        return int(self.limit)
+
+    # --- slot accounting ---------------------------------------------------
+
+    async def acquire(self, priority: int = 0) -> float:
+        """Wait for a free slot; returns the monotonic time it was granted."""
+        if self.in_flight < self.window and not self._waiters:
+            self.in_flight += 1
+            return time.monotonic()
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()  # granted just as we were cancelled
+            # otherwise the cancelled future is skipped by _wake()
+            raise
+        return time.monotonic()
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < self.window:
+            _, _, fut = heapq.heappop(self._waiters)
+            if fut.done():
+                continue
+            self.in_flight += 1
+            fut.set_result(None)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, chars: int = 0, priority: int = 0):
+        """Hold a slot for one request and feed its outcome back."""
+        await self.acquire(priority)
+        try:
+            if self.upstream is not None:
+                await self.upstream.acquire(chars, priority)
+            started = time.monotonic()
+            try:
+                yield
+            except asyncio.CancelledError:
+                raise  # a cancelled request says nothing about the service
+            except BaseException:
+                self.record(False, time.monotonic() - started, chars, started)
+                raise
+            else:
+                self.record(True, time.monotonic() - started, chars, started)
+            finally:
+                if self.upstream is not None:
+                    self.upstream.release()
+        finally:
+            self.release()
+
+    # --- control law -------------------------------------------------------
+
+    def record(self, ok: bool, latency: float, chars: int = 0, started: float = 0.0):
+        before = self.window
+        if ok:
+            self.successes += 1
+            healthy = self._healthy(latency / max(1, chars))
+            # Completions from before the last back-off don't reflect the new window
+            if healthy and started >= self._last_backoff:
+                self.limit = min(
+                    float(self.max_limit), self.limit + self.increase / self.limit
+                )
+        else:
+            self.failures += 1
+            if started >= self._last_backoff:
+                self.limit = max(float(self.min_limit), self.limit * self.decrease)
+                self._last_backoff = time.monotonic()
+                self.backoffs += 1
+        if self.window != before:
+            self.history.append((round(time.monotonic() - self._t0, 3), self.window))
+            self._wake()
+
+    def _healthy(self, per_char: float) -> bool:
+        self._ewma = per_char if self._ewma is None else 0.8 * self._ewma + 0.2 * per_char
+        if self._best is None or self._ewma < self._best:
+            self._best = self._ewma
+        return self._ewma <= self.latency_tolerance * self._best
+
+    def snapshot(self) -> dict:
+        return {
+            "window": self.window,
+            "peak_window": max(w for _, w in self.history),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "successes": self.successes,
+            "failures": self.failures,
+            "backoffs": self.backoffs,
+            "history": list(self.history),
+        }
+
+
+class LatencyTracker:
+    """
+    Recent per-character latency of successful requests in one job.
+
+    Used to decide when a slow request deserves a hedge: a part of `chars`
+    characters is "late" once it has run longer than the chosen percentile of
+    seconds-per-character times its own length.
+    """
+
+    def __init__(self, min_samples: int = 8, max_samples: int = 512):
+        self.min_samples = min_samples
+        self._samples = collections.deque(maxlen=max_samples)
+
+    def observe(self, seconds: float, chars: int) -> None:
+        self._samples.append(seconds / max(1, chars))
+
+    def hedge_delay(self, percentile: float, chars: int) -> Optional[float]:
+        """Seconds to wait before hedging, or None until enough samples exist."""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, int(len(ordered) * percentile / 100.0))
+        return ordered[idx] * max(1, chars)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Disk-backed delivery of finished audiobooks.
+
+Handing a file to st.download_button or st.audio copies all of it into
+Streamlit's in-memory media store on every rerun, so a 10-hour book would
+sit in the server's memory several times over. Instead, a small HTTP server
+streams files from the outputs directory in fixed-size blocks (with Range
+support, so players can seek), and the page only links to them.
+
+Links are signed with a secret shared by every process on the host, so
+only files this app handed out can be fetched and any app process's server
+can serve them.
+"""
+import hashlib
+import hmac
+import http.server
+import logging
+import os
+import re
+import threading
+import urllib.parse
+from pathlib import Path
+from typing import Optional, Tuple
+
+from .storage import atomic_write_bytes, data_dir
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_PORT = int(os.environ.get("BILBOT_DOWNLOAD_PORT", 8502))
+# Where browsers reach that server, e.g. behind a reverse proxy; by default
+# the host of the app page on DOWNLOAD_PORT
+DOWNLOAD_BASE_URL = os.environ.get("BILBOT_DOWNLOAD_URL")
+
+# Bytes read and sent at a time
+_BLOCK_SIZE = 64 * 1024
+
+_CONTENT_TYPES = {".mp3": "audio/mpeg", ".m4b": "audio/mp4", ".txt": "text/plain"}
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def _secret() -> bytes:
+    path = data_dir("delivery") / "secret"
+    try:
+        return path.read_bytes()
+    except OSError:
+        pass
+    atomic_write_bytes(path, os.urandom(32).hex().encode("ascii"))
+    return path.read_bytes()
+
+
+_secret_value: Optional[bytes] = None
+_secret_lock = threading.Lock()
+
+
+def _signature(name: str) -> str:
+    global _secret_value
+    with _secret_lock:
+        if _secret_value is None:
+            _secret_value = _secret()
+    digest = hmac.new(_secret_value, name.encode("utf-8"), hashlib.sha256)
+    return digest.hexdigest()[:32]
+
+
+def file_url(path: str, file_name: Optional[str] = None, base_url: str = "") -> str:
+    """
+    Signed link to a file in the outputs directory; with `file_name` the
+    browser saves it under that name, otherwise it is served inline (for
+    a player).
+    """
+    name = os.path.basename(path)
+    query = {"sig": _signature(name)}
+    if file_name:
+        query["download"] = file_name
+    return f"{base_url.rstrip('/')}/files/{name}?{urllib.parse.urlencode(query)}"
+
+
+def _resolve(url_path: str) -> Optional[Tuple[Path, dict]]:
+    parsed = urllib.parse.urlsplit(url_path)
+    if not parsed.path.startswith("/files/"):
+        return None
+    name = urllib.parse.unquote(parsed.path[len("/files/") :])
+    query = dict(urllib.parse.parse_qsl(parsed.query))
+    if "/" in name or name.startswith(".") or not hmac.compare_digest(
+        query.get("sig", ""), _signature(name)
+    ):
+        return None
+    return data_dir("outputs") / name, query
+
+
+class _FileHandler(http.server.BaseHTTPRequestHandler):
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body: bool):
+        found = _resolve(self.path)
+        if found is None:
+            self.send_error(404)
+            return
+        path, query = found
+        try:
+            f = open(path, "rb")
+        except OSError:
+            self.send_error(404)
+            return
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            start, end = 0, size - 1
+            status = 200
+            match = _RANGE_RE.match(self.headers.get("Range", ""))
+            if match and size:
+                first, last = match.groups()
+                if first:
+                    start, end = int(first), min(int(last or end), end)
+                elif last:
+                    start = max(0, size - int(last))
+                if start > end:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.end_headers()
+                    return
+                status = 206
+            self.send_response(status)
+            self.send_header(
+                "Content-Type",
+                _CONTENT_TYPES.get(path.suffix.lower(), "application/octet-stream"),
+            )
+            self.send_header("Content-Length", str(max(0, end - start + 1)))
+            self.send_header("Accept-Ranges", "bytes")
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            download = query.get("download")
+            if download:
+                quoted = urllib.parse.quote(download)
+                self.send_header(
+                    "Content-Disposition", f"attachment; filename*=UTF-8''{quoted}"
+                )
+            self.end_headers()
+            if not send_body:
+                return
+            f.seek(start)
+            left = end - start + 1
+            try:
+                while left > 0:
+                    block = f.read(min(_BLOCK_SIZE, left))
+                    if not block:
+                        break
+                    self.wfile.write(block)
+                    left -= len(block)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the player skipped elsewhere or the download was cancelled
+
+    def log_message(self, format, *args):
+        logger.debug("delivery: " + format, *args)
+
+
+def serve_files(
+    port: int = DOWNLOAD_PORT, host: str = ""
+) -> Optional[http.server.HTTPServer]:
+    """
+    Serve signed links to the outputs directory from a daemon thread; returns
+    the server, or None if the port is taken (another app process serves
+    them, which works just as well: the signing secret is shared).
+    """
+    try:
+        server = http.server.ThreadingHTTPServer((host, port), _FileHandler)
+    except OSError as e:
+        logger.warning("Download server on port %d not started: %s", port, e)
+        return None
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="delivery", daemon=True)
+    thread.start()
+    logger.info("Serving finished audiobooks on port %d", port)
+    return server
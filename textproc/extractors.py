@@ -1,86 +1,299 @@
 # -*- coding: utf-8 -*-
+import concurrent.futures
+import logging
+import multiprocessing
+import os
 import re
-from typing import Optional
+import tempfile
+import threading
+from typing import Iterable, Iterator, List, Optional, Set, Tuple, Union
 
+from .page_cache import page_cache, page_fingerprint
+
+# A document is its bytes, or the path of a file holding them; PDFs given as
+# a path are opened from disk, so no copy of the file is held in memory
+Source = Union[bytes, str, "os.PathLike[str]"]
+
+logger = logging.getLogger(__name__)
 
 PAGE_BREAK = "\f"
 
-# Pre-compiled patterns for performance
-_BROKEN_WORDS = re.compile(
-    r"\b(t\s+he|w\s+as|i\s+s|a\s+re|h\s+as|h\s+ad|w\s+ith|f\s+rom|t\s+hat|t\s+his)\b",
-    re.IGNORECASE,
+# Processes extracting one long PDF; documents get one per
+# MIN_PAGES_PER_WORKER pages at most, so short ones stay in-process
+EXTRACT_WORKERS = int(os.environ.get("BILBOT_PDF_EXTRACT_WORKERS", 0)) or (
+    os.cpu_count() or 1
+)
+MIN_PAGES_PER_WORKER = 50
+
+# Words PDF extraction often splits after their first letter ("t he",
+# "w as"). More can be listed, one per line, in the file named by
+# BILBOT_SPACING_WORDS or added with add_spacing_words(); they are looked up,
+# not matched one by one, so a long list costs no more per character.
+_SPACING_WORDS = (
+    "the was is are has had with from that this were have been what and for "
+    "not but of in to at on it as by my we he me no do if"
+).split()
+SPACING_WORDS_FILE = os.environ.get("BILBOT_SPACING_WORDS")
+
+# One scan finds both missing spaces (a lower-case letter or sentence end
+# directly before a capital) and candidate broken words (a single-letter
+# word followed by whitespace and the word it may belong to)
+_SPACING_RE = re.compile(r"(?<=[a-z.!?])(?=[A-Z])|\b([A-Za-z])\s+(?=([A-Za-z]+)\b)")
+_SPACING_WORD_RE = re.compile(r"[A-Za-z]{2,}")
+
+# "a" and "I" are words of their own: "a way" is not "away". After them a
+# fragment is kept apart when it is a word itself: one of these short words,
+# a listed spacing word, or the second word of a common "a X" / "I X" phrase
+# whose joined form is also a word. Any other fragment ("A nother",
+# "I mportant") is rejoined when the joined word is listed.
+_ONE_LETTER_WORDS = frozenset("aAI")
+_TWO_LETTER_WORDS = frozenset(
+    "am an as at be by do go he if in is it me my no of on or so to up us we".split()
+)
+_PHRASE_WORDS = frozenset(
+    "way long mount head side part round cross lone live wake ward muse gain "
+    "float broad board shore stray void maze new rise deal rate ran".split()
 )
-_WORD_BOUNDARIES = re.compile(r"([a-z])([A-Z])")
-_SENTENCE_BOUNDARIES = re.compile(r"([.!?])([A-Z])")
-
-# Additional broken-word fixes compiled once (items not already covered by _BROKEN_WORDS)
-_BROKEN_WORD_FIXES = [
-    (re.compile(r"\bw\s+ere\b", re.IGNORECASE), "were"),
-    (re.compile(r"\bh\s+ave\b", re.IGNORECASE), "have"),
-    (re.compile(r"\bb\s+een\b", re.IGNORECASE), "been"),
-    (re.compile(r"\bw\s+hat\b", re.IGNORECASE), "what"),
-    (re.compile(r"\ba\s+nd\b", re.IGNORECASE), "and"),
-    (re.compile(r"\bf\s+or\b", re.IGNORECASE), "for"),
-    (re.compile(r"\bn\s+ot\b", re.IGNORECASE), "not"),
-    (re.compile(r"\bb\s+ut\b", re.IGNORECASE), "but"),
-    (re.compile(r"\bo\s+f\b", re.IGNORECASE), "of"),
-    (re.compile(r"\bi\s+n\b", re.IGNORECASE), "in"),
-    (re.compile(r"\bt\s+o\b", re.IGNORECASE), "to"),
-    (re.compile(r"\ba\s+t\b", re.IGNORECASE), "at"),
-    (re.compile(r"\bo\s+n\b", re.IGNORECASE), "on"),
-    (re.compile(r"\bi\s+t\b", re.IGNORECASE), "it"),
-    (re.compile(r"\ba\s+s\b", re.IGNORECASE), "as"),
-    (re.compile(r"\bb\s+y\b", re.IGNORECASE), "by"),
-    (re.compile(r"\bm\s+y\b", re.IGNORECASE), "my"),
-    (re.compile(r"\bw\s+e\b", re.IGNORECASE), "we"),
-    (re.compile(r"\bh\s+e\b", re.IGNORECASE), "he"),
-    (re.compile(r"\bm\s+e\b", re.IGNORECASE), "me"),
-    (re.compile(r"\bn\s+o\b", re.IGNORECASE), "no"),
-    (re.compile(r"\bd\s+o\b", re.IGNORECASE), "do"),
-    (re.compile(r"\bi\s+f\b", re.IGNORECASE), "if"),
-]
+
+_spacing_words: Optional[Set[str]] = None
+_spacing_words_lock = threading.Lock()
+
+
+def _load_spacing_words() -> Set[str]:
+    words = set(_SPACING_WORDS)
+    if SPACING_WORDS_FILE:
+        try:
+            with open(SPACING_WORDS_FILE, encoding="utf-8") as f:
+                added = _add_words(words, f)
+            logger.info("Loaded %d spacing words from %s", added, SPACING_WORDS_FILE)
+        except OSError as e:
+            logger.warning("Could not read spacing words %s: %s", SPACING_WORDS_FILE, e)
+    return words
+
+
+def _add_words(words: Set[str], lines: Iterable[str]) -> int:
+    before = len(words)
+    for line in lines:
+        word = line.strip()
+        if _SPACING_WORD_RE.fullmatch(word):
+            words.add(word.lower())
+    return len(words) - before
+
+
+def spacing_words() -> Set[str]:
+    """Words fix_extraction_spacing rejoins, loaded on first use."""
+    global _spacing_words
+    with _spacing_words_lock:
+        if _spacing_words is None:
+            _spacing_words = _load_spacing_words()
+        return _spacing_words
+
+
+def add_spacing_words(words: Iterable[str]) -> int:
+    """
+    Also rejoin these words when split after their first letter; entries
+    that are not plain ASCII words of two letters or more are ignored.
+    Returns how many were new.
+    """
+    table = spacing_words()
+    with _spacing_words_lock:
+        return _add_words(table, words)
 
 
 def fix_extraction_spacing(text: str) -> str:
-    """Fix common spacing issues from PDF extraction."""
+    """
+    Fix common spacing issues from PDF extraction in one pass over the text:
+    broken words ("w as" -> "was", case kept; after "a" or "I" only when the
+    rest is not a known word, so "a way" stays but "A nother" is joined) are
+    rejoined and a space is put back where a word or sentence runs into a
+    capital ("endThe", "end.The").
+    """
     if not text:
         return ""
 
-    # First pass: collapse spaces in the most common broken words handled by _BROKEN_WORDS.
-    # Since this alternation matches forms like "t he" or "w as", removing spaces in the match yields the intended word.
-    text = _BROKEN_WORDS.sub(lambda m: m.group(0).replace(" ", ""), text)
+    words = spacing_words()
+    out = []
+    pos = 0
+    for m in _SPACING_RE.finditer(text):
+        start = m.start()
+        if start < pos:
+            continue  # inside a word already rejoined
+        head = m.group(1)
+        if head is None:
+            out.append(text[pos:start])
+            out.append(" ")
+            pos = start
+            continue
+        rest = m.group(2)
+        if (head + rest).lower() in words and not (
+            head in _ONE_LETTER_WORDS and _is_word(rest, words)
+        ):
+            out.append(text[pos:start])
+            out.append(head)
+            out.append(rest)
+            pos = m.end() + len(rest)
+    if not out:
+        return text
+    out.append(text[pos:])
+    return "".join(out)
+
+
+def _is_word(fragment: str, words: Set[str]) -> bool:
+    fragment = fragment.lower()
+    return (
+        fragment in _TWO_LETTER_WORDS or fragment in _PHRASE_WORDS or fragment in words
+    )
+
+
+def _page_text(page, page_num: int) -> str:
+    # Try text extraction with different methods
+    txt = page.get_text("text") or ""
+
+    # If text seems bad, try blocks method
+    if len(txt.split()) < 10 and page_num < 3:
+        blocks = page.get_text("blocks")
+        txt = " ".join(block[4] for block in blocks if block[6] == 0)
+
+    return txt.strip()
+
+
+def read_head(source: Source, size: int) -> bytes:
+    """The first `size` bytes of a document."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[:size])
+    with open(source, "rb") as f:
+        return f.read(size)
+
+
+def source_size(source: Source) -> int:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    return os.path.getsize(source)
+
+
+def _open_pdf(source: Source):
+    import fitz  # PyMuPDF
 
-    # Second pass: handle the rest via compiled patterns
-    for pat, replacement in _BROKEN_WORD_FIXES:
-        text = pat.sub(replacement, text)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(os.fspath(source))
 
-    # Fix jammed words - add spaces at obvious boundaries using compiled patterns
-    text = _WORD_BOUNDARIES.sub(r"\1 \2", text)
-    text = _SENTENCE_BOUNDARIES.sub(r"\1 \2", text)
 
-    return text
+def _cached_page_texts(doc, first: int, last: int) -> Iterator[Tuple[str, bool]]:
+    """
+    (text, from_cache) of pages [first, last): pages whose content was
+    extracted before, in this file or another version of it, come from the
+    page cache.
+    """
+    cache = page_cache()
+    memo = {}
+    for page_num in range(first, last):
+        page = doc[page_num]
+        key = None
+        if cache.enabled:
+            try:
+                key = page_fingerprint(doc, page, page_num, memo)
+            except Exception as e:
+                logger.debug("No fingerprint for page %d: %s", page_num + 1, e)
+        text = cache.get(key) if key else None
+        if text is not None:
+            yield text, True
+            continue
+        text = _page_text(page, page_num)
+        if key:
+            cache.put(key, text)
+        yield text, False
 
 
-def extract_with_pymupdf(file_bytes: bytes) -> str:
-    """Extract with PyMuPDF/fitz."""
+def _extract_page_range(source: Source, first: int, last: int) -> Tuple[List[str], int]:
+    """
+    Text of pages [first, last) and how many came from the page cache;
+    `source` is a file path or the PDF bytes.
+    """
+    with _open_pdf(source) as doc:
+        pages = list(_cached_page_texts(doc, first, last))
+    return [text for text, _ in pages], sum(cached for _, cached in pages)
+
+
+def _page_ranges(page_count: int, workers: int) -> List[Tuple[int, int]]:
+    # A few shards per worker, so one slow (image-heavy) stretch of pages
+    # doesn't leave the other workers idle at the end
+    shards = min(workers * 4, max(1, page_count // MIN_PAGES_PER_WORKER))
+    bounds = [page_count * i // shards for i in range(shards + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+
+def _extract_pages_parallel(
+    source: Source, page_count: int, workers: int
+) -> Tuple[List[str], int]:
+    """
+    Extract page ranges on a process pool. Workers open the document from
+    its file (a temporary copy if given bytes) instead of each receiving the
+    whole PDF.
+    """
+    if not isinstance(source, (bytes, bytearray, memoryview)):
+        return _map_page_ranges(os.fspath(source), page_count, workers)
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(source)
+        return _map_page_ranges(path, page_count, workers)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _map_page_ranges(path: str, page_count: int, workers: int) -> Tuple[List[str], int]:
+    # Spawned, not forked: callers (the job worker) run other threads
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(workers, mp_context=context) as pool:
+        ranges = _page_ranges(page_count, workers)
+        pages = []
+        cached = 0
+        for shard, shard_cached in pool.map(
+            _extract_page_range,
+            [path] * len(ranges),
+            [first for first, _ in ranges],
+            [last for _, last in ranges],
+        ):
+            pages.extend(shard)
+            cached += shard_cached
+        return pages, cached
+
+
+def extract_with_pymupdf(source: Source, workers: Optional[int] = None) -> str:
+    """
+    Extract with PyMuPDF/fitz.
+
+    Long documents are split into page ranges extracted on up to `workers`
+    processes (default EXTRACT_WORKERS); pages keep their order either way.
+    Pages already in the page cache (see page_cache.py) are not extracted
+    again.
+    """
     try:
         import fitz  # PyMuPDF
     except Exception:
         return ""
 
     try:
-        pages = []
-        with fitz.open(stream=file_bytes, filetype="pdf") as doc:
-            for page_num, page in enumerate(doc):
-                # Try text extraction with different methods
-                txt = page.get_text("text") or ""
-
-                # If text seems bad, try blocks method
-                if len(txt.split()) < 10 and page_num < 3:
-                    blocks = page.get_text("blocks")
-                    txt = " ".join(block[4] for block in blocks if block[6] == 0)
-
-                pages.append(txt.strip())
+        with _open_pdf(source) as doc:
+            page_count = doc.page_count
+        workers = min(
+            EXTRACT_WORKERS if workers is None else workers,
+            page_count // MIN_PAGES_PER_WORKER,
+        )
+        pages = None
+        if workers > 1:
+            try:
+                pages, cached = _extract_pages_parallel(source, page_count, workers)
+            except Exception as e:
+                logger.warning("Parallel PDF extraction failed, retrying in-process: %s", e)
+        if pages is None:
+            pages, cached = _extract_page_range(source, 0, page_count)
+        if cached:
+            logger.info("Extracted %d pages, %d from the page cache", page_count, cached)
 
         result = (PAGE_BREAK + "\n").join(pages).strip()
         # Fix spacing issues
@@ -88,3 +301,32 @@ def extract_with_pymupdf(file_bytes: bytes) -> str:
         return result
     except Exception:
         return ""
+
+
+def iter_pages_with_pymupdf(source: Source) -> Iterator[str]:
+    """
+    Extract with PyMuPDF/fitz one page at a time, for streaming: pages are
+    yielded as they are read (spacing already fixed), nothing is joined.
+    """
+    try:
+        import fitz  # PyMuPDF
+    except Exception:
+        return
+
+    with _open_pdf(source) as doc:
+        for text, _ in _cached_page_texts(doc, 0, doc.page_count):
+            yield fix_extraction_spacing(text)
+
+
+def extract_outline_with_pymupdf(source: Source) -> List[List]:
+    """PDF outline as PyMuPDF [level, title, page] entries (pages are 1-based)."""
+    try:
+        import fitz  # PyMuPDF
+    except Exception:
+        return []
+
+    try:
+        with _open_pdf(source) as doc:
+            return doc.get_toc(simple=True)
+    except Exception:
+        return []
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, Sequence
+
+from .storage import data_dir
+
+# A running job whose worker has not checked in for this long is presumed
+# dead (crash, OOM kill, host restart) and handed to the next free worker.
+JOB_STALE_S = 60.0
+# Give up on a job after this many workers have died while running it.
+MAX_ATTEMPTS = 3
+
+ACTIVE = ("queued", "running")
+FINISHED = ("done", "failed", "cancelled")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    key TEXT,
+    status TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    heartbeat REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    pid INTEGER,
+    heartbeat REAL NOT NULL
+);
+"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once the UI has asked for it to stop."""
+
+
+class JobQueue:
+    """
+    Persistent job queue shared by the UI and the worker processes.
+
+    One SQLite database in the data directory; every call opens its own
+    short-lived connection, so the queue is safe to use from any thread or
+    process. Jobs move queued -> running -> done | failed | cancelled.
+    Workers heartbeat while they run a job; a job whose worker goes quiet for
+    JOB_STALE_S is claimed again (synthesis then resumes from its manifests).
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path or data_dir("queue") / "jobs.sqlite3")
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    # --- UI side -----------------------------------------------------------
+
+    def submit(self, kind: str, spec: dict, key: Optional[str] = None) -> str:
+        """
+        Queue a job and return its id. With a `key`, an identical job that is
+        queued, running or done is returned instead of queueing a new one.
+        """
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            if key is not None:
+                row = db.execute(
+                    "SELECT id FROM jobs WHERE key = ? AND kind = ? "
+                    "AND status IN ('queued', 'running', 'done') "
+                    "ORDER BY created DESC LIMIT 1",
+                    (key, kind),
+                ).fetchone()
+                if row:
+                    db.execute("COMMIT")
+                    return row["id"]
+            job_id = uuid.uuid4().hex
+            db.execute(
+                "INSERT INTO jobs (id, kind, key, status, spec, created) "
+                "VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, key, json.dumps(spec), time.time()),
+            )
+            db.execute("COMMIT")
+            return job_id
+
+    def get(self, job_id: str, with_result: bool = False) -> Optional[dict]:
+        """Status, progress and error of a job (plus its result if asked)."""
+        cols = "id, kind, status, progress, error, attempts, created, started, finished"
+        if with_result:
+            cols += ", result"
+        with self._connect() as db:
+            row = db.execute(f"SELECT {cols} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["progress"] = json.loads(job["progress"]) if job["progress"] else {}
+        if with_result:
+            job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def request_cancel(self, job_id: str) -> None:
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            # A job nobody has picked up yet can be cancelled on the spot
+            db.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+            db.execute("COMMIT")
+
+    # --- worker side -------------------------------------------------------
+
+    def claim(
+        self, worker_id: str, kinds: Optional[Sequence[str]] = None
+    ) -> Optional[dict]:
+        """
+        Atomically take the oldest runnable job (of one of `kinds`, if
+        given), or None if there is none.
+        """
+        now = time.time()
+        only = ""
+        if kinds:
+            only = " AND kind IN (%s)" % ", ".join("?" * len(kinds))
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            # Jobs orphaned by a dead worker go back in line, or fail for good
+            db.execute(
+                "UPDATE jobs SET status = 'failed', finished = ?, "
+                "error = 'Worker died ' || attempts || ' times while running this job' "
+                "WHERE status = 'running' AND heartbeat < ? AND attempts >= ?",
+                (now, now - JOB_STALE_S, MAX_ATTEMPTS),
+            )
+            row = db.execute(
+                "SELECT id, kind, spec, attempts FROM jobs "
+                "WHERE (status = 'queued' "
+                "OR (status = 'running' AND heartbeat < ?))" + only + " "
+                "ORDER BY created LIMIT 1",
+                (now - JOB_STALE_S, *(kinds or ())),
+            ).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            db.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, started = ?, "
+                "heartbeat = ?, attempts = attempts + 1 WHERE id = ?",
+                (worker_id, now, now, row["id"]),
+            )
+            db.execute("COMMIT")
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "spec": json.loads(row["spec"]),
+            "attempt": row["attempts"] + 1,
+        }
+
+    def report(self, job_id: str, progress: Optional[dict] = None) -> None:
+        """
+        Heartbeat a running job, optionally with new progress; raises
+        JobCancelled if the UI has asked for the job to stop.
+        """
+        with self._connect() as db:
+            if progress is None:
+                db.execute(
+                    "UPDATE jobs SET heartbeat = ? WHERE id = ?", (time.time(), job_id)
+                )
+            else:
+                db.execute(
+                    "UPDATE jobs SET heartbeat = ?, progress = ? WHERE id = ?",
+                    (time.time(), json.dumps(progress), job_id),
+                )
+            row = db.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is not None and row["cancel_requested"]:
+            raise JobCancelled(job_id)
+
+    def finish(self, job_id: str, status: str, result=None, error: str = None) -> None:
+        assert status in FINISHED
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ? "
+                "WHERE id = ?",
+                (status, json.dumps(result), error, time.time(), job_id),
+            )
+
+    # --- workers and housekeeping ------------------------------------------
+
+    def worker_heartbeat(self, worker_id: str) -> None:
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO workers (id, pid, heartbeat) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET heartbeat = excluded.heartbeat",
+                (worker_id, os.getpid(), time.time()),
+            )
+
+    def worker_exit(self, worker_id: str) -> None:
+        with self._connect() as db:
+            db.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+
+    def live_workers(self, within_s: float = 15.0) -> int:
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT COUNT(*) AS n FROM workers WHERE heartbeat >= ?",
+                (time.time() - within_s,),
+            ).fetchone()
+        return row["n"]
+
+    def prune(self, max_age_s: float = 7 * 24 * 3600) -> int:
+        """Forget finished jobs (and long-gone workers) older than a week."""
+        cutoff = time.time() - max_age_s
+        with self._connect() as db:
+            cur = db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') "
+                "AND finished < ?",
+                (cutoff,),
+            )
+            db.execute("DELETE FROM workers WHERE heartbeat < ?", (cutoff,))
+            return cur.rowcount
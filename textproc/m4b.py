@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ffmpeg is optional; M4B export is offered only when it can be found
+FFMPEG = os.environ.get("BILBOT_FFMPEG", "ffmpeg")
+M4B_BITRATE = "64k"
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which(FFMPEG) is not None
+
+
+def _escape_meta(value: str) -> str:
+    for ch in ("\\", "=", ";", "#", "\n"):
+        value = value.replace(ch, "\\" + ch)
+    return value
+
+
+def chapter_metadata(chapters: Sequence[Tuple[str, float]], title: str = "") -> str:
+    """FFMETADATA1 text with one chapter marker per (title, seconds) entry."""
+    lines = [";FFMETADATA1"]
+    if title:
+        lines.append(f"title={_escape_meta(title)}")
+    start = 0
+    elapsed = 0.0
+    for n, (name, seconds) in enumerate(chapters, 1):
+        elapsed += seconds
+        end = int(round(elapsed * 1000))
+        lines += [
+            "[CHAPTER]",
+            "TIMEBASE=1/1000",
+            f"START={start}",
+            f"END={end}",
+            f"title={_escape_meta(name or f'Chapter {n}')}",
+        ]
+        start = end
+    return "\n".join(lines) + "\n"
+
+
+def write_m4b(
+    mp3_path: str,
+    chapters: Sequence[Tuple[str, float]],
+    out_path: str,
+    title: str = "",
+    bitrate: str = M4B_BITRATE,
+) -> Optional[str]:
+    """
+    Re-encode a finished book MP3 to AAC in an M4B with chapter markers.
+
+    `chapters` lists (title, duration in seconds) in playing order and must
+    add up to the MP3. Returns out_path, or None if ffmpeg is missing or
+    fails; the MP3 downloads are unaffected either way.
+    """
+    if not ffmpeg_available():
+        return None
+    fd, meta_path = tempfile.mkstemp(suffix=".ffmeta")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(chapter_metadata(chapters, title))
+        subprocess.run(
+            [
+                FFMPEG, "-y", "-v", "error",
+                "-i", mp3_path,
+                "-i", meta_path,
+                "-map", "0:a", "-map_metadata", "1", "-map_chapters", "1",
+                "-c:a", "aac", "-b:a", bitrate,
+                "-movflags", "+faststart",
+                "-f", "mp4", out_path,
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        return out_path
+    except (OSError, subprocess.CalledProcessError) as e:
+        detail = getattr(e, "stderr", b"") or b""
+        logger.warning("M4B export failed: %s %s", e, detail.decode(errors="replace"))
+        try:
+            os.unlink(out_path)
+        except OSError:
+            pass
+        return None
+    finally:
+        os.unlink(meta_path)
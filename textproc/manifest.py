@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Sequence
+
+from .storage import atomic_write_bytes, data_dir
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent renders of one job are not detected
+    fcntl = None
+
+_LOCK_FILE = ".lock"
+
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def sha256_file(path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class JobManifest:
+    """
+    Persistent record of a synthesis job, so a restarted session resumes from
+    the first missing part instead of chunk 1.
+
+    The job directory holds the part MP3s, a `manifest.json` header and an
+    append-only `parts.jsonl` log with one line per finished part (index, text
+    hash, file name, size, sha256). Appending keeps each update O(1) and a torn
+    final line from a crash is simply ignored on load.
+
+    A render holds an exclusive lock on the directory until close() or
+    discard(). A second render of the same job meanwhile gets a `private`
+    directory of its own (not resumable, discarded when it ends), so one
+    render never deletes or overwrites parts another is still writing.
+    """
+
+    def __init__(self, job_id: str, root=None, private: bool = False):
+        self.job_id = job_id
+        self.private = private
+        self.dir = Path(root or data_dir("jobs")) / job_id
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._log_path = self.dir / "parts.jsonl"
+        self._lock = None
+        self.parts: Dict[int, dict] = {}
+        self._load()
+
+    @staticmethod
+    def make_job_id(
+        parts: Sequence[str], voice: str, rate_pct: int, pitch_hz: int, backend: str
+    ) -> str:
+        h = hashlib.sha256()
+        h.update(json.dumps([voice, int(rate_pct), int(pitch_hz), backend]).encode())
+        for text in parts:
+            h.update(sha256_text(text).encode())
+        return h.hexdigest()[:32]
+
+    @classmethod
+    def for_job(
+        cls,
+        parts: Sequence[str],
+        voice: str,
+        rate_pct: int,
+        pitch_hz: int,
+        backend: str,
+        root=None,
+    ) -> "JobManifest":
+        job_id = cls.make_job_id(parts, voice, rate_pct, pitch_hz, backend)
+        manifest = cls(job_id, root=root)
+        if not manifest.lock():
+            manifest = cls(f"{job_id}-{uuid.uuid4().hex[:8]}", root=root, private=True)
+            manifest.lock()
+        header = manifest.dir / "manifest.json"
+        if not header.exists():
+            meta = {
+                "job_id": job_id,
+                "voice": voice,
+                "rate_pct": rate_pct,
+                "pitch_hz": pitch_hz,
+                "backend": backend,
+                "num_parts": len(parts),
+                "created": time.time(),
+            }
+            atomic_write_bytes(header, json.dumps(meta, indent=2).encode("utf-8"))
+        return manifest
+
+    def lock(self) -> bool:
+        """Take the directory's render lock; False if another render holds it."""
+        if self._lock is not None or fcntl is None:
+            return True
+        path = self.dir / _LOCK_FILE
+        try:
+            f = open(path, "a")
+        except OSError:
+            return False  # the directory was just pruned
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # A lock on a file prune_jobs has since deleted guards nothing
+            if os.fstat(f.fileno()).st_ino != os.stat(path).st_ino:
+                raise OSError("job directory was pruned")
+        except OSError:
+            f.close()
+            return False
+        self._lock = f
+        return True
+
+    def close(self) -> None:
+        """Release the render lock, keeping the parts for a later resume."""
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+    def _load(self):
+        try:
+            with open(self._log_path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+                self.parts[int(entry["index"])] = entry
+            except (ValueError, KeyError, TypeError):
+                continue  # partial line from an interrupted write
+
+    def is_done(self, index: int, text: str) -> bool:
+        """True when the part was recorded for this text and its file still verifies."""
+        entry = self.parts.get(index)
+        if not entry or entry.get("text_sha256") != sha256_text(text):
+            return False
+        path = self.dir / entry["file"]
+        try:
+            if path.stat().st_size != entry["bytes"]:
+                return False
+            return sha256_file(path) == entry["sha256"]
+        except OSError:
+            return False
+
+    def mark_done(self, index: int, text: str, path: str) -> None:
+        entry = {
+            "index": index,
+            "text_sha256": sha256_text(text),
+            "file": os.path.basename(path),
+            "bytes": os.path.getsize(path),
+            "sha256": sha256_file(path),
+        }
+        self.parts[index] = entry
+        with open(self._log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def discard(self) -> None:
+        """Remove the job directory once its output has been assembled."""
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.close()
+
+
+def _last_active(job_dir: Path) -> float:
+    log = job_dir / "parts.jsonl"
+    return log.stat().st_mtime if log.exists() else job_dir.stat().st_mtime
+
+
+def _remove_idle(job_dir: Path, cutoff: float) -> bool:
+    """
+    Delete a job directory idle since before `cutoff`, holding its render
+    lock throughout, so no render can take it between the check and the
+    delete; False if a render holds it or resumed it meanwhile.
+    """
+    if fcntl is None:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        return True
+    try:
+        f = open(job_dir / _LOCK_FILE, "a")
+    except OSError:
+        return False
+    with f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # Opening the lock file may have touched the directory; a render
+            # that resumed the job meanwhile shows in its log
+            log = job_dir / "parts.jsonl"
+            if log.exists() and log.stat().st_mtime >= cutoff:
+                return False
+        except OSError:
+            return False
+        shutil.rmtree(job_dir, ignore_errors=True)
+    return True
+
+
+def prune_jobs(max_age_s: float = 7 * 24 * 3600, root=None) -> int:
+    """Drop unfinished jobs that nobody has resumed for a week."""
+    cutoff = time.time() - max_age_s
+    removed = 0
+    for job_dir in Path(root or data_dir("jobs")).iterdir():
+        try:
+            if _last_active(job_dir) >= cutoff:
+                continue
+        except OSError:
+            continue
+        if _remove_idle(job_dir, cutoff):
+            removed += 1
+    return removed
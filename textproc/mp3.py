@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+import bisect
+import io
+import logging
+import os
+import struct
+import tempfile
+import time
+from typing import BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from .storage import data_dir
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# MPEG AUDIO FRAME HEADERS
+# ============================================================================
+
+# Bitrates in kbit/s indexed by [version is MPEG-1][layer][bitrate index]
+_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Sample rates by version bits (0 = MPEG-2.5, 2 = MPEG-2, 3 = MPEG-1)
+_SAMPLE_RATES = {0: (11025, 12000, 8000), 2: (22050, 24000, 16000), 3: (44100, 48000, 32000)}
+
+# Bytes read from a part at a time while parsing its frames
+_READ_SIZE = 64 * 1024
+
+_XING_FRAMES = 0x1
+_XING_BYTES = 0x2
+_XING_TOC = 0x4
+
+
+class FrameHeader(NamedTuple):
+    raw: bytes
+    version: int  # version bits: 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5
+    layer: int  # 1, 2 or 3
+    crc: bool
+    bitrate_index: int
+    sample_rate: int
+    padding: int
+    mono: bool
+    length: int
+
+    @property
+    def samples(self) -> int:
+        if self.layer == 1:
+            return 384
+        if self.layer == 3 and self.version != 3:
+            return 576
+        return 1152
+
+    @property
+    def side_info(self) -> int:
+        """Bytes of Layer III side information following the header (and CRC)."""
+        if self.layer != 3:
+            return 0
+        if self.version == 3:
+            return 17 if self.mono else 32
+        return 9 if self.mono else 17
+
+
+def parse_header(b: bytes) -> Optional[FrameHeader]:
+    """Decode a 4-byte MPEG audio frame header; None if it is not one."""
+    if len(b) < 4 or b[0] != 0xFF or (b[1] & 0xE0) != 0xE0:
+        return None
+    version = (b[1] >> 3) & 3
+    layer = 4 - ((b[1] >> 1) & 3)
+    br_idx = b[2] >> 4
+    sr_idx = (b[2] >> 2) & 3
+    if version == 1 or layer == 4 or br_idx in (0, 15) or sr_idx == 3:
+        return None  # reserved values or free-format bitrate
+    bitrate = _BITRATES[(version == 3, layer)][br_idx] * 1000
+    sample_rate = _SAMPLE_RATES[version][sr_idx]
+    padding = (b[2] >> 1) & 1
+    if layer == 1:
+        length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 3 and version != 3:
+        length = 72 * bitrate // sample_rate + padding
+    else:
+        length = 144 * bitrate // sample_rate + padding
+    return FrameHeader(
+        raw=bytes(b[:4]),
+        version=version,
+        layer=layer,
+        crc=not (b[1] & 1),
+        bitrate_index=br_idx,
+        sample_rate=sample_rate,
+        padding=padding,
+        mono=(b[3] >> 6) == 3,
+        length=length,
+    )
+
+
+def _id3v2_size(data: bytes, pos: int) -> int:
+    """Total size of an ID3v2 tag starting at pos (0 if there is none)."""
+    if data[pos : pos + 3] != b"ID3" or len(data) < pos + 10:
+        return 0
+    size = 0
+    for byte in data[pos + 6 : pos + 10]:
+        size = (size << 7) | (byte & 0x7F)  # syncsafe integer
+    footer = 10 if data[pos + 5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _is_info_frame(frame: bytes, hdr: FrameHeader) -> bool:
+    """True for Xing/Info/VBRI metadata frames, which carry no audio."""
+    off = 4 + (2 if hdr.crc else 0) + hdr.side_info
+    return frame[off : off + 4] in (b"Xing", b"Info") or frame[36:40] == b"VBRI"
+
+
+def iter_audio_frames(data: bytes) -> Iterator[Tuple[FrameHeader, bytes]]:
+    """iter_file_frames() over MP3 bytes already in memory."""
+    return iter_file_frames(io.BytesIO(data))
+
+
+def iter_file_frames(
+    f: BinaryIO, read_size: int = _READ_SIZE
+) -> Iterator[Tuple[FrameHeader, bytes]]:
+    """
+    Yield (header, frame bytes) for every audio frame in one MP3 file.
+
+    The file is read through a buffer of about `read_size` bytes, so memory
+    does not grow with its length. ID3v2 tags (anywhere), a trailing ID3v1
+    tag and Xing/Info/VBRI frames are dropped; unparseable bytes are skipped
+    until the next pair of valid headers so a stray 0xFF in junk data cannot
+    start a false frame.
+    """
+    reader = _BufferedFrames(f, read_size)
+    end = reader.end
+    first = True
+    while reader.pos + 4 <= end:
+        pos = reader.pos
+        tag = _id3v2_size(reader.peek(10), 0)
+        if tag:
+            reader.pos += tag
+            continue
+        hdr = parse_header(reader.peek(4))
+        if hdr is not None and pos + hdr.length <= end:
+            chunk = reader.peek(hdr.length + 4)
+            if _confirms(chunk[hdr.length :], pos + hdr.length + 4 > end):
+                reader.pos += hdr.length
+                frame = chunk[: hdr.length]
+                if first and _is_info_frame(frame, hdr):
+                    first = False
+                    continue
+                first = False
+                yield hdr, frame
+                continue
+        if not reader.find_sync(pos + 1):
+            break
+
+
+class _BufferedFrames:
+    """Forward reader over an MP3 file holding only the bytes near `pos`."""
+
+    def __init__(self, f: BinaryIO, read_size: int):
+        self._f = f
+        self._read_size = read_size
+        end = f.seek(0, os.SEEK_END)
+        if end >= 128:
+            f.seek(end - 128)
+            if f.read(3) == b"TAG":
+                end -= 128  # trailing ID3v1 tag
+        self.end = end
+        self.pos = 0
+        self._buf = bytearray()
+        self._base = 0  # file offset of _buf[0]
+
+    def peek(self, n: int) -> bytes:
+        """Up to n bytes at pos (fewer at the end), reading ahead as needed."""
+        consumed = self.pos - self._base
+        if consumed >= len(self._buf):
+            self._buf.clear()
+            self._base = self.pos
+        elif consumed >= self._read_size:
+            del self._buf[:consumed]
+            self._base = self.pos
+        self._fill(min(self.pos + n, self.end))
+        off = self.pos - self._base
+        return bytes(self._buf[off : off + n])
+
+    def _fill(self, upto: int) -> bool:
+        """Extend the buffer to cover file offsets below `upto`."""
+        have = self._base + len(self._buf)
+        if have >= upto:
+            return True
+        self._f.seek(have)
+        while have < upto:
+            chunk = self._f.read(min(self.end - have, max(upto - have, self._read_size)))
+            if not chunk:
+                return False
+            self._buf += chunk
+            have += len(chunk)
+        return True
+
+    def find_sync(self, start: int) -> bool:
+        """Move pos to the next 0xFF byte at or after `start`; False if none."""
+        self.pos = start
+        while self.pos < self.end:
+            self.peek(1)
+            off = self._buf.find(b"\xff", self.pos - self._base)
+            if off >= 0 and self._base + off < self.end:
+                self.pos = self._base + off
+                return True
+            self.pos = self._base + len(self._buf)
+        return False
+
+
+def _confirms(following: bytes, last: bool) -> bool:
+    """A header is trusted if the next frame also starts where it predicts."""
+    if last:
+        return True  # last frame in the file
+    if following[:3] == b"ID3":
+        return True
+    return parse_header(following) is not None
+
+
+# ============================================================================
+# ASSEMBLY
+# ============================================================================
+
+
+class MP3Assembler:
+    """
+    Concatenate MP3 parts frame by frame into one clean stream.
+
+    Per-part ID3 tags and Xing/Info/VBRI frames are dropped, and the output
+    starts with a single Xing (VBR) or Info (CBR) frame carrying the total
+    frame count, byte count and a 100-entry seek TOC, so players report the
+    right duration and seek without scanning the file. Parts are streamed
+    through a small read buffer and audio is never decoded. The header is rewritten in place on
+    every flush, so a file still being assembled is also well-formed.
+
+    Memory is bounded: for the TOC only every `stride`-th frame offset is
+    kept, doubling the stride whenever the sample list fills up.
+    """
+
+    _MAX_MARKS = 4096
+
+    def __init__(self, out_path: str):
+        self.path = out_path
+        self.frames = 0
+        self.samples = 0
+        self.sample_rate = 0
+        self._out = open(out_path, "wb")
+        self._template: Optional[FrameHeader] = None
+        self._header_len = 0
+        self._bitrates = set()
+        self._stride = 1
+        self._mark_frames: List[int] = []
+        self._mark_offsets: List[int] = []
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.samples / self.sample_rate if self.sample_rate else 0.0
+
+    @property
+    def bytes_written(self) -> int:
+        return self._out.tell() if not self._out.closed else os.path.getsize(self.path)
+
+    def append_file(self, path: str) -> int:
+        """Append every audio frame of one part; returns frames added."""
+        added = 0
+        with open(path, "rb") as f:
+            for hdr, frame in iter_file_frames(f):
+                if self._template is None:
+                    self._start(hdr)
+                if self.frames % self._stride == 0:
+                    self._mark(self._out.tell())
+                self._out.write(frame)
+                self._bitrates.add(hdr.bitrate_index)
+                self.frames += 1
+                self.samples += hdr.samples
+                added += 1
+        if not added:
+            logger.warning("No MPEG audio frames found in %s", path)
+        return added
+
+    def _start(self, hdr: FrameHeader) -> None:
+        self._template = hdr
+        self.sample_rate = hdr.sample_rate
+        self._header_len = len(self._info_frame())
+        self._out.write(bytes(self._header_len))  # placeholder until flush()
+
+    def _mark(self, offset: int) -> None:
+        if len(self._mark_frames) >= self._MAX_MARKS:
+            self._mark_frames = self._mark_frames[::2]
+            self._mark_offsets = self._mark_offsets[::2]
+            self._stride *= 2
+            if self.frames % self._stride:
+                return
+        self._mark_frames.append(self.frames)
+        self._mark_offsets.append(offset)
+
+    def _info_frame(self) -> bytes:
+        """Build the Xing/Info frame for the current totals."""
+        t = self._template
+        table = _BITRATES[(t.version == 3, t.layer)]
+        tag_off = 4 + t.side_info
+        needed = tag_off + 4 + 4 + 4 + 4 + 100
+        # Smallest bitrate whose (unpadded, CRC-less) frame fits the tag
+        for br_idx in range(1, 15):
+            b2 = (br_idx << 4) | (t.raw[2] & 0x0C)  # keep sample rate, no padding
+            raw = bytes((0xFF, t.raw[1] | 0x01, b2, t.raw[3]))
+            hdr = parse_header(raw)
+            if hdr.length >= needed:
+                break
+        total = self.bytes_written
+        toc = bytearray(100)
+        if self.frames and total:
+            for i in range(100):
+                target = self.frames * i // 100
+                j = max(0, bisect.bisect_right(self._mark_frames, target) - 1)
+                toc[i] = min(255, self._mark_offsets[j] * 256 // total)
+        kind = b"Info" if len(self._bitrates) <= 1 else b"Xing"
+        body = kind + struct.pack(
+            ">III", _XING_FRAMES | _XING_BYTES | _XING_TOC, self.frames, total
+        ) + bytes(toc)
+        frame = raw + bytes(tag_off - 4) + body
+        return frame + bytes(hdr.length - len(frame))
+
+    def flush(self) -> None:
+        """Rewrite the header frame with current totals and flush to disk."""
+        if self._template is None:
+            return
+        frame = self._info_frame()
+        pos = self._out.tell()
+        self._out.seek(0)
+        self._out.write(frame)
+        self._out.seek(pos)
+        self._out.flush()
+
+    def close(self) -> None:
+        if not self._out.closed:
+            self.flush()
+            self._out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def concat_parts(part_paths: Iterable[str], out_path: str) -> int:
+    """
+    Assemble part files into out_path frame by frame (see MP3Assembler).
+
+    Peak memory is a read buffer, however long the parts or the book are.
+    Returns the number of bytes written.
+    """
+    with MP3Assembler(out_path) as asm:
+        for path in part_paths:
+            asm.append_file(path)
+    return os.path.getsize(out_path)
+
+
+class OrderedPrefixWriter:
+    """
+    Grow out_path with finished parts in document order.
+
+    Parts may arrive in any order; each is appended as soon as every earlier
+    part has been settled (written, or skipped as failed), so the file is
+    always a playable prefix of the book. Once all `total` parts are in, the
+    file is the complete audiobook and no separate merge pass is needed.
+    """
+
+    def __init__(self, out_path: str, total: int):
+        self.path = out_path
+        self.total = total
+        self.parts_written = 0
+        self.bytes_written = 0
+        self.duration_seconds = 0.0
+        self._next = 0
+        self._pending: Dict[int, Optional[str]] = {}
+        self._asm = MP3Assembler(out_path)
+
+    @property
+    def settled(self) -> int:
+        """Number of leading parts already reflected in the file."""
+        return self._next
+
+    @property
+    def complete(self) -> bool:
+        return self._next >= self.total
+
+    def add(self, index: int, part_path: Optional[str]) -> None:
+        """Register part `index` (None if it failed) and flush the ready prefix."""
+        self._pending[index] = part_path
+        grew = False
+        while self._next in self._pending:
+            path = self._pending.pop(self._next)
+            if path:
+                self._asm.append_file(path)
+                self.parts_written += 1
+                grew = True
+            self._next += 1
+        if grew:
+            self._asm.flush()
+            self.bytes_written = self._asm.bytes_written
+            self.duration_seconds = self._asm.duration_seconds
+
+    def close(self) -> None:
+        self._asm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def new_output_path(suffix: str = ".mp3") -> str:
+    """Reserve a file in the shared outputs directory that outlives the job."""
+    fd, path = tempfile.mkstemp(dir=data_dir("outputs"), suffix=suffix)
+    os.close(fd)
+    return path
+
+
+def prune_outputs(max_age_s: float = 24 * 3600) -> int:
+    """Delete finished audiobooks abandoned by sessions that never came back."""
+    cutoff = time.time() - max_age_s
+    removed = 0
+    for entry in data_dir("outputs").iterdir():
+        try:
+            if entry.stat().st_mtime < cutoff:
+                entry.unlink()
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def remove_output(path) -> None:
+    if not path:
+        return
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
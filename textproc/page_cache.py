@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+from .storage import LRUFileStore, atomic_write_bytes, data_dir
+
+logger = logging.getLogger(__name__)
+
+# 0 disables the cache
+DEFAULT_MAX_BYTES = int(os.environ.get("BILBOT_PAGE_CACHE_MB", "256")) * 1024 * 1024
+
+# Part of every key: bump when the way a page's text is extracted changes
+_EXTRACTOR_VERSION = "1"
+
+
+def page_fingerprint(doc, page, page_num: int, memo: Dict[int, bytes]) -> str:
+    """
+    Hash of everything PyMuPDF reads to extract a page's text: its content
+    streams, the form XObjects they draw, its fonts' names, encodings and
+    Unicode maps, and its boxes and rotation. Object numbers are left out,
+    so the same page keeps its key when other pages are deleted and the file
+    is saved again. `memo` caches digests of objects shared between pages;
+    use one per open document.
+    """
+    h = hashlib.sha256()
+    # The first pages fall back to block extraction when they look empty
+    h.update(f"{_EXTRACTOR_VERSION}|{page_num < 3}|".encode("ascii"))
+    h.update(
+        repr((tuple(page.mediabox), tuple(page.cropbox), page.rotation)).encode("ascii")
+    )
+    h.update(page.read_contents())
+    for xref, *_ in page.get_xobjects():
+        h.update(_object_digest(doc, xref, memo, stream=True))
+    for xref, _ext, font_type, basefont, name, encoding, *_ in page.get_fonts():
+        h.update(f"|{name}|{basefont}|{font_type}|{encoding}|".encode("utf-8"))
+        if xref:
+            for key in ("ToUnicode", "Encoding"):
+                kind, value = doc.xref_get_key(xref, key)
+                if kind == "xref":
+                    ref = int(value.split()[0])
+                    h.update(_object_digest(doc, ref, memo, stream=key == "ToUnicode"))
+                else:
+                    h.update(f"{key}={value}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _object_digest(doc, xref: int, memo: Dict[int, bytes], stream: bool) -> bytes:
+    digest = memo.get(xref)
+    if digest is None:
+        data = doc.xref_stream(xref) if stream else doc.xref_object(xref).encode("utf-8")
+        digest = memo[xref] = hashlib.sha256(data or b"").digest()
+    return digest
+
+
+class PageTextCache(LRUFileStore):
+    """
+    Extracted text of PDF pages, keyed by page_fingerprint().
+
+    A re-uploaded book whose pages were trimmed or edited only re-extracts
+    the pages that changed. Entries are small text files evicted least
+    recently used first past `max_bytes`; like the audio cache it is shared
+    by every process on the host.
+    """
+
+    suffix = ".txt"
+    label = "Page cache"
+
+    def __init__(self, root=None, max_bytes: int = DEFAULT_MAX_BYTES):
+        super().__init__(root or data_dir("page-cache"), max_bytes)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entry(key)
+        try:
+            text = entry.read_text(encoding="utf-8")
+        except OSError:
+            self._miss()
+            return None
+        self._hit(entry)
+        return text
+
+    def put(self, key: str, text: str) -> None:
+        entry = self._entry(key)
+        data = text.encode("utf-8")
+        try:
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_bytes(entry, data)
+        except OSError as e:
+            logger.warning("Page cache store failed for %s: %s", key[:12], e)
+            return
+        self._added(len(data))
+
+
+_page_cache: Optional[PageTextCache] = None
+_page_cache_lock = threading.Lock()
+
+
+def page_cache() -> PageTextCache:
+    """One page-text cache per process, created on first use."""
+    global _page_cache
+    with _page_cache_lock:
+        if _page_cache is None:
+            _page_cache = PageTextCache()
+        return _page_cache
@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence
+
+from .audio_cache import AudioCache
+from .extractors import Source, read_head
+from .m4b import write_m4b
+from .manifest import JobManifest, prune_jobs
+from .mp3 import OrderedPrefixWriter, concat_parts, new_output_path, prune_outputs, remove_output
+from .processor import TextProcessor
+from .revisions import align_chapters, document_key, load_revision, prune_revisions, save_revision
+from .scheduler import scheduler
+from .sizing import pick_part_size
+from .telemetry import telemetry
+from .synthesis import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_PART_TIMEOUT,
+    default_backend,
+    sanitize_for_tts,
+    synthesize_chapters,
+)
+
+
+# Concurrent TTS requests per job: the adaptive window starts at
+# BILBOT_TTS_CONCURRENCY and never exceeds BILBOT_TTS_MAX_CONCURRENCY
+TTS_CONCURRENCY = int(os.environ.get("BILBOT_TTS_CONCURRENCY", DEFAULT_CONCURRENCY))
+TTS_MAX_CONCURRENCY = int(
+    os.environ.get("BILBOT_TTS_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)
+)
+# Per-request timeout and optional whole-job deadline, in seconds
+TTS_PART_TIMEOUT = float(os.environ.get("BILBOT_TTS_PART_TIMEOUT", DEFAULT_PART_TIMEOUT))
+TTS_JOB_TIMEOUT = float(os.environ.get("BILBOT_TTS_JOB_TIMEOUT", 0)) or None
+# Hedge parts still running past this latency percentile (e.g. 95); off if unset
+TTS_HEDGE_PERCENTILE = float(os.environ.get("BILBOT_TTS_HEDGE_PERCENTILE", 0)) or None
+
+_audio_cache: Optional[AudioCache] = None
+
+
+def audio_cache() -> AudioCache:
+    """One synthesis cache per process, shared by every job it runs."""
+    global _audio_cache
+    if _audio_cache is None:
+        _audio_cache = AudioCache()
+    return _audio_cache
+
+
+# ============================================================================
+# PREPARATION: EXTRACT, SPLIT, CLEAN, CHUNK
+# ============================================================================
+
+
+def prepare_document(
+    source: Source,
+    file_name: str,
+    remove_headers: bool,
+    remove_footnotes: bool,
+    max_length: Optional[int] = None,
+    voice: Optional[str] = None,
+    extract_workers: Optional[int] = None,
+    lineage: Optional[str] = None,
+) -> dict:
+    """
+    Turn an uploaded file (its bytes, or better its path: PDFs are then
+    opened from disk and text files memory-mapped) into chapters of
+    TTS-sized parts.
+
+    Long PDFs are extracted on up to `extract_workers` processes (default
+    EXTRACT_WORKERS, see extractors.py).
+
+    Without a `max_length`, the part size is the one the throughput model
+    fitted for `voice` expects to synthesize the document fastest (SAFE_MAX
+    until there is enough telemetry; see sizing.py).
+
+    With a `lineage` (see revisions.document_key), an edited re-upload from
+    the same source reuses the parts of the last version rendered there.
+
+    Returns raw and cleaned text, the chapters ({"title", "chunks"}), the
+    flattened chunk list and a `meta` dict of stats (or meta["error"]),
+    including seconds spent per stage in meta["timings"].
+    """
+    timings = {"extract": 0.0, "clean": 0.0, "chunk": 0.0}
+    started = time.perf_counter()
+
+    # Detect file type
+    ext = Path(file_name).suffix.lower()
+    is_pdf = ext == ".pdf" or read_head(source, 5) == b"%PDF-"
+
+    # Extract text
+    if is_pdf:
+        raw_text = TextProcessor.read_pdf_file(source, workers=extract_workers)
+    else:
+        raw_text = TextProcessor.read_text_file(source)
+    timings["extract"] = time.perf_counter() - started
+
+    if not raw_text or not raw_text.strip():
+        return {
+            "raw_text": "",
+            "cleaned_text": "",
+            "chunks": [],
+            "chapters": [],
+            "meta": {
+                "error": "Could not extract text from file",
+                "timings": _rounded(timings),
+            },
+        }
+
+    # Split into chapters (PDF outline first, then CHAPTER headings) before
+    # cleaning, which flattens the page and line structure both rely on
+    started = time.perf_counter()
+    toc = TextProcessor.read_pdf_outline(source) if is_pdf else []
+    cleaned_chapters = []
+    for chapter in TextProcessor.split_into_chapters(raw_text, toc):
+        # Clean text using TextProcessor
+        cleaned = TextProcessor.clean_text(
+            text=chapter.text,
+            remove_running_headers=remove_headers,
+            remove_bottom_footnotes=remove_footnotes,
+            is_pdf=is_pdf,
+        )
+
+        # Fallback if cleaning removed too much
+        if len(cleaned.strip()) < max(50, int(0.02 * len(chapter.text))):
+            cleaned = chapter.text
+        cleaned_chapters.append((chapter.title, cleaned))
+    timings["clean"] = time.perf_counter() - started
+
+    # Part size for this document, voice and concurrency
+    started = time.perf_counter()
+    size_model = "fixed"
+    if max_length is None:
+        max_length, size_model = pick_part_size(
+            sum(len(cleaned) for _, cleaned in cleaned_chapters),
+            voice=voice,
+            concurrency=min(TTS_MAX_CONCURRENCY, scheduler().max_in_flight),
+        )
+
+    # Chunk the text straight into TTS-sized, sentence-aligned parts
+    chapters = []
+    for title, cleaned in cleaned_chapters:
+        chunks = TextProcessor.split_into_tts_parts(cleaned, max_length=max_length)
+        if chunks:
+            chapters.append({"title": title, "cleaned_text": cleaned, "chunks": chunks})
+    timings["chunk"] = time.perf_counter() - started
+
+    cleaned_text = "\n\n".join(c["cleaned_text"] for c in chapters)
+    chapters = [{"title": c["title"], "chunks": c["chunks"]} for c in chapters]
+
+    # An edited re-upload of a book rendered before keeps the old parts (and
+    # chapters) wherever its text is unchanged, so only the edited passages
+    # miss the synthesis cache
+    doc_key = document_key(file_name, lineage) if lineage else None
+    reused = 0
+    previous = load_revision(doc_key) if doc_key else None
+    if previous:
+        started = time.perf_counter()
+        aligned, reused = align_chapters(cleaned_text, previous, max_length=max_length)
+        chapters = aligned or chapters
+        timings["chunk"] += time.perf_counter() - started
+    chunks = [chunk for c in chapters for chunk in c["chunks"]]
+
+    return {
+        "raw_text": raw_text,
+        "cleaned_text": cleaned_text,
+        "chunks": chunks,
+        "chapters": chapters,
+        "doc_key": doc_key,
+        "meta": {
+            "kind": "pdf" if is_pdf else "txt",
+            "file_name": file_name,
+            "chars_raw": len(raw_text),
+            "chars_clean": len(cleaned_text),
+            "chunk_size": max_length,
+            "chunk_size_model": size_model,
+            "num_chunks": len(chunks),
+            "num_chapters": len(chapters),
+            "reused_chunks": reused,
+            "timings": _rounded(timings),
+        },
+    }
+
+
+def _rounded(timings: dict) -> dict:
+    return {stage: round(seconds, 3) for stage, seconds in timings.items()}
+
+
+# ============================================================================
+# RENDERING: SYNTHESIZE AND ASSEMBLE
+# ============================================================================
+
+
+def chapter_file_name(base: str, number: int, title: str) -> str:
+    safe = re.sub(r"[^\w\- ]+", "", title).strip()[:60]
+    return f"{base} - {number:02d}{' ' + safe if safe else ''}.mp3"
+
+
+def render_book(
+    chapters: Sequence[dict],
+    voice: str,
+    rate_pct: int,
+    pitch_hz: int,
+    out_base: str,
+    doc_key: Optional[str] = None,
+    make_m4b: bool = False,
+    on_progress: Optional[Callable[[dict], None]] = None,
+    cancel: Optional[threading.Event] = None,
+) -> dict:
+    """
+    Synthesize prepared chapters into the finished audiobook files.
+
+    `on_progress(progress)` receives a JSON-friendly snapshot (parts done,
+    the growing first chapter, chapters already complete) as parts land and
+    a few times a second; it may raise to abort the job. Returns the output
+    paths, skipped fragments, engine metrics and seconds per stage
+    (`timings`). On failure every output written so far is removed;
+    finished parts stay in their job manifests, so running the same book
+    again resumes.
+    """
+    started = time.monotonic()
+    titles = [c["title"] for c in chapters]
+    # Chunks are already sentence-aligned and within SAFE_MAX
+    chapter_parts = [
+        [sanitize_for_tts(chunk) for chunk in c["chunks"] if chunk.strip()]
+        for c in chapters
+    ]
+
+    # Each chapter is its own job: part files live in a persistent job
+    # directory keyed by the chapter's text and the voice settings, so an
+    # interrupted book resumes where it stopped, chapter by chapter. A render
+    # of the same book already running keeps that directory to itself.
+    prune_jobs()
+    prune_revisions()
+    prune_outputs()
+    backend_version = default_backend().version
+    manifests = [
+        JobManifest.for_job(parts, voice, rate_pct, pitch_hz, backend_version)
+        for parts in chapter_parts
+    ]
+    num_parts = sum(len(parts) for parts in chapter_parts)
+
+    # Every chapter grows as an ordered prefix of its finished parts, so
+    # chapter 1 can be played while the rest of the book renders.
+    prefixes = [
+        OrderedPrefixWriter(new_output_path(), len(parts)) for parts in chapter_parts
+    ]
+    outputs: List[str] = [p.path for p in prefixes]
+    progress = {"done": 0, "total": num_parts, "chapters": len(chapters)}
+
+    # Other books rendering in this process share the TTS service with this
+    # one through the scheduler; its queue tells the UI why a book waits
+    share = scheduler().register(
+        out_base, sum(len(part) for parts in chapter_parts for part in parts)
+    )
+
+    def _snapshot() -> dict:
+        first = prefixes[0]
+        progress["elapsed"] = round(time.monotonic() - started, 1)
+        stats = share.stats()
+        progress["queue"] = {
+            "depth": scheduler().queue_depth,
+            "waiting": stats["waiting"],
+            "wait_mean": stats["wait_mean"],
+        }
+        progress["preview"] = {
+            "path": first.path,
+            "parts_written": first.parts_written,
+            "settled": first.settled,
+            "total": first.total,
+            "complete": first.complete,
+        }
+        progress["ready"] = [
+            {"index": n, "title": titles[n], "path": p.path}
+            for n, p in enumerate(prefixes)
+            if p.complete and p.parts_written
+        ]
+        return progress
+
+    def _on_part_done(chapter: int, index: int, ok: bool, done: int):
+        progress["done"] = done
+        if on_progress:
+            on_progress(_snapshot())
+
+    def _on_tick():
+        # Long books publish telemetry while they run, not only at the end
+        telemetry().save(force=False)
+        if on_progress:
+            on_progress(_snapshot())
+
+    try:
+        metrics = {}
+        results = synthesize_chapters(
+            chapter_parts,
+            voice,
+            [str(m.dir) for m in manifests],
+            rate_pct,
+            pitch_hz,
+            concurrency=TTS_CONCURRENCY,
+            max_concurrency=TTS_MAX_CONCURRENCY,
+            on_part_done=_on_part_done,
+            on_tick=_on_tick,
+            part_timeout=TTS_PART_TIMEOUT,
+            job_timeout=TTS_JOB_TIMEOUT,
+            hedge_percentile=TTS_HEDGE_PERCENTILE,
+            cache=audio_cache(),
+            metrics=metrics,
+            manifests=manifests,
+            prefixes=prefixes,
+            cancel=cancel,
+            share=share,
+        )
+        for prefix in prefixes:
+            prefix.close()
+        synthesized = time.monotonic()
+        skipped = [
+            part
+            for parts, paths in zip(chapter_parts, results)
+            for part, path in zip(parts, paths)
+            if not path
+        ]
+        if len(skipped) == num_parts:
+            raise RuntimeError("All chunks failed to synthesize.")
+
+        # Remember this layout so an edited version can reuse its parts
+        if doc_key:
+            save_revision(doc_key, chapters)
+
+        # The prefix writers have already assembled each chapter
+        for manifest, paths in zip(manifests, results):
+            if all(paths) or manifest.private:
+                manifest.discard()
+        chapter_mp3s = [
+            {
+                "title": titles[n],
+                "path": prefix.path,
+                "file_name": chapter_file_name(out_base, n + 1, titles[n]),
+                "seconds": prefix.duration_seconds,
+            }
+            for n, prefix in enumerate(prefixes)
+            if prefix.parts_written
+        ]
+        for prefix in prefixes:
+            if not prefix.parts_written:
+                remove_output(prefix.path)
+
+        # A multi-chapter book is also offered whole: chapters are joined
+        # frame by frame, which is quick and needs no re-encoding
+        if len(chapter_mp3s) > 1:
+            mp3_path = new_output_path()
+            outputs.append(mp3_path)
+            concat_parts([c["path"] for c in chapter_mp3s], mp3_path)
+        else:
+            mp3_path = chapter_mp3s[0]["path"]
+            chapter_mp3s = []
+
+        m4b_path = None
+        m4b_failed = False
+        if make_m4b:
+            m4b_path = new_output_path(".m4b")
+            outputs.append(m4b_path)
+            markers = [
+                (titles[n] or f"Chapter {n + 1}", p.duration_seconds)
+                for n, p in enumerate(prefixes)
+                if p.parts_written
+            ]
+            if not write_m4b(mp3_path, markers, m4b_path, title=out_base):
+                remove_output(m4b_path)
+                m4b_path = None
+                m4b_failed = True
+    except BaseException:
+        for prefix in prefixes:
+            prefix.close()
+        for path in outputs:
+            remove_output(path)
+        raise
+    finally:
+        scheduler().unregister(share)
+        for manifest in manifests:
+            if manifest.private:
+                manifest.discard()
+            else:
+                manifest.close()
+
+    return {
+        "mp3_path": mp3_path,
+        "mp3_filename": f"{out_base}.mp3",
+        "chapter_mp3s": chapter_mp3s,
+        "m4b_path": m4b_path,
+        "m4b_filename": f"{out_base}.m4b",
+        "m4b_failed": m4b_failed,
+        "skipped": skipped,
+        "metrics": metrics,
+        "elapsed": round(time.monotonic() - started, 1),
+        "timings": _rounded(
+            {
+                "synthesize": synthesized - started,
+                "assemble": time.monotonic() - synthesized,
+            }
+        ),
+    }
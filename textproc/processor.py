@@ -1,8 +1,18 @@
 # -*- coding: utf-8 -*-
-from typing import List
+from typing import List, Optional
+import mmap
 import re
 
-from .extractors import extract_with_pymupdf, PAGE_BREAK
+from .extractors import (
+    PAGE_BREAK,
+    Source,
+    extract_outline_with_pymupdf,
+    extract_with_pymupdf,
+    read_head,
+    source_size,
+)
+from .storage import mapped_file
+from . import chapters as H
 from . import cleaners as C
 from . import chunking as K
 
@@ -11,24 +21,36 @@ class TextProcessor:
     """Lightweight text processor optimized for Streamlit Cloud."""
 
     @staticmethod
-    def read_text_file(file_bytes: bytes) -> str:
+    def read_text_file(source: Source) -> str:
         """
         Efficiently read text files with smart encoding detection.
+
+        `source` is the file's bytes or its path; a path is memory-mapped and
+        decoded in place, so only the decoded text is held in memory.
         """
-        if not file_bytes:
+        if not isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+            with mapped_file(source) as mapped:
+                return TextProcessor.read_text_file(mapped)
+        if not source:
             return ""
 
+        with memoryview(source) as data:
+            return TextProcessor._decode_text(data)
+
+    @staticmethod
+    def _decode_text(data: memoryview) -> str:
         # Remove BOM if present
-        if file_bytes.startswith(b"\xef\xbb\xbf"):  # UTF-8 BOM
-            file_bytes = file_bytes[3:]
-        elif file_bytes.startswith(b"\xff\xfe"):  # UTF-16 LE BOM
+        head = bytes(data[:3])
+        if head.startswith(b"\xef\xbb\xbf"):  # UTF-8 BOM
+            data = data[3:]
+        elif head.startswith(b"\xff\xfe"):  # UTF-16 LE BOM
             try:
-                return file_bytes.decode("utf-16-le")
+                return str(data, "utf-16-le")
             except:
                 pass
-        elif file_bytes.startswith(b"\xfe\xff"):  # UTF-16 BE BOM
+        elif head.startswith(b"\xfe\xff"):  # UTF-16 BE BOM
             try:
-                return file_bytes.decode("utf-16-be")
+                return str(data, "utf-16-be")
             except:
                 pass
 
@@ -37,7 +59,7 @@ class TextProcessor:
 
         for encoding in encodings:
             try:
-                text = file_bytes.decode(encoding)
+                text = str(data, encoding)
                 # Quick validation - if we see too many replacement chars, try next
                 if text.count("�") > len(text) * 0.01:  # More than 1% replacement chars
                     continue
@@ -46,21 +68,25 @@ class TextProcessor:
                 continue
 
         # Last resort - decode with error replacement
-        return file_bytes.decode("utf-8", errors="replace")
+        return str(data, "utf-8", "replace")
 
     @staticmethod
-    def read_pdf_file(file_bytes: bytes) -> str:
-        if not file_bytes or len(file_bytes) < 100:
+    def read_pdf_file(source: Source, workers: Optional[int] = None) -> str:
+        """
+        Text of a PDF (its bytes or path), pages separated by PAGE_BREAK; see
+        extract_with_pymupdf.
+        """
+        if not source or source_size(source) < 100:
             return ""
-        if not file_bytes.startswith(b"%PDF"):
+        if read_head(source, 4) != b"%PDF":
             return ""
-        size_mb = len(file_bytes) / (1024 * 1024)
+        size_mb = source_size(source) / (1024 * 1024)
         if size_mb > 200:
             return ""
 
         # Try PyMuPDF first
         try:
-            text = extract_with_pymupdf(file_bytes)
+            text = extract_with_pymupdf(source, workers=workers)
             if text and text.strip():
                 return text
         except Exception:
@@ -68,6 +94,13 @@ class TextProcessor:
 
         return ""
 
+    @staticmethod
+    def read_pdf_outline(source: Source) -> list:
+        """[level, title, page] outline entries, or [] if the PDF has none."""
+        if not source or read_head(source, 4) != b"%PDF":
+            return []
+        return extract_outline_with_pymupdf(source)
+
     @staticmethod
     def clean_text(
         text: str,
@@ -84,39 +117,33 @@ class TextProcessor:
         # Determine document type based on is_pdf parameter
         kind = "pdf" if is_pdf else "txt"
 
-        # 1. Perform initial structural cleaning on the raw text.
-        text = C.remove_all_quotes(text)
-        text = C.fix_line_break_hyphenation(text)
-        text = C.remove_bottom_page_numbers(text)
-
-        # 2.
-        if remove_running_headers:
-            text = C.strip_firstline_headers(text)
+        # 1-3. Structural cleaning on the raw text (page by page)
+        text = C.clean_page_structure(
+            text,
+            remove_running_headers=remove_running_headers,
+            remove_bottom_footnotes=remove_bottom_footnotes,
+        )
 
-        # 3.
-        if remove_bottom_footnotes:
-            text = C.remove_footnote_markers(text)
-            text = C.remove_references(text)
-            text = C.remove_citation_lines(text)
-
-        # 4. Clean the actual content.
-        text = C.join_paragraphs_smart(text)
-        text = C._clean_special_characters(text)
-        text = C.fix_punctuation_spacing(text)
-
-        # 5. Perform a final validation check.
-        text = C._remove_midtext_roman_runs(text)
-
-        # 6. Finally, flatten the text.
-        text = C.final_flatten(text)
+        # 4-6. Clean the actual content and flatten it
+        text = C.clean_content(text)
 
         return text.strip()
 
+    @staticmethod
+    def split_into_chapters(text: str, toc: Optional[list] = None) -> List[H.Chapter]:
+        """Direct pass-through to chapters module."""
+        return H.split_into_chapters(text, toc)
+
     @staticmethod
     def smart_split_into_chunks(text: str, max_length: int = 2200) -> List[str]:
         """Direct pass-through to chunking module."""
         return K.smart_split_into_chunks(text, max_length)
 
+    @staticmethod
+    def split_into_tts_parts(text: str, max_length: int = 1800) -> List[str]:
+        """Direct pass-through to chunking module."""
+        return K.split_into_tts_parts(text, max_length)
+
     @staticmethod
     def get_text_stats(text: str) -> dict:
         """Direct pass-through to chunking module."""
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import bisect
+import hashlib
+import json
+import re
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+from .chunking import split_into_tts_parts
+from .storage import atomic_write_bytes, data_dir
+
+# Previous parts shorter than this are not used as anchors: a short sentence
+# ("Yes.") can match far too early and make the alignment skip real matches.
+MIN_ANCHOR_CHARS = 200
+
+# Below this share of reused parts the old layout is no help; chunk afresh.
+MIN_REUSE_FRACTION = 0.5
+
+# Previous parts are found in the new text by a digest of their first this
+# many characters (at word starts), then confirmed by a digest of the whole
+_HEAD_CHARS = 64
+
+# "book.pdf", "book.txt", "book.clean.txt" and "Book (1).txt" are one document
+_KEY_SUFFIX_RE = re.compile(r"(\.clean|\.skipped|\s*\(\d+\))+$", re.IGNORECASE)
+
+
+def document_key(file_name: str, lineage: str) -> str:
+    """
+    Name under which a document's last rendered layout is remembered.
+
+    `lineage` scopes it to where the uploads come from (a browser session, a
+    batch source directory), so one user's re-upload is never aligned with,
+    or told about, another user's book that merely has the same name.
+    """
+    stem = Path(file_name).stem
+    stem = _KEY_SUFFIX_RE.sub("", stem).strip().lower()
+    scoped = f"{lineage}\0{stem}"
+    return hashlib.sha256(scoped.encode("utf-8")).hexdigest()[:32]
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def part_digests(chunk: str) -> list:
+    """[length, head digest, digest] of a whitespace-normalised part."""
+    chunk = " ".join(chunk.split())
+    return [len(chunk), _digest(chunk[:_HEAD_CHARS]), _digest(chunk)]
+
+
+def load_revision(key: str, root=None) -> Optional[List[dict]]:
+    """
+    Chapters ({"title", "parts"}) last rendered for this document, if any;
+    each part is recorded by part_digests, not by its text.
+    """
+    path = Path(root or data_dir("revisions")) / f"{key}.json"
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            record = json.load(f)
+        return [{"title": c["title"], "parts": c["parts"]} for c in record["chapters"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_revision(key: str, chapters: Sequence[dict], root=None) -> None:
+    path = Path(root or data_dir("revisions")) / f"{key}.json"
+    record = {
+        "saved": time.time(),
+        "chapters": [
+            {"title": c["title"], "parts": [part_digests(p) for p in c["chunks"]]}
+            for c in chapters
+        ],
+    }
+    atomic_write_bytes(path, json.dumps(record).encode("utf-8"))
+
+
+def prune_revisions(max_age_s: float = 30 * 24 * 3600, root=None) -> int:
+    """Forget layouts of documents nobody has rendered for a month."""
+    cutoff = time.time() - max_age_s
+    removed = 0
+    for entry in Path(root or data_dir("revisions")).glob("*.json"):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                entry.unlink()
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def align_chapters(
+    text: str, previous: Sequence[dict], max_length: int = 1800
+) -> Tuple[Optional[List[dict]], int]:
+    """
+    Re-chunk edited text so unchanged passages keep their previous parts.
+
+    Every previous part found verbatim (whitespace-normalised) in the new text,
+    in order, is kept as-is; only the text between those anchors is split
+    afresh. Unchanged parts therefore hash exactly as before and come straight
+    from the synthesis cache, while an edit only disturbs the parts it
+    touches instead of shifting every boundary after it. New parts join the
+    chapter of the anchor before them, so a re-uploaded cleaned text keeps
+    the original chapter layout.
+
+    `previous` is what load_revision returns: parts are matched by digest,
+    starting at a word of the new text.
+
+    Returns (chapters, reused parts), or (None, 0) when less than
+    MIN_REUSE_FRACTION of the result could be reused.
+    """
+    text = " ".join(text.split())
+    pieces: List[Tuple[Optional[int], str]] = []  # (chapter if reused, chunk)
+    reused = 0
+    pos = 0
+
+    # Word starts of the new text by the digest of the characters there
+    starts = {}
+    for m in re.finditer(r"\S+", text):
+        head = text[m.start() : m.start() + _HEAD_CHARS]
+        starts.setdefault(_digest(head), []).append(m.start())
+
+    def _find(length: int, head: str, digest: str) -> int:
+        candidates = starts.get(head, [])
+        for at in candidates[bisect.bisect_left(candidates, pos) :]:
+            if _digest(text[at : at + length]) == digest:
+                return at
+        return -1
+
+    def _fill(gap: str):
+        if gap.strip():
+            pieces.extend((None, part) for part in split_into_tts_parts(gap, max_length))
+
+    for chapter, ch in enumerate(previous):
+        for length, head, digest in ch["parts"]:
+            if length < MIN_ANCHOR_CHARS:
+                continue
+            at = _find(length, head, digest)
+            if at < 0:
+                continue
+            _fill(text[pos:at])
+            pieces.append((chapter, text[at : at + length]))
+            reused += 1
+            pos = at + length
+    _fill(text[pos:])
+
+    if not pieces or reused < MIN_REUSE_FRACTION * len(pieces):
+        return None, 0
+
+    # Unanchored parts before the first anchor belong to its chapter
+    current = next(c for c, _ in pieces if c is not None)
+    chapters: List[dict] = []
+    for chapter, chunk in pieces:
+        current = chapter if chapter is not None else current
+        if not chapters or chapters[-1]["index"] != current:
+            chapters.append(
+                {"index": current, "title": previous[current]["title"], "chunks": []}
+            )
+        chapters[-1]["chunks"].append(chunk)
+    for c in chapters:
+        del c["index"]
+    return chapters, reused
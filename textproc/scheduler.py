@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import contextlib
+import heapq
+import itertools
+import os
+import threading
+import time
+from typing import List, Optional
+
+# Requests in flight to the TTS service from this process, over all jobs
+GLOBAL_CONCURRENCY = int(os.environ.get("BILBOT_TTS_GLOBAL_CONCURRENCY", 24))
+# "fair": jobs share slots by characters served (a small book is not stuck
+# behind a large one); "srpt": the job with the least text left goes first
+SCHEDULING_POLICY = os.environ.get("BILBOT_TTS_SCHEDULING", "fair").strip().lower()
+
+
+class _Waiter:
+    __slots__ = ("chars", "loop", "future", "granted", "queued")
+
+    def __init__(self, chars: int, loop: asyncio.AbstractEventLoop):
+        self.chars = chars
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+        self.queued = time.monotonic()
+
+
+class ScheduledJob:
+    """
+    One job's share of the scheduler. Its requests queue here, lowest
+    `priority` first, until the scheduler picks this job for a free slot.
+    """
+
+    def __init__(self, scheduler: "SynthesisScheduler", name: str, total_chars: int):
+        self.scheduler = scheduler
+        self.name = name
+        self.remaining_chars = max(0, total_chars)
+        self.vtime = 0.0  # characters served, in the scheduler's virtual clock
+        self.active = 0
+        self.granted = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.registered = time.monotonic()
+        self._waiters = []  # heap of (priority, seq, _Waiter)
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, w in self._waiters if not w.future.cancelled())
+
+    async def acquire(self, chars: int = 0, priority: int = 0) -> None:
+        waiter = self.scheduler._enqueue(self, chars, priority)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            self.scheduler._abandon(self, waiter)
+            raise
+
+    def try_acquire(self, chars: int = 0) -> bool:
+        """Take a slot only if one is free with nobody queued; never waits."""
+        return self.scheduler._try_grant(self, chars)
+
+    def release(self) -> None:
+        self.scheduler._release(self)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, chars: int = 0, priority: int = 0):
+        await self.acquire(chars, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def add_chars(self, chars: int) -> None:
+        """More text joined the job than it registered (a stream ran long)."""
+        with self.scheduler._lock:
+            self.remaining_chars += max(0, chars)
+
+    def part_done(self, chars: int) -> None:
+        """A part left the job (synthesized, reused or failed for good)."""
+        with self.scheduler._lock:
+            self.remaining_chars = max(0, self.remaining_chars - chars)
+
+    def stats(self) -> dict:
+        with self.scheduler._lock:
+            return {
+                "name": self.name,
+                "waiting": self.waiting,
+                "active": self.active,
+                "granted": self.granted,
+                "remaining_chars": self.remaining_chars,
+                "wait_total": round(self.wait_total, 3),
+                "wait_mean": round(self.wait_total / max(1, self.granted), 3),
+                "wait_max": round(self.wait_max, 3),
+            }
+
+
+class SynthesisScheduler:
+    """
+    Process-wide owner of every TTS request slot.
+
+    Jobs register for the time they synthesize and queue their requests here
+    (after their own AIMD window admits them), so `max_in_flight` caps the
+    whole process however many books render at once, on however many event
+    loops. Each free slot goes to the job with the fewest characters served
+    so far (start-time fair queuing: a job that was idle restarts from the
+    current virtual time instead of claiming a burst), or with policy "srpt"
+    to the job with the least text left. Within a job the lowest priority
+    (the earliest part) goes first.
+    """
+
+    def __init__(
+        self, max_in_flight: int = GLOBAL_CONCURRENCY, policy: str = SCHEDULING_POLICY
+    ):
+        if policy not in ("fair", "srpt"):
+            raise ValueError(f"Unknown scheduling policy {policy!r}")
+        self.max_in_flight = max(1, max_in_flight)
+        self.policy = policy
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._jobs: List[ScheduledJob] = []
+        self._vtime = 0.0
+        self._seq = itertools.count()
+
+    def register(self, name: str, total_chars: int = 0) -> ScheduledJob:
+        job = ScheduledJob(self, name, total_chars)
+        with self._lock:
+            job.vtime = self._vtime
+            self._jobs.append(job)
+        return job
+
+    def unregister(self, job: ScheduledJob) -> None:
+        """
+        Stop scheduling a job. Requests it still has queued would never be
+        picked again, so they are cancelled (their acquire() raises
+        CancelledError) rather than left waiting forever.
+        """
+        with self._lock:
+            if job in self._jobs:
+                self._jobs.remove(job)
+            waiters = [waiter for _, _, waiter in job._waiters]
+            job._waiters.clear()
+        for waiter in waiters:
+            try:
+                waiter.loop.call_soon_threadsafe(waiter.future.cancel)
+            except RuntimeError:
+                pass  # its event loop is gone
+
+    @contextlib.contextmanager
+    def job(self, name: str, total_chars: int = 0):
+        share = self.register(name, total_chars)
+        try:
+            yield share
+        finally:
+            self.unregister(share)
+
+    @property
+    def queue_depth(self) -> int:
+        with self._lock:
+            return sum(job.waiting for job in self._jobs)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            jobs = list(self._jobs)
+            in_flight = self.in_flight
+        stats = [job.stats() for job in jobs]
+        return {
+            "policy": self.policy,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": in_flight,
+            "queue_depth": sum(s["waiting"] for s in stats),
+            "jobs": stats,
+        }
+
+    # --- slot accounting (called by ScheduledJob) ---------------------------
+
+    def _enqueue(self, job: ScheduledJob, chars: int, priority: int) -> _Waiter:
+        waiter = _Waiter(chars, asyncio.get_running_loop())
+        with self._lock:
+            if job not in self._jobs:
+                waiter.future.cancel()  # unregistered: would never be picked
+                return waiter
+            if not job._waiters:
+                # Back from idle: no credit for the time it asked for nothing
+                job.vtime = max(job.vtime, self._vtime)
+            heapq.heappush(job._waiters, (priority, next(self._seq), waiter))
+            self._dispatch()
+        return waiter
+
+    def _try_grant(self, job: ScheduledJob, chars: int) -> bool:
+        with self._lock:
+            if (
+                job not in self._jobs
+                or self.in_flight >= self.max_in_flight
+                or any(j.waiting for j in self._jobs)
+            ):
+                return False
+            self._vtime = max(self._vtime, job.vtime)
+            job.vtime += max(1, chars)
+            job.active += 1
+            job.granted += 1
+            self.in_flight += 1
+            return True
+
+    def _abandon(self, job: ScheduledJob, waiter: _Waiter) -> None:
+        with self._lock:
+            if waiter.granted:
+                self._release_locked(job)  # granted just as it was cancelled
+            # otherwise _dispatch skips the cancelled future
+
+    def _release(self, job: ScheduledJob) -> None:
+        with self._lock:
+            self._release_locked(job)
+
+    def _release_locked(self, job: ScheduledJob) -> None:
+        self.in_flight -= 1
+        job.active -= 1
+        self._dispatch()
+
+    def _pick(self, ready: List[ScheduledJob]) -> ScheduledJob:
+        if self.policy == "srpt":
+            return min(ready, key=lambda j: (j.remaining_chars, j.vtime))
+        return min(ready, key=lambda j: j.vtime)
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiting requests; call with the lock held."""
+        while self.in_flight < self.max_in_flight:
+            for job in self._jobs:
+                while job._waiters and job._waiters[0][2].future.cancelled():
+                    heapq.heappop(job._waiters)
+            ready = [job for job in self._jobs if job._waiters]
+            if not ready:
+                return
+            job = self._pick(ready)
+            _, _, waiter = heapq.heappop(job._waiters)
+            self._vtime = max(self._vtime, job.vtime)
+            job.vtime += max(1, waiter.chars)
+            job.active += 1
+            job.granted += 1
+            waited = time.monotonic() - waiter.queued
+            job.wait_total += waited
+            job.wait_max = max(job.wait_max, waited)
+            waiter.granted = True
+            self.in_flight += 1
+            try:
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+            except RuntimeError:
+                # Its event loop is gone; nobody will use or release the slot
+                self.in_flight -= 1
+                job.active -= 1
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+_scheduler: Optional[SynthesisScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def scheduler() -> SynthesisScheduler:
+    """The process-wide scheduler, created on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = SynthesisScheduler()
+        return _scheduler
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import math
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+from .storage import atomic_write_bytes, data_dir
+from .telemetry import SIZE_BIN_CHARS, load_reports
+
+logger = logging.getLogger(__name__)
+
+SAFE_MAX = 1800  # conservative per-call limit for edge-tts
+MIN_PART_CHARS = 400
+SIZE_STEP = 100
+
+# A voice needs this many synthesized parts, spread over at least this
+# standard deviation of sizes, before its fit is trusted over SAFE_MAX
+MIN_SAMPLES = 30
+MIN_SPREAD_CHARS = 150.0
+
+# Pseudo-attempts at the voice's overall failure rate added to each size bin
+_FAILURE_PRIOR = 20.0
+
+# Refit from the telemetry reports when the saved models are older than this
+MODEL_REFIT_S = 3600.0
+
+# Sizes whose expected time is within this fraction of the best are treated
+# as equal, and the largest of them wins: fewer requests and part seams
+_TIE_FRACTION = 0.02
+
+
+def fit_size_model(stats: dict) -> Optional[dict]:
+    """
+    Fit latency = intercept + slope * chars and a per-size failure rate from
+    one SynthesisStats report; None when there is too little data.
+    """
+    fit = stats.get("fit") or {}
+    n = fit.get("n", 0)
+    if n < MIN_SAMPLES:
+        return None
+    mean_x = fit["sx"] / n
+    mean_y = fit["sy"] / n
+    var_x = fit["sxx"] / n - mean_x * mean_x
+    if var_x < MIN_SPREAD_CHARS ** 2:
+        return None  # all parts about one size: fixed and per-char cost inseparable
+    slope = (fit["sxy"] / n - mean_x * mean_y) / var_x
+    intercept = mean_y - slope * mean_x
+    if slope <= 0 or intercept < 0:
+        # Noise dominated; fall back to a proportional model
+        slope, intercept = max(fit["sy"] / max(fit["sx"], 1.0), 1e-6), 0.0
+
+    bins = {int(k): v for k, v in (stats.get("size_bins") or {}).items() if v[0]}
+    attempts = sum(a for a, _ in bins.values())
+    failures = sum(f for _, f in bins.values())
+    overall = failures / attempts if attempts else 0.0
+    failure_bins = {
+        size: (f + _FAILURE_PRIOR * overall) / (a + _FAILURE_PRIOR)
+        for size, (a, f) in bins.items()
+    }
+    return {
+        "intercept": round(intercept, 6),
+        "slope": round(slope, 9),
+        "samples": int(n),
+        "failure_rate": round(overall, 6),
+        "failure_bins": {str(k): round(v, 6) for k, v in sorted(failure_bins.items())},
+        "range": [
+            min(bins, default=int(mean_x)),
+            max(bins, default=int(mean_x)) + SIZE_BIN_CHARS,
+        ],
+    }
+
+
+def _failure(model: dict, chars: float) -> float:
+    bins = model["failure_bins"]
+    if not bins:
+        return model["failure_rate"]
+    key = int(chars) // SIZE_BIN_CHARS * SIZE_BIN_CHARS
+    nearest = min(bins, key=lambda k: abs(int(k) - key))
+    return bins[nearest]
+
+
+def expected_seconds(model: dict, size: int, total_chars: int, concurrency: int) -> float:
+    """
+    Expected synthesis time of `total_chars` split at `size` characters with
+    `concurrency` requests in flight: rounds of parallel requests, each part
+    retried until it succeeds.
+    """
+    parts = max(1, math.ceil(total_chars / size))
+    chars = total_chars / parts  # the splitter balances part lengths
+    latency = model["intercept"] + model["slope"] * chars
+    p_fail = min(_failure(model, chars), 0.9)
+    rounds = math.ceil(parts / max(1, concurrency))
+    return rounds * latency / (1.0 - p_fail)
+
+
+# ============================================================================
+# PERSISTED MODELS
+# ============================================================================
+
+
+def _models_path(root=None) -> Path:
+    return Path(root or data_dir("sizing")) / "models.json"
+
+
+def _read_models(root=None) -> Optional[dict]:
+    try:
+        with open(_models_path(root), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def refit_models(root=None) -> dict:
+    """
+    Refit every voice (and the pooled "*" model) from the telemetry reports
+    and save them. Voices without enough new data keep their saved model,
+    so what was learned survives the telemetry files being pruned.
+    """
+    saved = _read_models(root) or {}
+    models = dict(saved.get("voices") or {})
+    report = load_reports()
+    for voice, stats in report["voices"].items():
+        model = fit_size_model(stats)
+        if model:
+            models[voice] = model
+    pooled = fit_size_model(report["total"])
+    if pooled:
+        models["*"] = pooled
+    record = {"fitted": time.time(), "voices": models}
+    atomic_write_bytes(_models_path(root), json.dumps(record, indent=1).encode("utf-8"))
+    return record
+
+
+def load_models(root=None) -> dict:
+    record = _read_models(root)
+    if record is None or time.time() - record.get("fitted", 0) > MODEL_REFIT_S:
+        try:
+            record = refit_models(root)
+        except OSError as e:
+            logger.warning("Refitting chunk-size models failed: %s", e)
+            record = record or {"voices": {}}
+    return record
+
+
+def pick_part_size(
+    total_chars: int,
+    voice: Optional[str] = None,
+    concurrency: int = 6,
+    default: int = SAFE_MAX,
+    root=None,
+) -> Tuple[int, str]:
+    """
+    Part size (characters) with the lowest expected synthesis time for a
+    document of `total_chars`, from the voice's fitted model (or the pooled
+    one). Returns (size, source): source is the model's name, or "default"
+    with `default` when no model has enough data yet.
+    """
+    models = load_models(root)["voices"]
+    name = voice if voice in models else "*"
+    model = models.get(name)
+    if model is None or total_chars <= MIN_PART_CHARS:
+        return default, "default"
+    # Don't extrapolate far beyond the sizes the model has seen
+    lo = max(MIN_PART_CHARS, model["range"][0] - 2 * SIZE_BIN_CHARS)
+    hi = min(SAFE_MAX, model["range"][1] + 2 * SIZE_BIN_CHARS)
+    candidates = list(range(lo - lo % SIZE_STEP, hi + 1, SIZE_STEP)) or [default]
+    scored = [
+        (expected_seconds(model, size, total_chars, concurrency), size)
+        for size in candidates
+        if size >= MIN_PART_CHARS
+    ]
+    if not scored:
+        return default, "default"
+    best = min(t for t, _ in scored)
+    size = max(s for t, s in scored if t <= best * (1 + _TIE_FRACTION))
+    return size, name
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Shared on-disk state (caches, manifests). Every session on the host uses the
+# same root so work done by one session benefits the others.
+DATA_ROOT = Path(
+    os.environ.get("BILBOT_DATA_DIR")
+    or os.path.join(tempfile.gettempdir(), "bilbot-baggins")
+)
+
+
+def data_dir(name: str) -> Path:
+    """Return (and create) a named subdirectory of the data root."""
+    path = DATA_ROOT / name
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def atomic_write_bytes(path, data: bytes) -> None:
+    """Write via a temp file in the same directory, then rename into place."""
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        _unlink_quietly(tmp)
+        raise
+
+
+def atomic_copy(src, dst) -> None:
+    """Copy src to dst so readers never observe a partially written file."""
+    dst = Path(dst)
+    fd, tmp = tempfile.mkstemp(dir=dst.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as out, open(src, "rb") as inp:
+            shutil.copyfileobj(inp, out)
+        os.replace(tmp, dst)
+    except BaseException:
+        _unlink_quietly(tmp)
+        raise
+
+
+@contextlib.contextmanager
+def mapped_file(path):
+    """A file's contents as a read-only memory map (b"" if it is empty)."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+def spool_to_file(fileobj, path, chunk_size: int = 1 << 20) -> str:
+    """
+    Copy a file object to `path` a chunk at a time, hashing on the way;
+    returns the SHA-256 hex digest. The file appears atomically.
+    """
+    path = Path(path)
+    digest = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: fileobj.read(chunk_size), b""):
+                digest.update(chunk)
+                out.write(chunk)
+        os.replace(tmp, path)
+    except BaseException:
+        _unlink_quietly(tmp)
+        raise
+    return digest.hexdigest()
+
+
+def _unlink_quietly(path) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+class LRUFileStore:
+    """
+    Content-addressed files (root/ab/abcd...<suffix>), evicted least recently
+    used first once the directory grows past `max_bytes`; a file's mtime is
+    its LRU timestamp. Subclasses add typed get/put methods on top of
+    _entry(), _hit(), _miss() and _added(). Safe to share between sessions
+    and processes: the worst case of a race is one redundant entry.
+    """
+
+    suffix = ""
+    label = "Cache"  # for log messages
+
+    def __init__(self, root, max_bytes: int):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None  # lazily measured
+
+    def _entry(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}{self.suffix}"
+
+    def _hit(self, entry: Path) -> None:
+        try:
+            os.utime(entry)
+        except OSError:
+            pass  # only the LRU order suffers; the entry was served
+        with self._lock:
+            self.hits += 1
+
+    def _miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def _added(self, size: int) -> None:
+        """Account for a new entry of `size` bytes, evicting if over the cap."""
+        with self._lock:
+            if self._size is None:
+                self._size = self._measure()
+            else:
+                self._size += size
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def _files(self):
+        return self.root.glob(f"*/*{self.suffix}")
+
+    def evict(self) -> int:
+        """Drop least-recently-used entries until under 90% of the cap."""
+        entries = []
+        for path in self._files():
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        with self._lock:
+            self._size = total
+        if removed:
+            logger.info("%s evicted %d entries (%d bytes left)", self.label, removed, total)
+        return removed
+
+    def _measure(self) -> int:
+        total = 0
+        for path in self._files():
+            try:
+                total += path.stat().st_size
+            except OSError:
+                pass
+        return total
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
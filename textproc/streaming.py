@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming text pipeline: pages -> cleaned page text -> sentences -> TTS parts.
+
+Every stage is a generator that holds at most a page or two of text, so
+parts come out while later pages are still being extracted and the book is
+never held in memory as one string. synthesize_stream() consumes such a
+stream and renders parts as they arrive into one growing MP3.
+
+Only the structure the page-by-page cleaners see is kept: the result is one
+chapter (chapter detection needs the whole text), and revisions and resume
+manifests (which key on the full list of parts) are not used.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import re
+import sys
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from . import cleaners as C
+from .audio_cache import AudioCache
+from .chunking import _balanced_pack, sentence_units, split_into_sentences
+from .concurrency import AIMDLimiter
+from .extractors import (
+    PAGE_BREAK,
+    Source,
+    _open_pdf,
+    iter_pages_with_pymupdf,
+    read_head,
+    source_size,
+)
+from .mp3 import OrderedPrefixWriter
+from .processor import TextProcessor
+from .scheduler import scheduler
+from .sizing import SAFE_MAX
+from .synthesis import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_PART_TIMEOUT,
+    _init_metrics,
+    _log_job_metrics,
+    _part_runner,
+    _supervise,
+    _supervised,
+    sanitize_for_tts,
+)
+from .telemetry import telemetry
+from .tts_backends import TTSBackend
+
+logger = logging.getLogger(__name__)
+
+# A sentence still open after this many characters is passed on as it is
+# (the part splitter breaks it between words), so the carry stays bounded
+_MAX_CARRY_CHARS = 20000
+
+# Parts are balanced over a window of this many parts; all but the last
+# piece of each window are emitted
+_PACK_WINDOW_PARTS = 8
+
+# Word broken by a hyphen at the very end of a page / first word of the next
+_PAGE_END_HYPHEN_RE = re.compile(rf"([A-Za-z]){C._HYPHEN_CHARS}\s*$")
+_PAGE_START_WORD_RE = re.compile(r"^\s*([A-Za-z]\S*)")
+
+
+# ============================================================================
+# PAGES
+# ============================================================================
+
+
+def iter_pages(source: Source, file_name: str) -> Iterator[str]:
+    """
+    Raw page texts of a PDF (as extracted) or TXT (split on form feeds);
+    `source` is the file's bytes or its path.
+    """
+    is_pdf = file_name.lower().endswith(".pdf") or read_head(source, 5) == b"%PDF-"
+    if is_pdf:
+        yield from iter_pages_with_pymupdf(source)
+        return
+    text = TextProcessor.read_text_file(source)
+    start = 0
+    while start <= len(text):
+        end = text.find(PAGE_BREAK, start)
+        if end == -1:
+            end = len(text)
+        yield text[start:end]
+        start = end + 1
+
+
+def iter_clean_pages(
+    pages: Iterable[str], remove_headers: bool = True, remove_footnotes: bool = True
+) -> Iterator[str]:
+    """
+    Cleaned, flattened text of each page. Headers, page numbers and footnote
+    regions are removed per page; one page of lookahead rejoins a word
+    hyphenated across the page break.
+    """
+    held: Optional[str] = None
+    for page in pages:
+        page = C.clean_page_structure(
+            page,
+            remove_running_headers=remove_headers,
+            remove_bottom_footnotes=remove_footnotes,
+        )
+        if held is not None:
+            held, page = _join_hyphenated(held, page)
+            cleaned = C.clean_content(held)
+            if cleaned:
+                yield cleaned
+        held = page
+    if held is not None:
+        cleaned = C.clean_content(held)
+        if cleaned:
+            yield cleaned
+
+
+def _join_hyphenated(page: str, following: str):
+    end = _PAGE_END_HYPHEN_RE.search(page)
+    if not end:
+        return page, following
+    start = _PAGE_START_WORD_RE.match(following)
+    if not start:
+        return page, following
+    return page[: end.start() + 1] + start.group(1), following[start.end() :]
+
+
+# ============================================================================
+# SENTENCES AND PARTS
+# ============================================================================
+
+
+def iter_sentences(texts: Iterable[str]) -> Iterator[str]:
+    """Sentences across page texts; the last, possibly open one is carried."""
+    carry = ""
+    for text in texts:
+        carry = f"{carry} {text}" if carry else text
+        sentences = split_into_sentences(carry)
+        if not sentences:
+            carry = ""
+            continue
+        yield from sentences[:-1]
+        carry = sentences[-1]
+        if len(carry) > _MAX_CARRY_CHARS:
+            yield carry
+            carry = ""
+    if carry:
+        yield carry
+
+
+def iter_tts_parts(sentences: Iterable[str], max_length: int = SAFE_MAX) -> Iterator[str]:
+    """
+    TTS parts of at most `max_length` from a stream of sentences, balanced
+    like split_into_tts_parts but over a window of a few parts at a time.
+    """
+    window = _PACK_WINDOW_PARTS * max_length
+    units: List[str] = []
+    size = 0
+    for sentence in sentences:
+        for unit in sentence_units(sentence, max_length):
+            units.append(unit)
+            size += len(unit) + 1
+        if size >= window:
+            pieces = _balanced_pack(units, max_length)
+            yield from pieces[:-1]
+            units = pieces[-1:]
+            size = len(units[0]) + 1
+    yield from _balanced_pack(units, max_length)
+
+
+# Text on a typical book page, to size a PDF before any of it is extracted
+_CHARS_PER_PAGE = 2000
+
+
+def estimate_chars(source: Source, file_name: str) -> int:
+    """
+    Rough length of a document's text before it is streamed, so the
+    scheduler can rank a stream against books whose length is known.
+    """
+    if not (file_name.lower().endswith(".pdf") or read_head(source, 5) == b"%PDF-"):
+        return source_size(source)
+    try:
+        with _open_pdf(source) as doc:
+            return doc.page_count * _CHARS_PER_PAGE
+    except Exception:
+        return 0
+
+
+def stream_document(
+    source: Source,
+    file_name: str,
+    remove_headers: bool = True,
+    remove_footnotes: bool = True,
+    max_length: int = SAFE_MAX,
+) -> Iterator[str]:
+    """TTS parts of a document, yielded as its pages are extracted and cleaned."""
+    pages = iter_pages(source, file_name)
+    texts = iter_clean_pages(pages, remove_headers, remove_footnotes)
+    return iter_tts_parts(iter_sentences(texts), max_length)
+
+
+# ============================================================================
+# SYNTHESIS OF A STREAM
+# ============================================================================
+
+_END = object()
+
+
+async def synthesize_stream_async(
+    parts: Iterable[str],
+    voice: str,
+    out_dir: str,
+    out_path: str,
+    rate_pct: int,
+    pitch_hz: int,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    cache: Optional[AudioCache] = None,
+    metrics: Optional[dict] = None,
+    backend: Optional[TTSBackend] = None,
+    part_timeout: Optional[float] = DEFAULT_PART_TIMEOUT,
+    job_timeout: Optional[float] = None,
+    hedge_percentile: Optional[float] = None,
+    cancel: Optional[threading.Event] = None,
+    on_tick: Optional[Callable[[], None]] = None,
+    on_part_done: Optional[Callable[[int, bool, int], None]] = None,
+    name: str = "stream",
+    total_chars: int = 0,
+) -> List[Optional[str]]:
+    """
+    Synthesize parts as the `parts` iterator produces them.
+
+    The iterator is advanced on a helper thread, at most a few windows of
+    requests ahead of synthesis, so extraction and cleaning of later pages
+    overlap synthesis of earlier ones without running away from it. Parts
+    are written to `out_dir` and appended in order to `out_path` as they
+    land. Each part takes the same request path as synthesize_parts_async
+    (AIMD limiter, process-wide scheduler, retries, deadline, hedging,
+    repeats synthesized once, audio cache, telemetry), and `cancel`,
+    `job_timeout` and `on_tick` are honoured while waiting for the iterator
+    as well as for parts. Returns one entry per part, in the order the
+    iterator yielded them: its MP3 path, or None if it failed;
+    `on_part_done(index, ok, done)` fires as each finishes.
+
+    `total_chars` estimates the text the iterator will yield (see
+    estimate_chars), for the scheduler's "srpt" policy; it is raised as
+    parts arrive if the stream turns out longer.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + job_timeout if job_timeout else None
+    share = scheduler().register(name, total_chars)
+    expected = total_chars
+    limiter = AIMDLimiter(
+        initial=concurrency,
+        max_limit=max(concurrency, max_concurrency),
+        upstream=share,
+    )
+    recorder = telemetry().job(name, voice)
+    metrics = _init_metrics(metrics)
+    prefix = OrderedPrefixWriter(out_path, sys.maxsize)
+    ahead = asyncio.Semaphore(2 * max(concurrency, max_concurrency))
+    results: List[Optional[str]] = []
+    tasks: List[asyncio.Future] = []
+    run_part = _part_runner(
+        results,
+        voice,
+        out_dir,
+        rate_pct,
+        pitch_hz,
+        metrics,
+        limiter,
+        share,
+        recorder,
+        unique={},
+        cache=cache,
+        backend=backend,
+        part_timeout=part_timeout,
+        deadline=deadline,
+        hedge_percentile=hedge_percentile,
+        prefix=prefix,
+        on_part_done=on_part_done,
+    )
+
+    async def run(i: int, text: str):
+        try:
+            await run_part(i, text)
+        finally:
+            ahead.release()
+
+    # The iterator only ever runs on the pull thread: it is advanced one item
+    # at a time, and closed there once the stream ends or is abandoned
+    iterator = iter(parts)
+    pull = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="stream")
+    stop = threading.Event()
+
+    def _next():
+        return _END if stop.is_set() else next(iterator, _END)
+
+    def _close():
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+
+    pulled_chars = 0
+    try:
+        while True:
+            await _supervised(ahead.acquire(), cancel, deadline, on_tick)
+            pulled = loop.run_in_executor(pull, _next)
+            text = await _supervised(pulled, cancel, deadline, on_tick)
+            if text is _END:
+                ahead.release()
+                break
+            pulled_chars += len(text)
+            if pulled_chars > expected:
+                share.add_chars(pulled_chars - expected)
+                expected = pulled_chars
+            results.append(None)
+            tasks.append(
+                asyncio.ensure_future(run(len(results) - 1, sanitize_for_tts(text)))
+            )
+            for task in tasks:
+                if task.done() and task.exception() is not None:
+                    raise task.exception()
+        prefix.total = len(results)
+        await _supervise(tasks, cancel, deadline, on_tick)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # A pull still in progress finishes first; no further item is read
+        stop.set()
+        closing = asyncio.wrap_future(pull.submit(_close))
+        try:
+            await asyncio.gather(closing, return_exceptions=True)
+        finally:
+            pull.shutdown(wait=True)
+        prefix.close()
+        metrics["concurrency"] = limiter.snapshot()
+        metrics["scheduler"] = share.stats()
+        metrics["telemetry"] = recorder.report()
+        scheduler().unregister(share)
+        telemetry().save()
+    _log_job_metrics(len(results), metrics)
+    return results
+
+
+def synthesize_stream(*args, **kwargs) -> List[Optional[str]]:
+    """Blocking entry point for synthesize_stream_async."""
+    return asyncio.run(synthesize_stream_async(*args, **kwargs))
@@ -0,0 +1,705 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import contextlib
+import functools
+import logging
+import os
+import random
+import shutil
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .audio_cache import AudioCache
+from .concurrency import AIMDLimiter, LatencyTracker
+from .manifest import JobManifest, sha256_text
+from .mp3 import OrderedPrefixWriter
+from .scheduler import ScheduledJob, scheduler
+from .telemetry import JobTelemetry, telemetry
+from .tts_backends import TTSBackend, make_backend
+
+logger = logging.getLogger(__name__)
+
+# Parts in flight at once; TTS time is dominated by network round-trips.
+# The adaptive limiter starts at DEFAULT_CONCURRENCY and may grow to the max.
+DEFAULT_CONCURRENCY = 6
+DEFAULT_MAX_CONCURRENCY = 16
+
+# A single request that has not answered within this many seconds is treated
+# as hung: it is cancelled and retried (and counts as a failure for AIMD).
+DEFAULT_PART_TIMEOUT = 60.0
+
+# Exponential backoff with full jitter: sleep U(0, min(cap, base * 2**n)).
+BACKOFF_BASE = 0.8
+BACKOFF_CAP = 20.0
+
+# How often the engine checks for cancellation and calls on_tick.
+_TICK_SECONDS = 0.25
+
+
+class SynthesisCancelled(Exception):
+    """The job's cancel event was set; in-flight requests were cancelled."""
+
+
+class SynthesisDeadlineExceeded(TimeoutError):
+    """The whole-job deadline passed before every part was synthesized."""
+
+_default_backend: Optional[TTSBackend] = None
+
+
+def default_backend() -> TTSBackend:
+    """Process-wide backend chosen by BILBOT_TTS_BACKEND (default: edge-tts)."""
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = make_backend(os.environ.get("BILBOT_TTS_BACKEND"))
+    return _default_backend
+
+
+def sanitize_for_tts(text: str) -> str:
+    """Light sanitization for TTS."""
+    return text.replace("&", " and ").replace("<", "").replace(">", "")
+
+
+async def synthesize_mp3_async(
+    text: str,
+    voice: str,
+    out_path: str,
+    rate_pct: int,
+    pitch_hz: int,
+    backend: Optional[TTSBackend] = None,
+):
+    """Async synthesis."""
+    backend = backend or default_backend()
+    audio = await backend.synthesize(text, voice, rate_pct, pitch_hz)
+    if not audio:
+        raise RuntimeError(f"{backend.name} returned no audio")
+    with open(out_path, "wb") as f:
+        f.write(audio)
+
+
+async def synthesize_with_retry_async(
+    text: str,
+    voice: str,
+    out_path: str,
+    rate_pct: int,
+    pitch_hz: int,
+    tries: int = 3,
+    delay: float = BACKOFF_BASE,
+    cache: Optional[AudioCache] = None,
+    metrics: Optional[dict] = None,
+    backend: Optional[TTSBackend] = None,
+    limiter: Optional[AIMDLimiter] = None,
+    part_timeout: Optional[float] = DEFAULT_PART_TIMEOUT,
+    deadline: Optional[float] = None,
+    latency: Optional[LatencyTracker] = None,
+    hedge_percentile: Optional[float] = None,
+    priority: int = 0,
+    recorder: Optional[JobTelemetry] = None,
+) -> bool:
+    """
+    Retry on the running loop; backoff sleeps never block other parts.
+
+    Each attempt is cut off after `part_timeout` seconds, and no attempt or
+    backoff runs past `deadline` (an absolute loop.time()). Backoff is
+    exponential with full jitter, starting from `delay`.
+
+    With `hedge_percentile` and a job-wide `latency` tracker, an attempt that
+    is still running after that percentile of observed latency gets a
+    duplicate request; the first good answer wins and the other is cancelled.
+
+    With a cache, a previously rendered identical part is copied to out_path
+    without touching the network, and fresh renders are stored for reuse.
+    With a limiter, each attempt holds one of its slots (released during
+    backoff, requested at `priority`) and reports its outcome so the job's
+    window can adapt. A `recorder` receives the part's latency, audio size,
+    retries and failed attempts.
+    """
+    loop = asyncio.get_running_loop()
+    backend = backend or default_backend()
+    key = None
+    if cache is not None:
+        key = AudioCache.make_key(text, voice, rate_pct, pitch_hz, backend.version)
+        hit = cache.fetch(key, out_path)
+        if metrics is not None:
+            counter = "cache_hits" if hit else "cache_misses"
+            metrics[counter] = metrics.get(counter, 0) + 1
+        if hit:
+            if recorder is not None:
+                recorder.record_cached()
+            return True
+
+    def _give_up(attempts: int) -> bool:
+        if recorder is not None:
+            recorder.record_part_failed(len(text), retries=max(0, attempts - 1))
+        return False
+
+    for attempt in range(1, tries + 1):
+        timeout = part_timeout
+        if deadline is not None:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return _give_up(attempt - 1)
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        request = functools.partial(
+            _request_audio,
+            backend,
+            text,
+            voice,
+            rate_pct,
+            pitch_hz,
+            limiter,
+            timeout,
+            priority=priority,
+        )
+        try:
+            if hedge_percentile and latency is not None:
+                hedge_after = functools.partial(
+                    latency.hedge_delay, hedge_percentile, len(text)
+                )
+                audio, seconds = await _hedged(
+                    request, hedge_after, metrics, limiter, len(text)
+                )
+            else:
+                audio, seconds = await request()
+            if latency is not None:
+                latency.observe(seconds, len(text))
+            if recorder is not None:
+                recorder.record_part(len(text), seconds, len(audio), retries=attempt - 1)
+            with open(out_path, "wb") as f:
+                f.write(audio)
+            if cache is not None:
+                cache.store(key, out_path)
+            return True
+        except Exception as e:
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            if timed_out:
+                _count(metrics, "timeouts")
+            if recorder is not None:
+                recorder.record_failure(timeout=timed_out)
+            if attempt < tries:
+                pause = random.uniform(0, min(BACKOFF_CAP, delay * 2 ** (attempt - 1)))
+                if deadline is not None and loop.time() + pause >= deadline:
+                    return _give_up(attempt)
+                await asyncio.sleep(pause)
+    return _give_up(tries)
+
+
+@contextlib.asynccontextmanager
+async def _no_slot():
+    yield
+
+
+def _count(metrics: Optional[dict], key: str) -> None:
+    if metrics is not None:
+        metrics[key] = metrics.get(key, 0) + 1
+
+
+async def _request_audio(
+    backend: TTSBackend,
+    text: str,
+    voice: str,
+    rate_pct: int,
+    pitch_hz: int,
+    limiter: Optional[AIMDLimiter],
+    timeout: Optional[float],
+    granted: Optional[asyncio.Event] = None,
+    use_slot: bool = True,
+    priority: int = 0,
+) -> Tuple[bytes, float]:
+    """One backend call inside a limiter slot; returns (audio, seconds in service)."""
+    loop = asyncio.get_running_loop()
+    slot = limiter.slot(len(text), priority) if limiter and use_slot else _no_slot()
+    async with slot:
+        if granted is not None:
+            granted.set()
+        started = loop.time()
+        audio = await asyncio.wait_for(
+            backend.synthesize(text, voice, rate_pct, pitch_hz), timeout
+        )
+        if not audio:
+            raise RuntimeError(f"{backend.name} returned no audio")
+    return audio, loop.time() - started
+
+
+async def _hedged(
+    request: Callable[..., Awaitable[Tuple[bytes, float]]],
+    hedge_after: Callable[[], Optional[float]],
+    metrics: Optional[dict],
+    limiter: Optional[AIMDLimiter] = None,
+    chars: int = 0,
+) -> Tuple[bytes, float]:
+    """
+    Run `request`; if it is still in service `hedge_after()` seconds after it
+    got a slot, race a duplicate and keep whichever succeeds first. The delay
+    is read only once the slot is granted, so it reflects the latency observed
+    while this part was queued (None means too few samples: never hedge).
+    """
+    granted = asyncio.Event()
+    primary = asyncio.ensure_future(request(granted=granted))
+    racers = {primary}
+    try:
+        got_slot = asyncio.ensure_future(granted.wait())
+        await asyncio.wait({primary, got_slot}, return_when=asyncio.FIRST_COMPLETED)
+        got_slot.cancel()
+        delay = None if primary.done() else hedge_after()
+        if delay is not None:
+            await asyncio.wait({primary}, timeout=delay)
+        if delay is None or primary.done():
+            return await primary
+
+        # The duplicate skips the job's AIMD queue (waiting behind other parts
+        # would defeat it, and only the slowest few percent get hedged), but
+        # still needs a process-wide slot: it is only sent if one is free now.
+        upstream = limiter.upstream if limiter is not None else None
+        if upstream is not None and not upstream.try_acquire(chars):
+            _count(metrics, "hedges_skipped")
+            return await primary
+        _count(metrics, "hedges_issued")
+        hedge = asyncio.ensure_future(request(use_slot=False))
+        if upstream is not None:
+            hedge.add_done_callback(lambda _: upstream.release())
+        racers.add(hedge)
+        error: Optional[BaseException] = None
+        while racers:
+            done, racers = await asyncio.wait(
+                racers, return_when=asyncio.FIRST_COMPLETED
+            )
+            winner = None
+            for task in done:
+                if task.exception() is None:
+                    winner = winner or task
+                else:
+                    error = task.exception()
+            if winner is not None:
+                if winner is hedge:
+                    _count(metrics, "hedges_won")
+                return winner.result()
+        raise error
+    finally:
+        for task in racers:
+            task.cancel()
+
+
+def synthesize_with_retry(*args, **kwargs) -> bool:
+    """Blocking wrapper around synthesize_with_retry_async for one part."""
+    return asyncio.run(synthesize_with_retry_async(*args, **kwargs))
+
+
+# ============================================================================
+# CONCURRENT ENGINE
+# ============================================================================
+
+
+# Engine counters, all summed over the chapters of a book
+_SUMMED_METRICS = (
+    "cache_hits",
+    "cache_misses",
+    "resumed",
+    "timeouts",
+    "hedges_issued",
+    "hedges_won",
+    "hedges_skipped",
+    "deduplicated",
+)
+
+
+async def synthesize_parts_async(
+    parts: Sequence[str],
+    voice: str,
+    out_dir: str,
+    rate_pct: int,
+    pitch_hz: int,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    on_part_done: Optional[Callable[[int, bool, int], None]] = None,
+    cache: Optional[AudioCache] = None,
+    metrics: Optional[dict] = None,
+    manifest: Optional[JobManifest] = None,
+    backend: Optional[TTSBackend] = None,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    limiter: Optional[AIMDLimiter] = None,
+    part_timeout: Optional[float] = DEFAULT_PART_TIMEOUT,
+    job_timeout: Optional[float] = None,
+    cancel: Optional[threading.Event] = None,
+    on_tick: Optional[Callable[[], None]] = None,
+    hedge_percentile: Optional[float] = None,
+    prefix: Optional[OrderedPrefixWriter] = None,
+    priority_base: int = 0,
+    unique: Optional[Dict[str, asyncio.Future]] = None,
+    share: Optional[ScheduledJob] = None,
+    recorder: Optional[JobTelemetry] = None,
+) -> List[Optional[str]]:
+    """
+    Synthesize all parts on one event loop. Returns one entry per part, in
+    input order: its MP3 path, or None if it failed after retries. Repeated
+    parts are synthesized once and their audio copied.
+
+    concurrency / max_concurrency: AIMD window start and ceiling (equal for
+        a fixed cap); `limiter` replaces it, e.g. one shared by several jobs.
+    share: this job's slot share in the process-wide scheduler (made here
+        unless a limiter is given, whose upstream is used).
+    manifest: reuse parts it records as done and record new ones, so an
+        interrupted job resumes; `out_dir` should be its directory.
+    part_timeout / job_timeout: per request / whole job, in seconds; the
+        latter raises SynthesisDeadlineExceeded.
+    cancel: setting it from any thread raises SynthesisCancelled promptly.
+    on_part_done(index, ok, done): in completion order; on_tick(): a few
+        times a second. On cancel, deadline or a callback error, in-flight
+        requests are cancelled first.
+    hedge_percentile: e.g. 95, duplicate requests slower than that.
+    prefix: receives each finished part, for a playable opening.
+    priority_base: added to part indexes for limiter slot priority.
+    unique: text hash -> first occurrence; share it to dedup across jobs.
+    recorder: telemetry job for per-part stats (made here if omitted).
+    metrics: receives counters plus "concurrency", "scheduler" and
+        "telemetry" reports.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + job_timeout if job_timeout else None
+    own_share = share is None and limiter is None
+    if own_share:
+        share = scheduler().register("parts", sum(len(text) for text in parts))
+    if limiter is None:
+        limiter = AIMDLimiter(
+            initial=concurrency,
+            max_limit=max(concurrency, max_concurrency),
+            upstream=share,
+        )
+    share = share or limiter.upstream
+    own_recorder = recorder is None
+    if own_recorder:
+        recorder = telemetry().job(share.name if share else "parts", voice)
+    metrics = _init_metrics(metrics)
+    results: List[Optional[str]] = [None] * len(parts)
+    run = _part_runner(
+        results,
+        voice,
+        out_dir,
+        rate_pct,
+        pitch_hz,
+        metrics,
+        limiter,
+        share,
+        recorder,
+        unique={} if unique is None else unique,
+        cache=cache,
+        manifest=manifest,
+        backend=backend,
+        part_timeout=part_timeout,
+        deadline=deadline,
+        hedge_percentile=hedge_percentile,
+        prefix=prefix,
+        priority_base=priority_base,
+        on_part_done=on_part_done,
+    )
+    tasks = [asyncio.ensure_future(run(i, text)) for i, text in enumerate(parts)]
+    try:
+        await _supervise(tasks, cancel, deadline, on_tick)
+    finally:
+        metrics["concurrency"] = limiter.snapshot()
+        if share is not None:
+            metrics["scheduler"] = share.stats()
+        if own_share:
+            scheduler().unregister(share)
+        if own_recorder:
+            metrics["telemetry"] = recorder.report()
+            telemetry().save()
+    _log_job_metrics(len(parts), metrics)
+    return results
+
+
+def _init_metrics(metrics: Optional[dict]) -> dict:
+    if metrics is None:
+        metrics = {}
+    for key in _SUMMED_METRICS:
+        metrics.setdefault(key, 0)
+    return metrics
+
+
+def _log_job_metrics(num_parts: int, metrics: dict) -> None:
+    logger.info(
+        "TTS job: %d parts, %d resumed, %d deduplicated, cache %d hits / %d misses, "
+        "%d timeouts, %d/%d hedges won, window %d (peak %d, %d back-offs)",
+        num_parts,
+        metrics["resumed"],
+        metrics["deduplicated"],
+        metrics["cache_hits"],
+        metrics["cache_misses"],
+        metrics["timeouts"],
+        metrics["hedges_won"],
+        metrics["hedges_issued"],
+        metrics["concurrency"]["window"],
+        metrics["concurrency"]["peak_window"],
+        metrics["concurrency"]["backoffs"],
+    )
+
+
+def _part_runner(
+    results: List[Optional[str]],
+    voice: str,
+    out_dir: str,
+    rate_pct: int,
+    pitch_hz: int,
+    metrics: dict,
+    limiter: AIMDLimiter,
+    share: Optional[ScheduledJob],
+    recorder: JobTelemetry,
+    unique: Dict[str, asyncio.Future],
+    cache: Optional[AudioCache] = None,
+    manifest: Optional[JobManifest] = None,
+    backend: Optional[TTSBackend] = None,
+    part_timeout: Optional[float] = DEFAULT_PART_TIMEOUT,
+    deadline: Optional[float] = None,
+    hedge_percentile: Optional[float] = None,
+    prefix: Optional[OrderedPrefixWriter] = None,
+    priority_base: int = 0,
+    on_part_done: Optional[Callable[[int, bool, int], None]] = None,
+) -> Callable[[int, str], Awaitable[None]]:
+    """
+    The request path of one job's parts: `run(i, text)` resumes part i from
+    the manifest, reuses a repeat's audio, or synthesizes it (retries,
+    deadline, hedging, cache), then stores its path in results[i] and hands
+    it to `prefix` and `on_part_done`. Shared by every engine.
+    """
+    loop = asyncio.get_running_loop()
+    latency = LatencyTracker()
+    done = 0
+
+    async def run(i: int, text: str):
+        try:
+            await _run(i, text)
+        finally:
+            if share is not None:
+                share.part_done(len(text))
+
+    async def _run(i: int, text: str):
+        nonlocal done
+        out_path = os.path.join(out_dir, f"part_{i + 1:04d}.mp3")
+        key = sha256_text(text)
+        if manifest is not None and manifest.is_done(i, text):
+            metrics["resumed"] += 1
+            if key not in unique:
+                unique[key] = loop.create_future()
+                unique[key].set_result(out_path)
+            results[i] = out_path
+            if prefix is not None:
+                prefix.add(i, out_path)
+            done += 1
+            if on_part_done:
+                on_part_done(i, True, done)
+            return
+        first = unique.get(key)
+        if first is not None:
+            # A repeat: reuse the first occurrence's audio (or its failure)
+            source = await asyncio.shield(first)
+            ok = False
+            if source is not None:
+                try:
+                    shutil.copyfile(source, out_path)
+                    ok = True
+                except OSError as e:
+                    logger.warning("Reusing %s for part %d failed: %s", source, i + 1, e)
+            metrics["deduplicated"] += 1
+        else:
+            unique[key] = first = loop.create_future()
+            ok = False
+            try:
+                ok = await synthesize_with_retry_async(
+                    text,
+                    voice,
+                    out_path,
+                    rate_pct,
+                    pitch_hz,
+                    cache=cache,
+                    metrics=metrics,
+                    backend=backend,
+                    limiter=limiter,
+                    part_timeout=part_timeout,
+                    deadline=deadline,
+                    latency=latency,
+                    hedge_percentile=hedge_percentile,
+                    priority=priority_base + i,
+                    recorder=recorder,
+                )
+            finally:
+                first.set_result(out_path if ok else None)
+        if ok and manifest is not None:
+            manifest.mark_done(i, text, out_path)
+        results[i] = out_path if ok else None
+        if prefix is not None:
+            prefix.add(i, results[i])
+        done += 1
+        if on_part_done:
+            on_part_done(i, ok, done)
+
+    return run
+
+
+async def _supervise(
+    tasks: List[asyncio.Future],
+    cancel: Optional[threading.Event],
+    deadline: Optional[float],
+    on_tick: Optional[Callable[[], None]],
+) -> None:
+    """Wait for all tasks; on cancel, deadline or any error, cancel the rest."""
+    loop = asyncio.get_running_loop()
+    pending = set(tasks)
+    try:
+        while pending:
+            timeout = _TICK_SECONDS if (cancel or on_tick) else None
+            if deadline is not None:
+                left = max(0.0, deadline - loop.time())
+                timeout = left if timeout is None else min(timeout, left)
+            done, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_EXCEPTION
+            )
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+            if cancel is not None and cancel.is_set():
+                raise SynthesisCancelled("Synthesis cancelled")
+            if pending and deadline is not None and loop.time() >= deadline:
+                raise SynthesisDeadlineExceeded(
+                    f"Job deadline passed with {len(pending)} part(s) unfinished"
+                )
+            if on_tick:
+                on_tick()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def _supervised(
+    awaitable: Awaitable,
+    cancel: Optional[threading.Event],
+    deadline: Optional[float],
+    on_tick: Optional[Callable[[], None]] = None,
+):
+    """Await one thing under _supervise's cancel and deadline checks."""
+    future = asyncio.ensure_future(awaitable)
+    await _supervise([future], cancel, deadline, on_tick)
+    return future.result()
+
+
+def synthesize_parts(*args, **kwargs) -> List[Optional[str]]:
+    """Blocking entry point: one event loop for the whole document."""
+    return asyncio.run(synthesize_parts_async(*args, **kwargs))
+
+
+async def synthesize_chapters_async(
+    chapters: Sequence[Sequence[str]],
+    voice: str,
+    out_dirs: Sequence[str],
+    rate_pct: int,
+    pitch_hz: int,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    on_part_done: Optional[Callable[[int, int, bool, int], None]] = None,
+    cache: Optional[AudioCache] = None,
+    metrics: Optional[dict] = None,
+    manifests: Optional[Sequence[JobManifest]] = None,
+    backend: Optional[TTSBackend] = None,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    part_timeout: Optional[float] = DEFAULT_PART_TIMEOUT,
+    job_timeout: Optional[float] = None,
+    cancel: Optional[threading.Event] = None,
+    on_tick: Optional[Callable[[], None]] = None,
+    hedge_percentile: Optional[float] = None,
+    prefixes: Optional[Sequence[Optional[OrderedPrefixWriter]]] = None,
+    share: Optional[ScheduledJob] = None,
+    recorder: Optional[JobTelemetry] = None,
+) -> List[List[Optional[str]]]:
+    """
+    Render each chapter as its own job, all at once, on one event loop.
+
+    Every chapter has its own output directory, manifest and prefix writer
+    (so it resumes and is delivered independently), while all of them share
+    one AIMD limiter: the service sees a single well-behaved client. Slots
+    go to the earliest part of the book first, so chapter 1 is complete as
+    early as possible and later chapters fill any capacity it leaves idle.
+    Repeated parts are synthesized once for the whole book, not per chapter.
+
+    `on_part_done(chapter, index, ok, done)` counts `done` across the whole
+    book. `metrics` receives the counters summed over chapters, each
+    chapter's own counters under "chapters", and the shared limiter's
+    snapshot under "concurrency". Cancellation, the deadline and `on_tick`
+    apply to the book as a whole; returns one result list per chapter.
+
+    The book is one job for the process-wide scheduler: `share`, or a
+    registration made here; its queueing statistics go to
+    `metrics["scheduler"]`. Likewise the book has one telemetry `recorder`,
+    reported under `metrics["telemetry"]`.
+    """
+    own_share = share is None
+    if own_share:
+        share = scheduler().register("book", sum(len(t) for p in chapters for t in p))
+    limiter = AIMDLimiter(
+        initial=concurrency,
+        max_limit=max(concurrency, max_concurrency),
+        upstream=share,
+    )
+    recorder = recorder or telemetry().job(share.name, voice)
+    deadline = asyncio.get_running_loop().time() + job_timeout if job_timeout else None
+    per_chapter = [dict() for _ in chapters]
+    unique: Dict[str, asyncio.Future] = {}
+    done = 0
+
+    def _callback(c: int):
+        def _done(index: int, ok: bool, _chapter_done: int):
+            nonlocal done
+            done += 1
+            if on_part_done:
+                on_part_done(c, index, ok, done)
+
+        return _done
+
+    tasks = []
+    offset = 0
+    for c, parts in enumerate(chapters):
+        coro = synthesize_parts_async(
+            parts,
+            voice,
+            out_dirs[c],
+            rate_pct,
+            pitch_hz,
+            on_part_done=_callback(c),
+            cache=cache,
+            metrics=per_chapter[c],
+            manifest=manifests[c] if manifests else None,
+            backend=backend,
+            limiter=limiter,
+            part_timeout=part_timeout,
+            job_timeout=job_timeout,
+            hedge_percentile=hedge_percentile,
+            prefix=prefixes[c] if prefixes else None,
+            priority_base=offset,
+            unique=unique,
+            recorder=recorder,
+        )
+        tasks.append(asyncio.ensure_future(coro))
+        offset += len(parts)
+    try:
+        await _supervise(tasks, cancel, deadline, on_tick)
+    finally:
+        if metrics is not None:
+            for key in _SUMMED_METRICS:
+                metrics[key] = sum(m.get(key, 0) for m in per_chapter)
+            metrics["chapters"] = [
+                {
+                    k: v
+                    for k, v in m.items()
+                    if k not in ("concurrency", "scheduler", "telemetry")
+                }
+                for m in per_chapter
+            ]
+            metrics["concurrency"] = limiter.snapshot()
+            metrics["scheduler"] = share.stats()
+            metrics["telemetry"] = recorder.report()
+        if own_share:
+            scheduler().unregister(share)
+        telemetry().save()
+    return [task.result() for task in tasks]
+
+
+def synthesize_chapters(*args, **kwargs) -> List[List[Optional[str]]]:
+    """Blocking entry point: every chapter of the book on one event loop."""
+    return asyncio.run(synthesize_chapters_async(*args, **kwargs))
@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+import http.server
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from .storage import atomic_write_bytes, data_dir
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds (an implicit +Inf bucket follows each list)
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+AUDIO_BYTES_BUCKETS = (8e3, 16e3, 32e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6)
+CHARS_PER_SECOND_BUCKETS = (25.0, 50.0, 100.0, 200.0, 400.0, 800.0, 1600.0, 3200.0)
+
+# Serve /metrics (Prometheus text) and /report.json on this port; off if unset
+METRICS_PORT = int(os.environ.get("BILBOT_METRICS_PORT", 0)) or None
+
+# Rewrite this process's report file at most this often while jobs run
+_SAVE_SECONDS = 10.0
+
+# Attempts and failures are also counted per part size, in bins this wide
+SIZE_BIN_CHARS = 200
+
+_COUNTERS = (
+    "parts",
+    "parts_failed",
+    "cached",
+    "retries",
+    "failures",
+    "timeouts",
+    "chars",
+    "audio_bytes",
+)
+
+
+class Histogram:
+    """Fixed-bucket histogram, mergeable across jobs and processes."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(float(b) for b in buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        idx = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                idx = i
+                break
+        self.counts[idx] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None if empty)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def merge(self, other: dict) -> None:
+        if tuple(other["buckets"]) != self.buckets:
+            raise ValueError("Cannot merge histograms with different buckets")
+        if len(other["counts"]) != len(self.counts):
+            raise ValueError("Histogram has the wrong number of counts")
+        self.counts = [a + b for a, b in zip(self.counts, other["counts"])]
+        self.sum += other["sum"]
+        self.count += other["count"]
+
+    def to_dict(self) -> dict:
+        return {
+            "buckets": list(self.buckets),
+            "counts": list(self.counts),
+            "sum": round(self.sum, 3),
+            "count": self.count,
+            "mean": round(self.sum / self.count, 3) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+
+class SynthesisStats:
+    """
+    Counters and histograms for one voice or one job.
+
+    `parts` are synthesized parts (cache hits are counted under `cached`
+    instead), `failures` are failed attempts and `retries` the attempts
+    beyond the first that a part needed; `parts_failed` gave up for good.
+    Latency is the service time of the successful attempt.
+
+    For the chunk-size model (see sizing.py) it also keeps the sums of a
+    least-squares fit of latency against characters (`fit`) and attempts
+    and failures per SIZE_BIN_CHARS-wide size bin (`size_bins`).
+    """
+
+    def __init__(self):
+        self.counters = dict.fromkeys(_COUNTERS, 0)
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.audio_bytes = Histogram(AUDIO_BYTES_BUCKETS)
+        self.chars_per_second = Histogram(CHARS_PER_SECOND_BUCKETS)
+        self.fit = dict.fromkeys(("n", "sx", "sy", "sxx", "sxy"), 0.0)
+        self.size_bins: Dict[str, List[int]] = {}  # bin start -> [attempts, failures]
+
+    def _attempts(self, chars: int, attempts: int, failures: int) -> None:
+        key = str(chars // SIZE_BIN_CHARS * SIZE_BIN_CHARS)
+        counts = self.size_bins.setdefault(key, [0, 0])
+        counts[0] += attempts
+        counts[1] += failures
+
+    def record_part(self, chars: int, seconds: float, audio_bytes: int, retries: int):
+        self.counters["parts"] += 1
+        self.counters["retries"] += retries
+        self.counters["chars"] += chars
+        self.counters["audio_bytes"] += audio_bytes
+        self.latency.observe(seconds)
+        self.audio_bytes.observe(audio_bytes)
+        self.chars_per_second.observe(chars / max(seconds, 1e-6))
+        self.fit["n"] += 1
+        self.fit["sx"] += chars
+        self.fit["sy"] += seconds
+        self.fit["sxx"] += chars * chars
+        self.fit["sxy"] += chars * seconds
+        self._attempts(chars, 1 + retries, retries)
+
+    def record_part_failed(self, chars: int, retries: int):
+        self.counters["parts_failed"] += 1
+        self.counters["retries"] += retries
+        self._attempts(chars, 1 + retries, 1 + retries)
+
+    def merge(self, other: dict) -> None:
+        for key in _COUNTERS:
+            self.counters[key] += other["counters"].get(key, 0)
+        self.latency.merge(other["latency_seconds"])
+        self.audio_bytes.merge(other["audio_bytes"])
+        self.chars_per_second.merge(other["chars_per_second"])
+        for key, value in other.get("fit", {}).items():
+            self.fit[key] = self.fit.get(key, 0.0) + value
+        for key, (attempts, failures) in other.get("size_bins", {}).items():
+            counts = self.size_bins.setdefault(key, [0, 0])
+            counts[0] += attempts
+            counts[1] += failures
+
+    def to_dict(self) -> dict:
+        return {
+            "counters": dict(self.counters),
+            "latency_seconds": self.latency.to_dict(),
+            "audio_bytes": self.audio_bytes.to_dict(),
+            "chars_per_second": self.chars_per_second.to_dict(),
+            "fit": {key: round(value, 6) for key, value in self.fit.items()},
+            "size_bins": {key: list(counts) for key, counts in self.size_bins.items()},
+        }
+
+
+class JobTelemetry:
+    """
+    Recorder handed to the synthesis engine for one job. Everything it
+    records goes to the job's own stats and to the process-wide stats of
+    the job's voice.
+    """
+
+    def __init__(self, parent: "Telemetry", name: str, voice: str):
+        self.parent = parent
+        self.name = name
+        self.voice = voice
+        self.stats = SynthesisStats()
+        self.started = time.time()
+
+    def _targets(self) -> List[SynthesisStats]:
+        return [self.stats, self.parent._voice_stats(self.voice)]
+
+    def record_part(self, chars: int, seconds: float, audio_bytes: int, retries: int = 0):
+        with self.parent._lock:
+            for stats in self._targets():
+                stats.record_part(chars, seconds, audio_bytes, retries)
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self.parent._lock:
+            for stats in self._targets():
+                stats.counters[key] += n
+
+    def record_cached(self) -> None:
+        self._count("cached")
+
+    def record_failure(self, timeout: bool = False) -> None:
+        """One failed attempt (the part may still succeed on a retry)."""
+        self._count("failures")
+        if timeout:
+            self._count("timeouts")
+
+    def record_part_failed(self, chars: int, retries: int) -> None:
+        with self.parent._lock:
+            for stats in self._targets():
+                stats.record_part_failed(chars, retries)
+
+    def report(self) -> dict:
+        with self.parent._lock:
+            report = self.stats.to_dict()
+        report.update(
+            {
+                "job": self.name,
+                "voice": self.voice,
+                "started": self.started,
+                "elapsed": round(time.time() - self.started, 3),
+            }
+        )
+        return report
+
+
+class Telemetry:
+    """
+    Process-wide synthesis telemetry, aggregated per voice.
+
+    Each process periodically writes its report to the telemetry data
+    directory, in a file named after its pid and start time (a pid reused
+    by a later process must not overwrite the earlier one's totals);
+    load_reports() merges those files, so a report or the Prometheus
+    endpoint covers every worker.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.jobs = 0
+        self._voices: Dict[str, SynthesisStats] = {}
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+
+    def _voice_stats(self, voice: str) -> SynthesisStats:
+        # Called with the lock held
+        if voice not in self._voices:
+            self._voices[voice] = SynthesisStats()
+        return self._voices[voice]
+
+    def job(self, name: str, voice: str) -> JobTelemetry:
+        with self._lock:
+            self.jobs += 1
+        return JobTelemetry(self, name, voice)
+
+    def report(self) -> dict:
+        with self._lock:
+            voices = {voice: stats.to_dict() for voice, stats in self._voices.items()}
+            jobs = self.jobs
+        return {
+            "pid": os.getpid(),
+            "started": self.started,
+            "updated": time.time(),
+            "jobs": jobs,
+            "voices": voices,
+        }
+
+    def save(self, force: bool = True) -> None:
+        """Write this process's report (unless one was written just now)."""
+        now = time.monotonic()
+        if not force and now - self._last_save < _SAVE_SECONDS:
+            return
+        self._last_save = now
+        name = f"synthesis-{os.getpid()}-{int(self.started * 1000)}.json"
+        path = data_dir("telemetry") / name
+        try:
+            atomic_write_bytes(path, json.dumps(self.report()).encode("utf-8"))
+        except OSError as e:
+            logger.warning("Writing telemetry report failed: %s", e)
+
+
+_telemetry: Optional[Telemetry] = None
+_telemetry_lock = threading.Lock()
+
+
+def telemetry() -> Telemetry:
+    """The process-wide telemetry, created on first use."""
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            _telemetry = Telemetry()
+        return _telemetry
+
+
+# ============================================================================
+# REPORTS AND EXPORT
+# ============================================================================
+
+
+def load_reports(max_age_s: float = 7 * 24 * 3600, root=None) -> dict:
+    """
+    Merge the saved reports of every process into one: totals and per-voice
+    stats. Reports untouched for `max_age_s` are deleted instead. A report
+    that can't be read or merged in full is skipped as a whole.
+    """
+    cutoff = time.time() - max_age_s
+    merged: Dict[str, SynthesisStats] = {}
+    total = SynthesisStats()
+    processes = 0
+    jobs = 0
+    for entry in sorted(Path(root or data_dir("telemetry")).glob("synthesis-*.json")):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                entry.unlink()
+                continue
+            with open(entry, "r", encoding="utf-8") as f:
+                report = json.load(f)
+            voices = report["voices"]
+            report_jobs = int(report.get("jobs", 0))
+            # Dry run into scratch stats first: a merge that fails halfway
+            # would otherwise leave part of the report in the totals
+            for stats in voices.values():
+                SynthesisStats().merge(stats)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            logger.warning("Skipping unreadable telemetry report %s", entry.name)
+            continue
+        for voice, stats in voices.items():
+            merged.setdefault(voice, SynthesisStats()).merge(stats)
+            total.merge(stats)
+        processes += 1
+        jobs += report_jobs
+    return {
+        "generated": time.time(),
+        "processes": processes,
+        "jobs": jobs,
+        "total": total.to_dict(),
+        "voices": {voice: stats.to_dict() for voice, stats in sorted(merged.items())},
+    }
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(report: dict) -> str:
+    """Render a load_reports() report in the Prometheus text format."""
+    lines = []
+    counters = [
+        ("parts", "Parts synthesized (cache hits excluded)"),
+        ("parts_failed", "Parts that failed after all retries"),
+        ("cached", "Parts served from the synthesis cache"),
+        ("retries", "Attempts beyond the first"),
+        ("failures", "Failed attempts"),
+        ("timeouts", "Attempts cut off by the part timeout"),
+        ("chars", "Characters synthesized"),
+        ("audio_bytes", "Bytes of MP3 audio produced"),
+    ]
+    voices = report["voices"]
+    for key, help_text in counters:
+        name = f"bilbot_tts_{key}_total"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for voice, stats in voices.items():
+            lines.append(f'{name}{{voice="{_label(voice)}"}} {stats["counters"][key]}')
+    histograms = [
+        ("latency_seconds", "bilbot_tts_latency_seconds", "Service time per part"),
+        ("audio_bytes", "bilbot_tts_audio_bytes", "MP3 bytes per part"),
+        ("chars_per_second", "bilbot_tts_chars_per_second", "Characters per second of service time"),
+    ]
+    for key, name, help_text in histograms:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for voice, stats in voices.items():
+            hist = stats[key]
+            label = _label(voice)
+            cumulative = 0
+            for bound, count in zip(hist["buckets"] + ["+Inf"], hist["counts"]):
+                cumulative += count
+                lines.append(f'{name}_bucket{{voice="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{voice="{label}"}} {hist["sum"]}')
+            lines.append(f'{name}_count{{voice="{label}"}} {hist["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body = prometheus_text(load_reports()).encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        elif self.path.split("?")[0] == "/report.json":
+            body = json.dumps(load_reports(), indent=2).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics: " + format, *args)
+
+
+def serve_metrics(port: int, host: str = "") -> Optional[http.server.HTTPServer]:
+    """
+    Serve /metrics and /report.json from a daemon thread; returns the server,
+    or None if the port is taken (another process already serves them).
+    """
+    try:
+        server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.warning("Metrics endpoint on port %d not started: %s", port, e)
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("Serving synthesis metrics on port %d", port)
+    return server
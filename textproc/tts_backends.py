@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import hashlib
+import random
+from typing import Optional, Protocol
+
+
+def signed(val: int) -> str:
+    return f"+{val}" if val >= 0 else str(val)
+
+
+class TTSBackend(Protocol):
+    """
+    What the synthesis engine needs from a text-to-speech service.
+
+    `version` is folded into cache keys and job ids, so it must change
+    whenever the same inputs could render different audio.
+    """
+
+    name: str
+    version: str
+
+    async def synthesize(
+        self, text: str, voice: str, rate_pct: int, pitch_hz: int
+    ) -> bytes:
+        """Return the complete MP3 for one part; raise on failure."""
+        ...
+
+
+class EdgeTTSBackend:
+    """Microsoft Edge online TTS via the edge-tts package (the default)."""
+
+    name = "edge-tts"
+
+    def __init__(self):
+        import edge_tts
+
+        self._edge_tts = edge_tts
+        self.version = f"edge-tts/{getattr(edge_tts, '__version__', 'unknown')}"
+
+    async def synthesize(
+        self, text: str, voice: str, rate_pct: int, pitch_hz: int
+    ) -> bytes:
+        communicate = self._edge_tts.Communicate(
+            text=text,
+            voice=voice,
+            rate=f"{signed(rate_pct)}%",
+            pitch=f"{signed(pitch_hz)}Hz",
+        )
+        audio = bytearray()
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                audio.extend(chunk["data"])
+        return bytes(audio)
+
+
+class FakeTTSError(RuntimeError):
+    """Injected failure from FakeTTSBackend."""
+
+
+# MPEG-2 Layer III, 24 kHz, 48 kbit/s, mono, no CRC: the same stream format
+# edge-tts returns. Each frame is 144 bytes and 576 samples (24 ms); an
+# all-zero side info/main data section decodes as silence.
+_SILENT_FRAME = b"\xff\xf3\x64\xc4" + bytes(140)
+_FRAME_SECONDS = 576 / 24000
+
+
+class FakeTTSBackend:
+    """
+    Offline stand-in for load tests and benchmarks.
+
+    Returns valid silent MP3 whose duration tracks the text length, after a
+    simulated network delay of `latency` ± `jitter` seconds, and fails with
+    probability `failure_rate`. Randomness is derived from `seed`, the request
+    and how many times that request has been made, so a run is reproducible
+    no matter how concurrent calls interleave.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        chars_per_second: float = 15.0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.chars_per_second = chars_per_second
+        self.seed = seed
+        self.version = f"fake/1/{chars_per_second:g}"
+        self.calls = 0
+        self._attempts = {}
+
+    def _rng(self, text: str, voice: str, rate_pct: int, pitch_hz: int) -> random.Random:
+        key = f"{self.seed}|{voice}|{rate_pct}|{pitch_hz}|{text}"
+        attempt = self._attempts.get(key, 0)
+        self._attempts[key] = attempt + 1
+        digest = hashlib.sha256(f"{key}|{attempt}".encode("utf-8")).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    async def synthesize(
+        self, text: str, voice: str, rate_pct: int, pitch_hz: int
+    ) -> bytes:
+        self.calls += 1
+        rng = self._rng(text, voice, rate_pct, pitch_hz)
+        delay = max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+        fail = rng.random() < self.failure_rate
+        await asyncio.sleep(delay)
+        if fail:
+            raise FakeTTSError("injected TTS failure")
+        seconds = len(text) / self.chars_per_second / (1 + rate_pct / 100.0)
+        return _SILENT_FRAME * max(1, int(seconds / _FRAME_SECONDS))
+
+
+def make_backend(spec: Optional[str] = None) -> TTSBackend:
+    """
+    Build a backend from a spec string such as "edge" or
+    "fake:latency=0.8,jitter=0.3,failure_rate=0.05".
+    """
+    name, _, args = (spec or "edge").partition(":")
+    name = name.strip().lower()
+    if name in ("edge", "edge-tts"):
+        return EdgeTTSBackend()
+    if name == "fake":
+        kwargs = {}
+        for item in filter(None, (a.strip() for a in args.split(","))):
+            key, _, value = item.partition("=")
+            key = key.strip()
+            kwargs[key] = int(value) if key == "seed" else float(value)
+        return FakeTTSBackend(**kwargs)
+    raise ValueError(f"Unknown TTS backend: {spec!r}")
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from .storage import atomic_write_bytes, data_dir
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VOICE = "en-US-AndrewNeural"
+
+# Used until the first catalogue download has landed
+FALLBACK_VOICES = [
+    "en-US-AndrewNeural",
+    "en-US-JennyNeural",
+    "en-US-GuyNeural",
+    "en-US-AriaNeural",
+    "en-US-DavisNeural",
+    "en-US-EmmaNeural",
+    "en-US-JacobNeural",
+    "en-US-JasonNeural",
+    "en-US-MichelleNeural",
+    "en-US-NancyNeural",
+    "en-US-TonyNeural",
+]
+
+# A cached catalogue older than this is still served, but refreshed behind it
+VOICE_CACHE_TTL = float(os.environ.get("BILBOT_VOICE_CACHE_TTL", 7 * 24 * 3600))
+# While the service is unreachable, try again at most this often
+_REFRESH_RETRY_S = 300.0
+
+_refresh_lock = threading.Lock()
+_refresh_thread: Optional[threading.Thread] = None
+_refresh_started = 0.0
+
+
+def _cache_path():
+    return data_dir("voices") / "catalogue.json"
+
+
+def _default_first(names: List[str]) -> List[str]:
+    names = sorted(set(names))
+    if DEFAULT_VOICE in names:
+        names.remove(DEFAULT_VOICE)
+        names.insert(0, DEFAULT_VOICE)
+    return names
+
+
+def fetch_english_neural_voices() -> List[str]:
+    """Download the English neural voice names from the edge-tts service."""
+    from edge_tts import VoicesManager
+
+    voices_mgr = asyncio.run(VoicesManager.create())
+    en_voices = voices_mgr.find(Language="en")
+    return _default_first([v["ShortName"] for v in en_voices if "Neural" in v["ShortName"]])
+
+
+def refresh_voices() -> bool:
+    """Fetch the catalogue and store it for every process; False on failure."""
+    try:
+        names = fetch_english_neural_voices()
+    except Exception as e:
+        logger.warning("Voice catalogue refresh failed: %s", e)
+        return False
+    if not names:
+        return False
+    payload = {"fetched": time.time(), "voices": names}
+    atomic_write_bytes(_cache_path(), json.dumps(payload).encode("utf-8"))
+    logger.info("Voice catalogue refreshed: %d voices", len(names))
+    return True
+
+
+def refresh_in_background() -> threading.Thread:
+    """Start one refresh thread per process (a running one is reused)."""
+    global _refresh_thread, _refresh_started
+    with _refresh_lock:
+        if _refresh_thread is None or (
+            not _refresh_thread.is_alive()
+            and time.monotonic() - _refresh_started > _REFRESH_RETRY_S
+        ):
+            _refresh_started = time.monotonic()
+            _refresh_thread = threading.Thread(
+                target=refresh_voices, name="voice-catalogue-refresh", daemon=True
+            )
+            _refresh_thread.start()
+        return _refresh_thread
+
+
+def load_voices() -> Tuple[List[str], str]:
+    """
+    Voice names for the picker without touching the network.
+
+    Returns (names, source). Source is "cache" for a fresh catalogue, and
+    "stale cache" or "fallback" when the local copy is old or missing; in
+    those cases a background refresh is started and later calls pick it up.
+    """
+    try:
+        with open(_cache_path(), "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        names = _default_first(payload["voices"])
+        fetched = float(payload["fetched"])
+    except (OSError, ValueError, KeyError, TypeError):
+        refresh_in_background()
+        return list(FALLBACK_VOICES), "fallback"
+    if not names:
+        refresh_in_background()
+        return list(FALLBACK_VOICES), "fallback"
+    if time.time() - fetched > VOICE_CACHE_TTL:
+        refresh_in_background()
+        return names, "stale cache"
+    return names, "cache"
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Background workers that run extraction, cleaning and synthesis jobs.
+
+    python -m textproc.worker --workers 4
+
+Each worker process takes jobs from the shared JobQueue, so jobs survive
+Streamlit reruns and dropped connections, and CPU-heavy preparation spreads
+over as many cores as there are workers. A worker runs one preparation at a
+time but several renders at once: they mostly wait on the network, and the
+process-wide scheduler shares the TTS service fairly between them.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent callers may start extra workers
+    fcntl = None
+
+from .jobs import JobCancelled, JobQueue
+from .mp3 import prune_outputs
+from .pipeline import prepare_document, render_book
+from .storage import data_dir, spool_to_file
+from .telemetry import METRICS_PORT, serve_metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.environ.get("BILBOT_WORKERS", 2))
+# Idle workers exit after this many seconds (0: never); the app starts new
+# ones on demand, so nothing lingers after the server is gone.
+WORKER_IDLE_EXIT = float(os.environ.get("BILBOT_WORKER_IDLE_EXIT", 600))
+# Jobs one worker process runs at the same time (at most one preparation)
+WORKER_JOBS = int(os.environ.get("BILBOT_WORKER_JOBS", 4))
+
+_POLL_SECONDS = 0.5
+_HEARTBEAT_SECONDS = 5.0
+_PROGRESS_SECONDS = 0.5
+_PRUNE_SECONDS = 3600.0
+# Next to the queue database; held while checking for and starting workers
+_SPAWN_LOCK_FILE = "spawn.lock"
+
+
+def run_prepare(spec: dict, report) -> dict:
+    result = prepare_document(
+        spec["path"],
+        spec["file_name"],
+        spec["remove_headers"],
+        spec["remove_footnotes"],
+        voice=spec.get("voice"),
+        lineage=spec.get("lineage"),
+    )
+    result.pop("raw_text", None)  # only its length (in meta) is shown
+    return result
+
+
+def run_render(spec: dict, report) -> dict:
+    last = [0.0]
+
+    def _on_progress(progress: dict):
+        # The engine calls back several times a second; the UI polls slower
+        now = time.monotonic()
+        if now - last[0] >= _PROGRESS_SECONDS:
+            last[0] = now
+            report(progress)
+
+    return render_book(
+        spec["chapters"],
+        spec["voice"],
+        spec["rate_pct"],
+        spec["pitch_hz"],
+        spec["out_base"],
+        doc_key=spec.get("doc_key"),
+        make_m4b=spec.get("make_m4b", False),
+        on_progress=_on_progress,
+    )
+
+
+HANDLERS = {"prepare": run_prepare, "render": run_render}
+
+
+def run_job(queue: JobQueue, job: dict) -> None:
+    """Run one claimed job to a final status, heartbeating while it runs."""
+    job_id = job["id"]
+    stop = threading.Event()
+
+    def _heartbeat():
+        while not stop.wait(_HEARTBEAT_SECONDS):
+            try:
+                queue.report(job_id)
+            except JobCancelled:
+                pass  # seen by the job at its next progress report
+            except Exception:
+                logger.exception("Heartbeat for job %s failed", job_id)
+
+    beat = threading.Thread(target=_heartbeat, daemon=True)
+    beat.start()
+    try:
+        result = HANDLERS[job["kind"]](job["spec"], lambda p: queue.report(job_id, p))
+    except JobCancelled:
+        queue.finish(job_id, "cancelled")
+    except Exception as e:
+        logger.exception("Job %s (%s) failed", job_id, job["kind"])
+        queue.finish(job_id, "failed", error=str(e) or type(e).__name__)
+    else:
+        queue.finish(job_id, "done", result=result)
+    finally:
+        stop.set()
+        beat.join()
+
+
+def run_worker(
+    idle_exit: float = WORKER_IDLE_EXIT,
+    queue: Optional[JobQueue] = None,
+    max_jobs: int = WORKER_JOBS,
+):
+    """Claim and run jobs until idle for `idle_exit` seconds (0: forever)."""
+    queue = queue or JobQueue()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    idle_since = time.monotonic()
+    last_prune = 0.0
+    running: List[Tuple[threading.Thread, str]] = []
+    logger.info("Worker %s started", worker_id)
+    try:
+        while True:
+            queue.worker_heartbeat(worker_id)
+            if time.monotonic() - last_prune > _PRUNE_SECONDS:
+                last_prune = time.monotonic()
+                queue.prune()
+                prune_uploads()
+                prune_outputs()
+            running = [(t, kind) for t, kind in running if t.is_alive()]
+            if running:
+                idle_since = time.monotonic()
+            job = None
+            if len(running) < max(1, max_jobs):
+                # Preparation is CPU-bound: never two in one process
+                busy = any(kind != "render" for _, kind in running)
+                job = queue.claim(worker_id, kinds=("render",) if busy else None)
+            if job is None:
+                idle = time.monotonic() - idle_since
+                if not running and idle_exit and idle > idle_exit:
+                    break
+                time.sleep(_POLL_SECONDS)
+                continue
+            logger.info("Worker %s running %s job %s", worker_id, job["kind"], job["id"])
+            thread = threading.Thread(target=run_job, args=(queue, job), name=job["id"])
+            thread.start()
+            running.append((thread, job["kind"]))
+    finally:
+        for thread, _ in running:
+            thread.join()
+        queue.worker_exit(worker_id)
+        logger.info("Worker %s stopped", worker_id)
+
+
+# ============================================================================
+# UPLOADS AND PROCESS MANAGEMENT
+# ============================================================================
+
+
+def save_upload(fileobj, suffix: str) -> Tuple[str, str]:
+    """
+    Store an uploaded file where workers can read it, content-addressed.
+    The file object is copied and hashed a chunk at a time; returns the
+    stored path and the SHA-256 digest.
+    """
+    uploads = data_dir("uploads")
+    fd, spool = tempfile.mkstemp(dir=uploads, prefix=".spool-")
+    os.close(fd)
+    try:
+        digest = spool_to_file(fileobj, spool)
+        path = uploads / f"{digest}{suffix}"
+        if path.exists():
+            os.unlink(spool)
+        else:
+            os.replace(spool, path)
+    except BaseException:
+        try:
+            os.unlink(spool)
+        except OSError:
+            pass
+        raise
+    return str(path), digest
+
+
+def prune_uploads(max_age_s: float = 24 * 3600) -> int:
+    cutoff = time.time() - max_age_s
+    removed = 0
+    for entry in data_dir("uploads").iterdir():
+        try:
+            if entry.stat().st_mtime < cutoff:
+                entry.unlink()
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def ensure_workers(count: int = DEFAULT_WORKERS, queue: Optional[JobQueue] = None) -> int:
+    """
+    Start detached worker processes until `count` are alive; returns how
+    many were started. Workers outlive the calling process.
+    """
+    queue = queue or JobQueue()
+    # One caller at a time checks and spawns, holding the lock until the new
+    # workers have checked in, so a caller waiting on it counts them too
+    with open(queue.path.parent / _SPAWN_LOCK_FILE, "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        missing = count - queue.live_workers()
+        if missing <= 0:
+            return 0
+        subprocess.Popen(
+            [sys.executable, "-m", "textproc.worker", "--workers", str(missing)],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stdin=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        deadline = time.monotonic() + 10
+        while queue.live_workers() < count and time.monotonic() < deadline:
+            time.sleep(0.1)
+    return missing
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--idle-exit", type=float, default=WORKER_IDLE_EXIT)
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=METRICS_PORT,
+        help="Serve /metrics (Prometheus) and /report.json for all workers",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s"
+    )
+    if args.metrics_port:
+        # Reports are merged from every worker's file, so one server suffices
+        serve_metrics(args.metrics_port)
+    if args.workers <= 1:
+        run_worker(args.idle_exit)
+        return
+    procs = [
+        multiprocessing.Process(target=run_worker, args=(args.idle_exit,))
+        for _ in range(args.workers)
+    ]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+
+
+if __name__ == "__main__":
+    main()